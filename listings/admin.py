@@ -1,19 +1,58 @@
-from django.contrib import admin
-from .models import Listing, UserProfile, Favorite, ListingImage
+from django.contrib import admin, messages
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from .cache import bump_listing_generation
+from .facets import LIVE_LOOKUPS, facet_counts, subtract_facet_counts
+from .models import Amenity, Listing, ListingAmenity, UserProfile, Favorite, ListingImage, MediaJob, SavedSearch
+from .pagination import EstimatedCountPaginator
+from .search import get_search_backend
+
+
+def hide_listings(queryset, **changes):
+    """Apply `changes` that take listings off the public feeds, in a single UPDATE
+
+    queryset.update() skips the Listing signals, so the facet summary and the
+    search cache generation are brought up to date here.
+    """
+    with transaction.atomic():
+        hidden = facet_counts(queryset.filter(**LIVE_LOOKUPS))
+        updated = queryset.update(updated_at=timezone.now(), **changes)
+        subtract_facet_counts(hidden)
+        transaction.on_commit(bump_listing_generation)
+    return updated
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables too big to COUNT(*) on every page view"""
+    paginator = EstimatedCountPaginator
+    # Skips the unfiltered COUNT(*) shown next to filtered results
+    show_full_result_count = False
 
 @admin.register(UserProfile)
-class UserProfileAdmin(admin.ModelAdmin):
+class UserProfileAdmin(LargeTableAdmin):
     list_display = ['user', 'phone_number', 'is_landlord', 'created_at']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
     list_filter = ['is_landlord', 'created_at']
     search_fields = ['user__username', 'user__email', 'phone_number']
 
+class ListingAmenityInline(admin.TabularInline):
+    model = ListingAmenity
+    extra = 0
+
 @admin.register(Listing)
-class ListingAdmin(admin.ModelAdmin):
+class ListingAdmin(LargeTableAdmin):
     list_display = ['title', 'posted_by', 'location', 'price', 'property_type', 'availability', 'is_active', 'created_at']
     list_filter = ['property_type', 'furnished', 'availability', 'is_active', 'created_at']
-    search_fields = ['title', 'description', 'location', 'address', 'posted_by__username']
-    list_editable = ['availability', 'is_active']
+    list_select_related = ['posted_by']
+    # Title, description and location are searched through the search
+    # backend and usernames by id, see get_search_results
+    search_fields = ['address']
     readonly_fields = ['created_at', 'updated_at']
+    raw_id_fields = ['posted_by']
+    inlines = [ListingAmenityInline]
+    actions = ['mark_rented', 'deactivate']
     
     fieldsets = (
         ('Basic Information', {
@@ -23,7 +62,7 @@ class ListingAdmin(admin.ModelAdmin):
             'fields': ('property_type', 'furnished', 'bedrooms', 'bathrooms', 'square_feet')
         }),
         ('Location & Pricing', {
-            'fields': ('location', 'address', 'price', 'availability')
+            'fields': ('location', 'address', 'latitude', 'longitude', 'price', 'availability')
         }),
         ('Contact Information', {
             'fields': ('contact_phone', 'contact_email')
@@ -37,14 +76,63 @@ class ListingAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        # Every branch is a condition on the listings table, so Postgres can
+        # OR together index scans over all rows (migration 0017; the address
+        # one needs pg_trgm) instead of walking the changelist order and
+        # filtering. Owners are looked up first: a join to auth_user inside
+        # the OR would defeat that.
+        owners = list(User.objects.filter(username__icontains=search_term).values_list('pk', flat=True))
+        by_address, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        # The changelist applies its own ordering afterwards
+        matches = get_search_backend().search(queryset, search_term).order_by()
+        return matches | by_address | queryset.filter(posted_by__in=owners), may_have_duplicates
+
+    @admin.action(description='Mark selected listings as rented')
+    def mark_rented(self, request, queryset):
+        updated = hide_listings(queryset, availability='rented')
+        self.message_user(request, f'{updated} listing(s) marked as rented.', messages.SUCCESS)
+
+    @admin.action(description='Deactivate selected listings')
+    def deactivate(self, request, queryset):
+        updated = hide_listings(queryset, is_active=False)
+        self.message_user(request, f'{updated} listing(s) deactivated.', messages.SUCCESS)
+
+@admin.register(Amenity)
+class AmenityAdmin(admin.ModelAdmin):
+    list_display = ['name', 'slug']
+    search_fields = ['name', 'slug']
+    prepopulated_fields = {'slug': ('name',)}
+
 @admin.register(ListingImage)
-class ListingImageAdmin(admin.ModelAdmin):
+class ListingImageAdmin(LargeTableAdmin):
     list_display = ['listing', 'caption', 'uploaded_at']
+    list_select_related = ['listing']
+    raw_id_fields = ['listing']
     list_filter = ['uploaded_at']
     search_fields = ['listing__title', 'caption']
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdmin):
     list_display = ['user', 'listing', 'created_at']
+    list_select_related = ['user', 'listing']
+    raw_id_fields = ['user', 'listing']
     list_filter = ['created_at']
     search_fields = ['user__username', 'listing__title']
+
+@admin.register(SavedSearch)
+class SavedSearchAdmin(LargeTableAdmin):
+    list_display = ['name', 'user', 'created_at', 'last_notified_at']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+    list_filter = ['created_at']
+    search_fields = ['user__username', 'user__email', 'name']
+
+@admin.register(MediaJob)
+class MediaJobAdmin(admin.ModelAdmin):
+    list_display = ['model_label', 'object_id', 'field_name', 'status', 'attempts', 'run_after', 'updated_at']
+    list_filter = ['status', 'model_label']
+    search_fields = ['original_name', 'last_error']
+    readonly_fields = ['created_at', 'updated_at']
@@ -0,0 +1,33 @@
+import re
+
+# Amenity vocabulary: (slug, display name, words that mean it in free text)
+AMENITIES = [
+    ('parking', 'Parking', ['parking', 'garage', 'car park', 'carport']),
+    ('wifi', 'Wi-Fi', ['wifi', 'wi-fi', 'internet', 'fibre', 'fiber']),
+    ('security', 'Security', ['security', 'guard', 'guards', 'cctv', 'gated']),
+    ('water', 'Water', ['water', 'borehole']),
+    ('electricity', 'Electricity', ['electricity', 'power', 'tokens']),
+    ('backup-power', 'Backup Power', ['generator', 'backup power', 'solar']),
+    ('gym', 'Gym', ['gym', 'fitness']),
+    ('swimming-pool', 'Swimming Pool', ['pool', 'swimming']),
+    ('balcony', 'Balcony', ['balcony', 'balconies']),
+    ('garden', 'Garden', ['garden', 'compound', 'yard']),
+    ('lift', 'Lift', ['lift', 'elevator']),
+    ('pet-friendly', 'Pet Friendly', ['pet', 'pets', 'pet-friendly']),
+    ('laundry', 'Laundry', ['laundry', 'washing machine']),
+    ('cable-tv', 'Cable TV', ['dstv', 'cable', 'tv']),
+]
+
+AMENITY_CHOICES = [(slug, name) for slug, name, _ in AMENITIES]
+
+_PATTERNS = [
+    (slug, re.compile(r'\b(?:%s)\b' % '|'.join(re.escape(word) for word in words), re.IGNORECASE))
+    for slug, _, words in AMENITIES
+]
+
+
+def parse_amenities(text):
+    """Slugs of the known amenities mentioned in free text, in vocabulary order"""
+    if not text:
+        return []
+    return [slug for slug, pattern in _PATTERNS if pattern.search(text)]
@@ -0,0 +1,154 @@
+import hashlib
+
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_GET
+
+from .forms import SearchForm
+from .images import get_derivative_storage
+from .models import Listing
+from .pagination import CursorPaginator
+from .routers import read_from_replica
+
+API_PAGE_SIZE = 20
+
+# Public field name -> ORM lookup passed to .values()
+API_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'description': 'description',
+    'property_type': 'property_type',
+    'furnished': 'furnished',
+    'location': 'location',
+    'address': 'address',
+    'latitude': 'latitude',
+    'longitude': 'longitude',
+    'price': 'price',
+    'bedrooms': 'bedrooms',
+    'bathrooms': 'bathrooms',
+    'amenities': 'amenities',
+    'availability': 'availability',
+    'favorite_count': 'favorite_count',
+    'owner': 'posted_by__username',
+    'thumbnail': 'main_image_derivatives',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+
+LIST_FIELDS = (
+    'id', 'title', 'property_type', 'furnished', 'location', 'price',
+    'bedrooms', 'bathrooms', 'availability', 'favorite_count', 'thumbnail', 'created_at',
+)
+DETAIL_FIELDS = tuple(API_FIELDS)
+
+
+def thumbnail_url(manifest):
+    """Largest JPEG card derivative, or None while the image is processing"""
+    entries = (manifest or {}).get('card', {}).get('jpeg', [])
+    return get_derivative_storage().url(entries[-1][1]) if entries else None
+
+
+# Fields whose stored value is converted before it is returned
+FIELD_CONVERTERS = {
+    'thumbnail': thumbnail_url,
+}
+
+
+class FieldSelectionError(ValueError):
+    pass
+
+
+def selected_fields(request, default):
+    """Fields named in ?fields=a,b (in API_FIELDS order), or `default`"""
+    requested = request.GET.get('fields')
+    if not requested:
+        return default
+    names = {name.strip() for name in requested.split(',') if name.strip()}
+    unknown = names - set(API_FIELDS)
+    if unknown:
+        raise FieldSelectionError(f'Unknown field(s): {", ".join(sorted(unknown))}')
+    return tuple(name for name in API_FIELDS if name in names)
+
+
+def project(queryset, fields):
+    """.values() projection of `fields`, plus the keys needed for cursors"""
+    lookups = {API_FIELDS[name] for name in fields} | {'id', 'created_at'}
+    return queryset.values(*sorted(lookups))
+
+
+def serialize(row, fields):
+    data = {}
+    for name in fields:
+        value = row[API_FIELDS[name]]
+        converter = FIELD_CONVERTERS.get(name)
+        data[name] = converter(value) if converter else value
+    return data
+
+
+def make_etag(*parts):
+    """Strong ETag over the representation's contents"""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def conditional_json(request, etag, build):
+    """304 if the client's If-None-Match matches `etag`; otherwise JSON from build()"""
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(build())
+        response['ETag'] = etag
+    return response
+
+
+def error_response(errors):
+    return JsonResponse({'errors': errors}, status=400)
+
+
+@require_GET
+@read_from_replica
+def listing_list(request):
+    """Live listings filtered with SearchForm semantics, one cursor page at a time"""
+    try:
+        fields = selected_fields(request, LIST_FIELDS)
+    except FieldSelectionError as error:
+        return error_response({'fields': [str(error)]})
+
+    search_form = SearchForm(request.GET)
+    if not search_form.is_valid():
+        return error_response(search_form.errors.get_json_data())
+
+    listings = Listing.objects.live().search(search_form.cleaned_data)
+    cursor = request.GET.get('cursor')
+    page = CursorPaginator(project(listings, fields), API_PAGE_SIZE).get_page(cursor)
+
+    next_url = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_url = f'{request.path}?{params.urlencode()}'
+
+    # Tagged by the serialized rows themselves: counters such as
+    # favorite_count, and the owner's username, change without updated_at
+    results = [serialize(row, fields) for row in page]
+    etag = make_etag(fields, results, page.next_cursor)
+    return conditional_json(request, etag, lambda: {
+        'results': results,
+        'next': next_url,
+    })
+
+
+@require_GET
+@read_from_replica
+def listing_detail(request, pk):
+    """A single active listing"""
+    try:
+        fields = selected_fields(request, DETAIL_FIELDS)
+    except FieldSelectionError as error:
+        return error_response({'fields': [str(error)]})
+
+    row = project(Listing.objects.filter(pk=pk, is_active=True), fields).first()
+    if row is None:
+        return JsonResponse({'errors': {'__all__': ['Listing not found.']}}, status=404)
+
+    data = serialize(row, fields)
+    return conditional_json(request, make_etag(fields, data), lambda: data)
@@ -0,0 +1,17 @@
+from django.urls import URLPattern
+
+from . import async_views
+from .urls import app_name, urlpatterns as sync_urlpatterns  # noqa: F401
+
+# The listings URLs with the read-heavy views swapped for their async versions
+ASYNC_VIEWS = {
+    'home': async_views.home,
+    'search': async_views.search_listings,
+    'listing_detail': async_views.listing_detail,
+    'toggle_favorite': async_views.toggle_favorite,
+}
+
+urlpatterns = [
+    URLPattern(pattern.pattern, ASYNC_VIEWS.get(pattern.name, pattern.callback), pattern.default_args, pattern.name)
+    for pattern in sync_urlpatterns
+]
@@ -0,0 +1,101 @@
+# Natively async versions of the read-heavy listing views, served under ASGI
+# (see listings/async_urls.py). Single-object lookups use the async ORM. The
+# feed is views.listing_feed, so both URLconfs filter, cache and count alike;
+# it runs through sync_to_async on the thread-sensitive executor, whose thread
+# keeps its pooled connection. Rendering, which can touch the session and
+# media storage, is offloaded too, so nothing blocks the event loop.
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.views.decorators.http import require_POST
+
+from . import views
+from .forms import GalleryUploadForm, SearchForm
+from .models import Listing
+from .popularity import view_buffer
+from .ratelimit import ratelimit
+from .routers import read_from_replica
+from .views import flip_favorite
+
+
+async def request_user(request):
+    """The authenticated user, also stored on request.user for templates"""
+    user = await request.auser()
+    # Saves the sync request.user a second lookup when the template reads it
+    request.user = user
+    return user
+
+
+async def listing_feed(request, listings, search_form, template_name):
+    """Async listing_feed: the shared sync feed, run on the request's thread-sensitive executor
+
+    That thread keeps its database connection between requests, so the feed
+    uses the pool (or CONN_MAX_AGE) like the sync views do.
+    """
+    await request_user(request)
+    return await sync_to_async(views.listing_feed)(request, listings, search_form, template_name)
+
+
+async def home(request):
+    """Home page with featured listings and search form"""
+    search_form = SearchForm(request.GET)
+    # Amenity filters look their ids up while the queryset is built
+    listings = await sync_to_async(views.filtered_listings)(search_form)
+    return await listing_feed(request, listings, search_form, 'listings/home.html')
+
+
+@read_from_replica
+@ratelimit('search')
+async def search_listings(request):
+    """Advanced search view"""
+    search_form = SearchForm(request.GET)
+    # Amenity filters look their ids up while the queryset is built
+    listings = await sync_to_async(views.filtered_listings)(search_form)
+    return await listing_feed(request, listings, search_form, 'listings/search.html')
+
+
+@read_from_replica
+async def listing_detail(request, pk):
+    """Detail view for a single listing"""
+    user = await request_user(request)
+    listings = (
+        Listing.objects.select_related('posted_by')
+        .with_favorite_state(user)
+        .prefetch_related('images', 'amenity_tags')
+    )
+    listing = await aget_object_or_404(listings, pk=pk, is_active=True)
+    is_owner = user == listing.posted_by
+    if not is_owner and view_buffer.record(listing.pk):
+        await sync_to_async(view_buffer.flush)()
+
+    context = {
+        'listing': listing,
+        'is_favorited': listing.is_favorited,
+    }
+    if is_owner:
+        context['gallery_form'] = GalleryUploadForm()
+    return await sync_to_async(render)(request, 'listings/listing_detail.html', context)
+
+
+@login_required
+@require_POST
+@ratelimit('favorite')
+async def toggle_favorite(request, pk):
+    """Toggle favorite status for a listing"""
+    user = await request_user(request)
+    listing = await aget_object_or_404(Listing, pk=pk, is_active=True)
+    is_favorited = await sync_to_async(flip_favorite)(user, listing)
+    message = 'Added to favorites!' if is_favorited else 'Removed from favorites!'
+
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        await listing.arefresh_from_db(fields=['favorite_count'])
+        return JsonResponse({
+            'is_favorited': is_favorited,
+            'favorite_count': listing.favorite_count,
+            'message': message,
+        })
+
+    messages.success(request, message)
+    return redirect('listings:listing_detail', pk=listing.pk)
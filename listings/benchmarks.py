@@ -0,0 +1,441 @@
+import asyncio
+import json
+import math
+import random
+import secrets
+import string
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from importlib import import_module
+from io import BytesIO
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .amenities import AMENITIES
+from .cache import bump_listing_generation
+from .geo import GAZETTEER
+from .models import Listing
+
+# Relative weights for the load generator's mix; client mode runs each scenario equally
+SCENARIO_WEIGHTS = {
+    'home': 30,
+    'search': 30,
+    'listing_detail': 30,
+    'profile': 5,
+    'toggle_favorite': 5,
+}
+SCENARIOS = list(SCENARIO_WEIGHTS)
+
+XHR_HEADERS = {'X-Requested-With': 'XMLHttpRequest'}
+
+
+class RateLimited(Exception):
+    """The load target answered 429: it is measuring its rate limiter, not the pages"""
+
+
+def percentile(values, q):
+    """q-th percentile (0-100) of sorted `values`, interpolating between ranks"""
+    if not values:
+        return None
+    rank = (len(values) - 1) * q / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarize(samples, elapsed):
+    """Report for one scenario from (latency_ms, queries, ok) samples"""
+    latencies = sorted(latency for latency, _, _ in samples)
+    queries = [count for _, count, _ in samples if count is not None]
+
+    def ms(value):
+        return None if value is None else round(value, 2)
+
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, _, ok in samples if not ok),
+        'mean_ms': ms(sum(latencies) / len(latencies) if latencies else None),
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else None,
+    }
+
+
+def build_report(mode, samples, elapsed, total_elapsed, options):
+    """Diffable JSON report: per-scenario stats plus the whole run"""
+    report = {
+        'mode': mode,
+        'options': options,
+        'dataset': {'live_listings': Listing.objects.live().count()},
+        'scenarios': {name: summarize(rows, elapsed.get(name)) for name, rows in samples.items()},
+        'total': summarize([row for rows in samples.values() for row in rows], total_elapsed),
+    }
+    return json.dumps(report, indent=2, sort_keys=True)
+
+
+class Workload:
+    """Builds the requests each scenario sends, from a sample of the current data"""
+
+    def __init__(self, user, listing_ids, rng):
+        self.user = user
+        self.listing_ids = listing_ids
+        self.rng = rng
+        self.searches = self.search_params()
+
+    @classmethod
+    def from_database(cls, username=None, sample_size=200, seed=None):
+        users = User.objects.filter(is_active=True)
+        user = users.filter(username=username).first() if username else (
+            users.filter(username__startswith='seed-user-').order_by('pk').first() or users.order_by('pk').first()
+        )
+        listing_ids = list(Listing.objects.live().order_by('?').values_list('pk', flat=True)[:sample_size])
+        return cls(user, listing_ids, random.Random(seed))
+
+    def search_params(self):
+        amenities = [slug for slug, _, _ in AMENITIES]
+        neighbourhoods = sorted(GAZETTEER)
+        return [
+            {'location': GAZETTEER[neighbourhoods[0]][0]},
+            {'property_type': 'apartment', 'max_price': 60000},
+            {'bedrooms': 2, 'min_price': 20000},
+            {'near': 'kilimani', 'radius_km': 3},
+            {'near': 'westlands', 'radius_km': 5, 'bedrooms': 1},
+            {'amenities': amenities[:2]},
+            {'location': GAZETTEER[neighbourhoods[-1]][0], 'amenities': amenities[2:3]},
+        ]
+
+    def request(self, scenario):
+        """(method, path, headers) for one request of `scenario`"""
+        if scenario == 'home':
+            return 'GET', reverse('listings:home'), {}
+        if scenario == 'search':
+            params = self.rng.choice(self.searches)
+            return 'GET', f'{reverse("listings:search")}?{urlencode(params, doseq=True)}', {}
+        if scenario == 'listing_detail':
+            return 'GET', reverse('listings:listing_detail', args=[self.rng.choice(self.listing_ids)]), {}
+        if scenario == 'profile':
+            return 'GET', reverse('listings:profile'), {}
+        if scenario == 'toggle_favorite':
+            return 'POST', reverse('listings:toggle_favorite', args=[self.rng.choice(self.listing_ids)]), XHR_HEADERS
+        raise ValueError(f'Unknown scenario {scenario!r}')
+
+
+@override_settings(RATELIMIT_ENABLED=False)
+def run_client_benchmark(workload, scenarios, requests_per_scenario, warmup=5):
+    """Drive each scenario through the test client, counting queries per request
+
+    Rate limits are off: every request comes from one client, as one user.
+    """
+    client = Client()
+    if workload.user is not None:
+        client.force_login(workload.user)
+    samples, elapsed = {}, {}
+    for scenario in scenarios:
+        for _ in range(warmup):
+            send_client_request(client, *workload.request(scenario))
+        rows = []
+        start = time.perf_counter()
+        for _ in range(requests_per_scenario):
+            method, path, headers = workload.request(scenario)
+            with CaptureQueriesContext(connection) as queries:
+                request_start = time.perf_counter()
+                response = send_client_request(client, method, path, headers)
+                latency = (time.perf_counter() - request_start) * 1000
+            rows.append((latency, len(queries), response.status_code < 300))
+        elapsed[scenario] = time.perf_counter() - start
+        samples[scenario] = rows
+    return samples, elapsed, sum(elapsed.values())
+
+
+def send_client_request(client, method, path, headers):
+    if method == 'POST':
+        return client.post(path, headers=headers)
+    return client.get(path, headers=headers)
+
+
+def session_cookies(user):
+    """Cookies for a logged-in session and a CSRF token the server will accept
+
+    The session is written straight to the session store, so the server must
+    share this database (or cache) for the cookie to authenticate.
+    """
+    if user is None:
+        return {}
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    csrf_token = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(32))
+    return {settings.SESSION_COOKIE_NAME: session.session_key, settings.CSRF_COOKIE_NAME: csrf_token}
+
+
+async def http_request(host, port, method, path, headers, timeout):
+    """Send one HTTP/1.1 request on a fresh connection and return the status code"""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {host}:{port}', 'Connection: close', 'Content-Length: 0']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        await asyncio.wait_for(reader.read(), timeout)
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def virtual_user(url, workload, cookies, deadline, think_time, timeout, samples):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    prefix = parts.path.rstrip('/')
+    names, weights = list(samples), [SCENARIO_WEIGHTS[name] for name in samples]
+    base_headers = {}
+    if cookies:
+        base_headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in cookies.items())
+        base_headers['X-CSRFToken'] = cookies[settings.CSRF_COOKIE_NAME]
+
+    while time.monotonic() < deadline:
+        scenario = workload.rng.choices(names, weights)[0]
+        method, path, headers = workload.request(scenario)
+        start = time.perf_counter()
+        try:
+            status = await http_request(host, port, method, prefix + path, {**base_headers, **headers}, timeout)
+            ok = status < 300
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            ok = False
+        else:
+            if status == 429:
+                raise RateLimited(f'{url} answered 429 to {method} {path}')
+        samples[scenario].append(((time.perf_counter() - start) * 1000, None, ok))
+        if think_time:
+            await asyncio.sleep(workload.rng.uniform(0, think_time * 2))
+
+
+def run_load_benchmark(workload, scenarios, url, users, duration, think_time=0.5, timeout=30):
+    """Locust-style closed-loop load: `users` virtual users each pick weighted scenarios until `duration` ends
+
+    The target is a separate server, so its rate limits apply: start it with
+    RATELIMIT_ENABLED=False. The run stops with RateLimited on the first 429.
+    """
+    cookies = session_cookies(workload.user)
+    samples = {scenario: [] for scenario in scenarios}
+
+    async def main():
+        deadline = time.monotonic() + duration
+        await asyncio.gather(*(
+            virtual_user(url, workload, cookies, deadline, think_time, timeout, samples) for _ in range(users)
+        ))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    # Scenarios share the run, so each one's throughput is over the whole duration
+    return samples, {scenario: elapsed for scenario in scenarios}, elapsed
+
+
+def wsgi_call(handler, path, remote_addr='127.0.0.1'):
+    """Serve one GET through a WSGIHandler the way a threaded WSGI server would; returns the status code"""
+    parts = urlsplit(path)
+    environ = {
+        'REMOTE_ADDR': remote_addr,
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': parts.path, 'QUERY_STRING': parts.query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': '127.0.0.1', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': '127.0.0.1',
+        'wsgi.input': BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False, 'wsgi.version': (1, 0),
+    }
+    status = []
+    response = handler(environ, lambda status_line, headers, exc_info=None: status.append(status_line))
+    try:
+        for _ in response:
+            pass
+    finally:
+        # Fires request_finished, which returns the thread's connection
+        response.close()
+    return int(status[0].split()[0])
+
+
+async def asgi_call(application, path):
+    """Serve one GET through an ASGI application; returns the status code"""
+    parts = urlsplit(path)
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': parts.path, 'raw_path': parts.path.encode(), 'query_string': parts.query.encode(),
+        'root_path': '', 'headers': [(b'host', b'127.0.0.1')],
+        'server': ('127.0.0.1', 80), 'client': ('127.0.0.1', 50000),
+    }
+    received, status = False, []
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Never disconnect; the handler cancels this once it has responded
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+async def drive(paths, concurrency, serve):
+    """Closed-loop clients: `concurrency` of them send `paths` in turn; returns samples and elapsed seconds"""
+    pending = iter(paths)
+    samples = {}
+
+    async def client():
+        for scenario, path in pending:
+            start = time.perf_counter()
+            try:
+                ok = await serve(path) < 300
+            except Exception:
+                ok = False
+            samples.setdefault(scenario, []).append(((time.perf_counter() - start) * 1000, None, ok))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+@contextmanager
+def simulated_db_latency(milliseconds):
+    """Add a fixed round trip to every query, as a database across the network would"""
+    active = True
+
+    def delay(execute, sql, params, many, context):
+        if active:
+            time.sleep(milliseconds / 1000)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    if milliseconds:
+        connection_created.connect(install)
+    try:
+        yield
+    finally:
+        active = False
+        connection_created.disconnect(install)
+
+
+@override_settings(RATELIMIT_ENABLED=False)
+def run_server_comparison(workload, scenarios, concurrency_levels, requests_per_level, wsgi_threads):
+    """Throughput and latency of the ASGI (async views) and WSGI (sync views) paths at each concurrency
+
+    Rate limits are off, since all the simulated clients share one address.
+    """
+    # Both paths replay the same requests
+    rounds = max(requests_per_level // len(scenarios), 1)
+    paths = {
+        concurrency: [(scenario, workload.request(scenario)[1]) for _ in range(rounds) for scenario in scenarios]
+        for concurrency in concurrency_levels
+    }
+    results = {}
+    for mode in ('asgi', 'wsgi'):
+        urlconf = 'roomlink.asgi_urls' if mode == 'asgi' else 'roomlink.urls'
+        with override_settings(ROOT_URLCONF=urlconf), ThreadPoolExecutor(wsgi_threads) as executor:
+            if mode == 'asgi':
+                application = ASGIHandler()
+
+                async def serve(path):
+                    return await asgi_call(application, path)
+            else:
+                handler = WSGIHandler()
+
+                async def serve(path):
+                    return await asyncio.get_running_loop().run_in_executor(executor, wsgi_call, handler, path)
+
+            for concurrency in concurrency_levels:
+                # Warm templates and card fragments, then start both paths from cold search results
+                asyncio.run(drive(paths[concurrency], concurrency, serve))
+                bump_listing_generation()
+                samples, elapsed = asyncio.run(drive(paths[concurrency], concurrency, serve))
+                results.setdefault(mode, {})[f'concurrency_{concurrency:03d}'] = {
+                    'total': summarize([row for rows in samples.values() for row in rows], elapsed),
+                    'scenarios': {name: summarize(rows, elapsed) for name, rows in samples.items()},
+                }
+    return results
+
+
+def uncached_search(workload):
+    """A search path with a random minimum price, so its results are never in the cache"""
+    params = {**workload.rng.choice(workload.searches), 'min_price': workload.rng.randrange(1000, 50000)}
+    return f'{reverse("listings:search")}?{urlencode(params, doseq=True)}'
+
+
+def run_flood_benchmark(workload, duration, regular_clients, flood_rate, flood_concurrency, wsgi_threads, think_time=2.0):
+    """Search latency of well-behaved clients while one address floods the search page
+
+    Three phases of `duration` seconds on one simulated WSGI server: the
+    regular clients alone, then beside the flood with rate limits off, then
+    with them on. Each regular client has an address of its own and pauses
+    between searches; the flood offers `flood_rate` searches a second from a
+    single address over `flood_concurrency` connections.
+    """
+    results = {}
+    phases = [('alone', True, False), ('flood_unlimited', False, True), ('flood_rate_limited', True, True)]
+    handler = WSGIHandler()
+    with ThreadPoolExecutor(wsgi_threads) as executor:
+        for number, (phase, limited, flooding) in enumerate(phases):
+            regular, flood = [], []
+
+            async def send(address, samples):
+                start = time.perf_counter()
+                status = await asyncio.get_running_loop().run_in_executor(
+                    executor, wsgi_call, handler, uncached_search(workload), address
+                )
+                samples.append(((time.perf_counter() - start) * 1000, status))
+
+            async def regular_client(address, deadline):
+                while time.monotonic() < deadline:
+                    await send(address, regular)
+                    await asyncio.sleep(workload.rng.uniform(0, think_time * 2))
+
+            async def flooder(address, deadline):
+                # Each connection paces itself so together they offer `flood_rate`
+                interval = flood_concurrency / flood_rate
+                while time.monotonic() < deadline:
+                    start = time.monotonic()
+                    await send(address, flood)
+                    await asyncio.sleep(max(interval - (time.monotonic() - start), 0))
+
+            async def main():
+                deadline = time.monotonic() + duration
+                # Fresh addresses per phase, so no budget carries over
+                clients = [regular_client(f'10.1.{number}.{index}', deadline) for index in range(regular_clients)]
+                if flooding:
+                    clients += [flooder(f'10.2.{number}.1', deadline) for _ in range(flood_concurrency)]
+                await asyncio.gather(*clients)
+
+            with override_settings(RATELIMIT_ENABLED=limited):
+                start = time.perf_counter()
+                asyncio.run(main())
+                elapsed = time.perf_counter() - start
+            results[phase] = {
+                'regular': summarize([(ms, None, status < 300) for ms, status in regular], elapsed),
+            }
+            if flooding:
+                results[phase]['flood'] = {
+                    **summarize([(ms, None, status < 300) for ms, status in flood], elapsed),
+                    'throttled': sum(1 for _, status in flood if status == 429),
+                }
+    return results
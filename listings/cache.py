@@ -0,0 +1,163 @@
+import hashlib
+import json
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.timesince import timesince
+
+from .instrumentation import record_cache_lookup
+
+GENERATION_KEY = 'listings:generation'
+
+
+def get_cache():
+    return caches[getattr(settings, 'LISTING_CACHE_ALIAS', 'default')]
+
+
+def listing_generation():
+    """Current listings generation; every listing write moves it forward"""
+    cache = get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Seed from the clock so an evicted counter can never fall back to an old value
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+async def alisting_generation():
+    cache = get_cache()
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, time.time_ns(), None)
+        generation = await cache.aget(GENERATION_KEY)
+    return generation
+
+
+def bump_listing_generation():
+    """Invalidate every cached search result at once"""
+    cache = get_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+
+
+def normalize_params(params):
+    """Stable representation of SearchForm cleaned_data (empty values dropped)"""
+    normalized = {}
+    for name, value in params.items():
+        if value in (None, '', []):
+            continue
+        if isinstance(value, (list, tuple)):
+            value = sorted(str(item).strip().lower() for item in value)
+        elif isinstance(value, Decimal):
+            value = f'{value.normalize():f}'
+        elif isinstance(value, str):
+            value = value.strip().lower()
+        normalized[name] = value
+    return normalized
+
+
+class SearchResultCache:
+    """Caches search results under the current listings generation
+
+    Entries are never deleted explicitly. Bumping the generation makes every
+    older key unreachable and the backend expires them after `timeout`.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'LISTING_SEARCH_CACHE_TIMEOUT', 300)
+
+    def make_key(self, namespace, params):
+        return self.key_for(listing_generation(), namespace, params)
+
+    async def amake_key(self, namespace, params):
+        return self.key_for(await alisting_generation(), namespace, params)
+
+    def key_for(self, generation, namespace, params):
+        payload = json.dumps(normalize_params(params), sort_keys=True, default=str)
+        digest = hashlib.sha1(payload.encode()).hexdigest()
+        return f'listings:search:{generation}:{namespace}:{digest}'
+
+    def get(self, key):
+        return self.count_lookup(get_cache().get(key))
+
+    async def aget(self, key):
+        return self.count_lookup(await get_cache().aget(key))
+
+    def count_lookup(self, value):
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        record_cache_lookup(hits=int(value is not None), misses=int(value is None))
+        return value
+
+    def set(self, key, value):
+        get_cache().set(key, value, self.timeout)
+
+    async def aset(self, key, value):
+        await get_cache().aset(key, value, self.timeout)
+
+    def get_or_set(self, namespace, params, compute):
+        # The key (and so the generation) is read once, before computing, so a
+        # write that lands mid-request can only orphan the entry, never poison it
+        key = self.make_key(namespace, params)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    async def aget_or_set(self, namespace, params, compute):
+        """get_or_set for async views; `compute` is a coroutine function"""
+        key = await self.amake_key(namespace, params)
+        value = await self.aget(key)
+        if value is None:
+            value = await compute()
+            await self.aset(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+search_cache = SearchResultCache()
+
+
+def card_cache_timeout():
+    """Seconds a rendered listing card is kept; 0 disables card caching"""
+    return getattr(settings, 'LISTING_CARD_CACHE_TIMEOUT', 3600)
+
+
+def card_cache_key(card, is_authenticated):
+    """Fragment key for one rendered listing card (a listings.cards.load_cards dict)
+
+    (id, updated_at) identifies the listing content, so any save through the
+    model moves the card to a new key. The digest covers what else the card
+    shows: counters updated in place, the viewer's favorite state, search
+    distance and the relative "posted ... ago" text.
+    """
+    distance = card.get('distance_km')
+    variant = json.dumps([
+        card['main_image_status'],
+        card['favorite_count'],
+        is_authenticated,
+        bool(card.get('is_favorited')),
+        None if distance is None else round(distance, 1),
+        timesince(card['created_at']),
+    ])
+    digest = hashlib.sha1(variant.encode()).hexdigest()[:16]
+    return f'listings:card:{card["id"]}:{card["updated_at"].timestamp()}:{digest}'
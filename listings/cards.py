@@ -0,0 +1,104 @@
+from itertools import islice
+
+from django.db.models import Exists, F, OuterRef, Value
+
+from .images import get_derivative_storage, srcset
+from .models import Favorite, Listing, ListingCard
+
+# Listing columns copied onto ListingCard as they are
+CARD_FIELDS = [
+    'title', 'location', 'price', 'property_type', 'bedrooms', 'bathrooms', 'favorite_count',
+    'main_image_status', 'created_at', 'updated_at',
+]
+# Saves touching none of these leave the card alone
+CARD_SOURCE_FIELDS = frozenset(CARD_FIELDS + ['main_image', 'main_image_derivatives'])
+SYNC_BATCH_SIZE = 1000
+
+
+def card_image(listing):
+    """The card-size picture of a listing, as the responsive_image tag would render it"""
+    manifest = listing.main_image_derivatives or {}
+    storage = get_derivative_storage()
+    jpeg = srcset(manifest, 'card', 'jpeg', storage)
+    if jpeg:
+        return {'src': storage.url(manifest['card']['jpeg'][0][1]), 'jpeg': jpeg, 'webp': srcset(manifest, 'card', 'webp', storage)}
+    if listing.main_image:
+        return {'src': listing.main_image.url}
+    return {}
+
+
+def listing_card(listing):
+    return ListingCard(listing_id=listing.pk, image=card_image(listing), **{field: getattr(listing, field) for field in CARD_FIELDS})
+
+
+def sync_cards(listings, using=None, counters=False):
+    """Insert or refresh the cards of `listings`, e.g. after bulk_create; returns the cards
+
+    Existing cards keep their favorite count unless `counters` is set: the
+    Favorite signals move it with F(), and a listing read before them would
+    write back a stale count.
+    """
+    refreshed = CARD_FIELDS if counters else [field for field in CARD_FIELDS if field not in Listing.COUNTER_FIELDS]
+    return ListingCard.objects.using(using).bulk_create(
+        [listing_card(listing) for listing in listings], batch_size=SYNC_BATCH_SIZE,
+        update_conflicts=True, unique_fields=['listing'], update_fields=refreshed + ['image'],
+    )
+
+
+def rebuild_cards(queryset=None, chunk_size=SYNC_BATCH_SIZE):
+    """Rewrite every card from its listing; returns how many were written"""
+    queryset = Listing.objects.all() if queryset is None else queryset
+    listings = queryset.only(*CARD_SOURCE_FIELDS).order_by('pk').iterator(chunk_size=chunk_size)
+    written = 0
+    while batch := list(islice(listings, chunk_size)):
+        written += len(sync_cards(batch, counters=True))
+    return written
+
+
+def add_to_favorite_count(listing_id, step):
+    """Move a card's favorite count with the listing's (see the Favorite signals)"""
+    cards = ListingCard.objects.filter(pk=listing_id)
+    if step < 0:
+        cards = cards.filter(favorite_count__gt=0)
+    cards.update(favorite_count=F('favorite_count') + step)
+
+
+def page_rows(listings):
+    """`listings` as .values() rows carrying only what the page needs from Listing
+
+    That is the keyset pagination columns, plus the distance of a radius
+    search; everything the card shows comes from ListingCard.
+    """
+    columns = ['id', 'created_at']
+    if 'distance_km' in listings.query.annotations:
+        columns.append('distance_km')
+    return listings.values(*columns)
+
+
+def load_cards(rows, user=None):
+    """Card dicts for page rows, in the rows' order, with `user`'s favorite state
+
+    One query whatever the page size. Listings without a card yet (inserted
+    by bulk_create or raw SQL) get one written on their first appearance.
+    """
+    ids = [row['id'] for row in rows]
+    is_authenticated = bool(user and user.is_authenticated)
+    cards = ListingCard.objects.filter(listing__in=ids)
+    if is_authenticated:
+        cards = cards.annotate(is_favorited=Exists(Favorite.objects.filter(user=user, listing=OuterRef('pk'))))
+    else:
+        cards = cards.annotate(is_favorited=Value(False))
+    cards_by_id = {card.pop('listing'): card for card in cards.values('listing', 'image', 'is_favorited', *CARD_FIELDS)}
+
+    missing = [pk for pk in ids if pk not in cards_by_id]
+    if missing:
+        favorites = set()
+        if is_authenticated:
+            favorites = set(Favorite.objects.filter(user=user, listing__in=missing).values_list('listing', flat=True))
+        for card in sync_cards(Listing.objects.filter(pk__in=missing).only(*CARD_SOURCE_FIELDS)):
+            cards_by_id[card.listing_id] = {
+                'image': card.image,
+                'is_favorited': card.listing_id in favorites,
+                **{field: getattr(card, field) for field in CARD_FIELDS},
+            }
+    return [{**cards_by_id[row['id']], **row} for row in rows if row['id'] in cards_by_id]
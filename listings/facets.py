@@ -0,0 +1,205 @@
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Value, When
+
+from .cache import bump_listing_generation, normalize_params
+from .models import FacetCount, Listing
+
+# Listings outside this filter are not counted anywhere (see ListingQuerySet.live)
+LIVE_LOOKUPS = {'is_active': True, 'availability': 'available'}
+# Every field a lookup below reads
+FACET_FIELDS = frozenset(['is_active', 'availability', 'property_type', 'furnished', 'bedrooms', 'price'])
+
+BEDROOM_MINIMUMS = [1, 2, 3, 4]
+PRICE_BANDS = [(0, 15000), (15000, 30000), (30000, 60000), (60000, 100000), (100000, None)]
+
+
+def price_option(low, high):
+    if high is None:
+        return (f'{low}-', f'KSh {low:,}+', {'price__gte': low}, {'min_price': low})
+    label = f'Under KSh {high:,}' if not low else f'KSh {low:,} - {high:,}'
+    return (f'{low}-{high}', label, {'price__gte': low, 'price__lte': high}, {'min_price': low, 'max_price': high})
+
+
+# (name, title, options); each option is (value, label, lookups selecting its
+# listings, SearchForm params that filter to it). The lookups mirror
+# ListingQuerySet.search, so a count is what clicking the option returns.
+FACETS = [
+    ('property_type', 'Property Type', [
+        (value, label, {'property_type': value}, {'property_type': value})
+        for value, label in Listing.PROPERTY_TYPE_CHOICES
+    ]),
+    ('furnished', 'Furnishing', [
+        (value, label, {'furnished': value}, {'furnished': value})
+        for value, label in Listing.FURNISHED_CHOICES
+    ]),
+    ('bedrooms', 'Bedrooms', [
+        (str(minimum), f'{minimum}+ bedrooms', {'bedrooms__gte': minimum}, {'bedrooms': minimum})
+        for minimum in BEDROOM_MINIMUMS
+    ]),
+    ('price', 'Price', [price_option(low, high) for low, high in PRICE_BANDS]),
+]
+
+
+def facet_options():
+    return [(name, value, lookups) for name, _, options in FACETS for value, _, lookups, _ in options]
+
+
+def empty_counts():
+    return {name: {value: 0 for value, *_ in options} for name, _, options in FACETS}
+
+
+def facet_counts(queryset):
+    """Counts per facet option for `queryset`, in a single aggregate query"""
+    options = facet_options()
+    totals = queryset.order_by().aggregate(**{
+        f'option_{index}': Count('pk', filter=Q(**lookups)) for index, (_, _, lookups) in enumerate(options)
+    })
+    counts = empty_counts()
+    for index, (name, value, _) in enumerate(options):
+        counts[name][value] = totals[f'option_{index}']
+    return counts
+
+
+def global_facet_counts():
+    """Site-wide counts, read from FacetCount instead of aggregating listings"""
+    counts = empty_counts()
+    for name, value, count in FacetCount.objects.values_list('facet', 'value', 'count'):
+        if value in counts.get(name, {}):
+            counts[name][value] = count
+    return counts
+
+
+def search_facets(listings, params):
+    """Facet counts for a feed: the stored summary when nothing is filtered"""
+    # A sort alone still covers every listing
+    if normalize_params({**params, 'sort': None}):
+        return facet_counts(listings)
+    return global_facet_counts()
+
+
+def matches(values, lookups):
+    for lookup, expected in lookups.items():
+        field, _, operator = lookup.partition('__')
+        # Unsaved instances can hold raw strings (e.g. from the shell)
+        actual = Listing._meta.get_field(field).to_python(values[field])
+        if actual is None:
+            return False
+        if operator == 'gte':
+            matched = actual >= expected
+        elif operator == 'lte':
+            matched = actual <= expected
+        else:
+            matched = actual == expected
+        if not matched:
+            return False
+    return True
+
+
+def listing_facet_keys(values):
+    """(facet, value) pairs a listing counts towards, from a dict of FACET_FIELDS"""
+    if not matches(values, LIVE_LOOKUPS):
+        return set()
+    return {(name, value) for name, value, lookups in facet_options() if matches(values, lookups)}
+
+
+def instance_facet_keys(listing):
+    return listing_facet_keys({field: getattr(listing, field) for field in FACET_FIELDS})
+
+
+def instance_facet_counts(listings):
+    """facet_counts for listings in memory, e.g. just bulk-created ones, without a query"""
+    counts = empty_counts()
+    for listing in listings:
+        for name, value in instance_facet_keys(listing):
+            counts[name][value] += 1
+    return counts
+
+
+def stored_facet_keys(pk, using=None):
+    """Facet keys of the row as currently saved, before an update overwrites it"""
+    values = Listing.objects.using(using).filter(pk=pk).values(*FACET_FIELDS).first()
+    return listing_facet_keys(values) if values else set()
+
+
+def apply_facet_delta(before, after, using=None):
+    """Move the stored counts from one set of facet keys to another"""
+    for keys, step in ((before - after, -1), (after - before, 1)):
+        if keys:
+            options = reduce(or_, (Q(facet=name, value=value) for name, value in sorted(keys)))
+            FacetCount.objects.using(using).filter(options).update(count=F('count') + step)
+
+
+def add_facet_counts(counts, using=None):
+    """Add `counts` (as returned by facet_counts) to the stored summary in one UPDATE"""
+    shift_facet_counts(counts, 1, using)
+
+
+def subtract_facet_counts(counts, using=None):
+    """Take `counts` (as returned by facet_counts) off the stored summary in one UPDATE"""
+    shift_facet_counts(counts, -1, using)
+
+
+def shift_facet_counts(counts, sign, using=None):
+    options = [(name, value, count * sign) for name, values in counts.items() for value, count in values.items() if count]
+    if options:
+        FacetCount.objects.using(using).filter(
+            reduce(or_, (Q(facet=name, value=value) for name, value, _ in options))
+        ).update(count=F('count') + Case(
+            *(When(facet=name, value=value, then=Value(count)) for name, value, count in options), default=Value(0)
+        ))
+
+
+def facet_rows(model, counts):
+    return [model(facet=name, value=value, count=count) for name, values in counts.items() for value, count in values.items()]
+
+
+def rebuild_facet_counts():
+    """Recount the stored summary, e.g. after bulk_create or queryset.update()
+
+    The FacetCount rows stay locked while the listings are counted, so signal
+    updates from concurrent saves land either in the count or after it.
+    """
+    with transaction.atomic():
+        list(FacetCount.objects.select_for_update().values_list('pk', flat=True))
+        counts = facet_counts(Listing.objects.live())
+        FacetCount.objects.bulk_create(
+            facet_rows(FacetCount, counts),
+            update_conflicts=True, unique_fields=['facet', 'value'], update_fields=['count'],
+        )
+        transaction.on_commit(bump_listing_generation)
+    return counts
+
+
+def facet_links(counts, query, base_url):
+    """Facets ready for a template: options with their count and a link applying them
+
+    Options without listings are left out unless they are the current filter.
+    """
+    facets = []
+    for name, title, options in FACETS:
+        # Choosing an option replaces whatever this facet had selected
+        controlled = {param for *_, params in options for param in params}
+        links = []
+        for value, label, _, params in options:
+            count = counts.get(name, {}).get(value, 0)
+            selected = all(query.get(param) == str(param_value) for param, param_value in params.items())
+            if not count and not selected:
+                continue
+            link_query = query.copy()
+            for param in controlled | {'after'}:
+                link_query.pop(param, None)
+            for param, param_value in params.items():
+                link_query[param] = str(param_value)
+            links.append({
+                'label': label,
+                'count': count,
+                'display_count': f'{count:,}',
+                'url': f'{base_url}?{link_query.urlencode()}',
+                'selected': selected,
+            })
+        if links:
+            facets.append({'name': name, 'title': title, 'options': links})
+    return facets
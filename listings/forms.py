@@ -1,7 +1,12 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from django import forms
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from .models import Listing, UserProfile, ListingImage
+from .amenities import AMENITY_CHOICES, parse_amenities
+from .geo import DEFAULT_RADIUS_KM, MAX_RADIUS_KM, NEIGHBOURHOOD_CHOICES
+from .models import Amenity, Listing, UserProfile, ListingImage
 
 class UserRegistrationForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -34,7 +39,7 @@ class ListingForm(forms.ModelForm):
             'title', 'description', 'property_type', 'furnished', 
             'location', 'address', 'price', 'bedrooms', 'bathrooms', 
             'square_feet', 'availability', 'contact_phone', 'contact_email', 
-            'amenities', 'main_image'
+            'amenities', 'amenity_tags', 'main_image'
         ]
         widgets = {
             'title': forms.TextInput(attrs={'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500'}),
@@ -51,8 +56,55 @@ class ListingForm(forms.ModelForm):
             'contact_phone': forms.TextInput(attrs={'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500'}),
             'contact_email': forms.EmailInput(attrs={'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500'}),
             'amenities': forms.Textarea(attrs={'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500', 'rows': 4}),
+            'amenity_tags': forms.CheckboxSelectMultiple(attrs={'class': 'h-4 w-4 text-blue-600 border-gray-300 rounded'}),
         }
 
+    def clean(self):
+        cleaned_data = super().clean()
+        # Listings described only in free text still get searchable tags
+        if not cleaned_data.get('amenity_tags') and cleaned_data.get('amenities'):
+            cleaned_data['amenity_tags'] = Amenity.objects.filter(slug__in=parse_amenities(cleaned_data['amenities']))
+        return cleaned_data
+
+    def save(self, commit=True):
+        # A new location is geocoded again on save (see listings.geo)
+        if 'location' in self.changed_data:
+            self.instance.latitude = self.instance.longitude = None
+        return super().save(commit)
+
+class ListingImportForm(ListingForm):
+    """ListingForm's rules for one imported row; amenity tags are given as slugs
+
+    Validating a row runs no queries, so files of any size import at a steady pace.
+    """
+    amenity_tags = forms.MultipleChoiceField(choices=AMENITY_CHOICES, required=False)
+
+    class Meta(ListingForm.Meta):
+        fields = [field for field in ListingForm.Meta.fields if field != 'main_image']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Rows without an availability are listed as available
+        self.fields['availability'].required = False
+
+    def clean(self):
+        cleaned_data = super(ListingForm, self).clean()
+        if not cleaned_data.get('availability'):
+            cleaned_data['availability'] = Listing._meta.get_field('availability').default
+        if not cleaned_data.get('amenity_tags') and cleaned_data.get('amenities'):
+            cleaned_data['amenity_tags'] = parse_amenities(cleaned_data['amenities'])
+        return cleaned_data
+
+class ListingImportUploadForm(forms.Form):
+    file = forms.FileField(widget=forms.ClearableFileInput(attrs={
+        'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500',
+        'accept': '.csv,.jsonl,.json,text/csv,application/x-ndjson',
+    }))
+    format = forms.ChoiceField(choices=[('', 'Detect from file name'), ('csv', 'CSV'), ('jsonl', 'JSON lines')], required=False, widget=forms.Select(attrs={
+        'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500'
+    }))
+    dry_run = forms.BooleanField(required=False, label='Only check the file, do not create listings', widget=forms.CheckboxInput(attrs={'class': 'mr-2'}))
+
 class ListingImageForm(forms.ModelForm):
     class Meta:
         model = ListingImage
@@ -61,6 +113,48 @@ class ListingImageForm(forms.ModelForm):
             'caption': forms.TextInput(attrs={'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500'}),
         }
 
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+class MultipleImageField(forms.ImageField):
+    """Image field accepting many files; each file is validated in a bounded thread pool"""
+
+    def __init__(self, *args, max_files=20, **kwargs):
+        self.max_files = max_files
+        kwargs.setdefault('widget', MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        files = [f for f in (data if isinstance(data, (list, tuple)) else [data]) if f]
+        if not files:
+            if self.required:
+                raise forms.ValidationError(self.error_messages['required'], code='required')
+            return []
+        if len(files) > self.max_files:
+            raise forms.ValidationError(f'You can upload at most {self.max_files} photos at a time.')
+
+        # Pillow releases the GIL while decoding, so files are verified in parallel
+        workers = min(len(files), getattr(settings, 'GALLERY_UPLOAD_WORKERS', 4))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(self._clean_file, files))
+
+        errors = [error for _, error in results if error]
+        if errors:
+            raise forms.ValidationError(errors)
+        return [cleaned for cleaned, _ in results]
+
+    def _clean_file(self, upload):
+        try:
+            return super().clean(upload), None
+        except forms.ValidationError as error:
+            return None, forms.ValidationError(f'{upload.name}: {" ".join(error.messages)}')
+
+class GalleryUploadForm(forms.Form):
+    images = MultipleImageField(max_files=getattr(settings, 'GALLERY_MAX_FILES', 20), widget=MultipleFileInput(attrs={
+        'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500',
+        'accept': 'image/*',
+    }))
+
 class SearchForm(forms.Form):
     location = forms.CharField(required=False, widget=forms.TextInput(attrs={
         'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500',
@@ -69,6 +163,9 @@ class SearchForm(forms.Form):
     property_type = forms.ChoiceField(choices=[('', 'Any Type')] + Listing.PROPERTY_TYPE_CHOICES, required=False, widget=forms.Select(attrs={
         'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500'
     }))
+    furnished = forms.ChoiceField(choices=[('', 'Any Furnishing')] + Listing.FURNISHED_CHOICES, required=False, widget=forms.Select(attrs={
+        'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500'
+    }))
     min_price = forms.DecimalField(required=False, widget=forms.NumberInput(attrs={
         'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500',
         'placeholder': 'Min Price',
@@ -83,4 +180,30 @@ class SearchForm(forms.Form):
         'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500',
         'placeholder': 'Bedrooms',
         'min': '0'
-    })) 
\ No newline at end of file
+    }))
+    # Radius search around a neighbourhood, or around an exact point (lat/lng)
+    near = forms.ChoiceField(choices=[('', 'Anywhere')] + NEIGHBOURHOOD_CHOICES, required=False, widget=forms.Select(attrs={
+        'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500'
+    }))
+    lat = forms.FloatField(required=False, min_value=-90, max_value=90, widget=forms.HiddenInput())
+    lng = forms.FloatField(required=False, min_value=-180, max_value=180, widget=forms.HiddenInput())
+    radius_km = forms.FloatField(required=False, min_value=0.1, max_value=MAX_RADIUS_KM, widget=forms.NumberInput(attrs={
+        'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500',
+        'placeholder': f'Within {DEFAULT_RADIUS_KM} km',
+        'min': '0.1',
+        'step': '0.5'
+    }))
+    # Listings must have every selected amenity
+    amenities = forms.MultipleChoiceField(choices=AMENITY_CHOICES, required=False, widget=forms.CheckboxSelectMultiple(attrs={
+        'class': 'h-4 w-4 text-blue-600 border-gray-300 rounded'
+    }))
+    # Empty keeps the feed's own order: newest, best text match or nearest
+    sort = forms.ChoiceField(choices=[('', 'Best match'), ('trending', 'Trending')], required=False, widget=forms.Select(attrs={
+        'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500'
+    }))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if (cleaned_data.get('lat') is None) != (cleaned_data.get('lng') is None):
+            raise forms.ValidationError('Both lat and lng are needed for a point search.')
+        return cleaned_data
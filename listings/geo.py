@@ -0,0 +1,144 @@
+import math
+import re
+
+from django.db.models import F, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+# Grid cells are GEO_CELL_DEGREES on a side (about 1.1 km at Nairobi's latitude)
+GEO_CELL_DEGREES = 0.01
+_GRID_ROWS_OFFSET = 9000
+_GRID_COLS_OFFSET = 18000
+_GRID_COLS = 36000
+
+DEFAULT_RADIUS_KM = 3
+MAX_RADIUS_KM = 25
+
+# Approximate centres of Nairobi neighbourhoods: slug -> (name, latitude, longitude, aliases)
+GAZETTEER = {
+    'cbd': ('CBD', -1.2864, 36.8172, ['city centre', 'town centre', 'nairobi cbd']),
+    'westlands': ('Westlands', -1.2676, 36.8108, []),
+    'parklands': ('Parklands', -1.2630, 36.8190, []),
+    'kilimani': ('Kilimani', -1.2905, 36.7856, []),
+    'kileleshwa': ('Kileleshwa', -1.2804, 36.7770, []),
+    'lavington': ('Lavington', -1.2800, 36.7680, []),
+    'hurlingham': ('Hurlingham', -1.2950, 36.7930, []),
+    'upper-hill': ('Upper Hill', -1.2986, 36.8150, ['upperhill']),
+    'ngong-road': ('Ngong Road', -1.2999, 36.7800, []),
+    'riverside': ('Riverside', -1.2710, 36.8000, []),
+    'spring-valley': ('Spring Valley', -1.2420, 36.7870, []),
+    'loresho': ('Loresho', -1.2500, 36.7620, []),
+    'kitisuru': ('Kitisuru', -1.2190, 36.7800, []),
+    'runda': ('Runda', -1.2180, 36.8080, []),
+    'gigiri': ('Gigiri', -1.2340, 36.8050, []),
+    'muthaiga': ('Muthaiga', -1.2500, 36.8320, []),
+    'ruaka': ('Ruaka', -1.2080, 36.7780, []),
+    'karen': ('Karen', -1.3195, 36.7073, []),
+    'langata': ('Langata', -1.3620, 36.7450, ["lang'ata"]),
+    'rongai': ('Rongai', -1.3960, 36.7550, ['ongata rongai']),
+    'dagoretti': ('Dagoretti', -1.2990, 36.7460, []),
+    'kawangware': ('Kawangware', -1.2830, 36.7500, []),
+    'madaraka': ('Madaraka', -1.3080, 36.8200, []),
+    'south-b': ('South B', -1.3107, 36.8390, []),
+    'south-c': ('South C', -1.3200, 36.8270, []),
+    'ngara': ('Ngara', -1.2740, 36.8250, []),
+    'pangani': ('Pangani', -1.2660, 36.8360, []),
+    'eastleigh': ('Eastleigh', -1.2740, 36.8500, []),
+    'buruburu': ('Buruburu', -1.2860, 36.8790, ['buru buru']),
+    'donholm': ('Donholm', -1.2960, 36.8900, []),
+    'embakasi': ('Embakasi', -1.3200, 36.9000, []),
+    'syokimau': ('Syokimau', -1.3660, 36.9370, []),
+    'ruaraka': ('Ruaraka', -1.2430, 36.8750, []),
+    'thome': ('Thome', -1.2070, 36.8820, []),
+    'roysambu': ('Roysambu', -1.2180, 36.8870, []),
+    'kasarani': ('Kasarani', -1.2210, 36.8970, []),
+    'kahawa': ('Kahawa', -1.1830, 36.9300, []),
+}
+
+NEIGHBOURHOOD_CHOICES = sorted(((slug, entry[0]) for slug, entry in GAZETTEER.items()), key=lambda choice: choice[1])
+
+# Longest names first so "South C" never matches as a bare "South"
+_NAME_PATTERNS = sorted(
+    (
+        (name, re.compile(r'\b%s\b' % re.escape(name), re.IGNORECASE), slug)
+        for slug, (display, _, _, aliases) in GAZETTEER.items()
+        for name in [display, *aliases]
+    ),
+    key=lambda entry: -len(entry[0]),
+)
+
+
+def neighbourhood_point(slug):
+    _, latitude, longitude, _ = GAZETTEER[slug]
+    return latitude, longitude
+
+
+def geocode(text):
+    """(latitude, longitude) of the first gazetteer neighbourhood named in `text`, or None"""
+    if not text:
+        return None
+    for _, pattern, slug in _NAME_PATTERNS:
+        if pattern.search(text):
+            return neighbourhood_point(slug)
+    return None
+
+
+def grid_cell(latitude, longitude):
+    """Integer id of the grid cell containing the point; neighbouring columns are consecutive"""
+    row = math.floor(latitude / GEO_CELL_DEGREES) + _GRID_ROWS_OFFSET
+    col = math.floor(longitude / GEO_CELL_DEGREES) + _GRID_COLS_OFFSET
+    return row * _GRID_COLS + col
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(min_lat, max_lat, min_lng, max_lng) enclosing the circle"""
+    lat_delta = radius_km / KM_PER_DEGREE_LAT
+    lng_delta = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(latitude)), 0.01))
+    return latitude - lat_delta, latitude + lat_delta, longitude - lng_delta, longitude + lng_delta
+
+
+def grid_cell_ranges(min_lat, max_lat, min_lng, max_lng):
+    """One (first, last) cell id range per grid row covering the box"""
+    first_row = grid_cell(min_lat, min_lng)
+    last_row = grid_cell(max_lat, min_lng)
+    width = grid_cell(min_lat, max_lng) - first_row
+    return [(start, start + width) for start in range(first_row, last_row + 1, _GRID_COLS)]
+
+
+def nearby_filter(latitude, longitude, radius_km):
+    """Q matching rows in the circle's bounding box; the cell ranges are B-tree range scans"""
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, radius_km)
+    cells = Q()
+    for first, last in grid_cell_ranges(min_lat, max_lat, min_lng, max_lng):
+        cells |= Q(geo_cell__range=(first, last))
+    return cells & Q(latitude__range=(min_lat, max_lat), longitude__range=(min_lng, max_lng))
+
+
+def haversine_expression(latitude, longitude):
+    """Great-circle distance in km from the point to each row's coordinates"""
+    lat_delta = Radians(F('latitude') - Value(latitude))
+    lng_delta = Radians(F('longitude') - Value(longitude))
+    a = (
+        Power(Sin(lat_delta / 2.0), 2)
+        + Cos(Value(math.radians(latitude))) * Cos(Radians(F('latitude'))) * Power(Sin(lng_delta / 2.0), 2)
+    )
+    return 2.0 * EARTH_RADIUS_KM * ASin(Least(Sqrt(a), Value(1.0)))
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(a), 1.0))
+
+
+def assign_coordinates(instance):
+    """Geocode a listing without coordinates and keep its grid cell in step"""
+    if instance.latitude is None or instance.longitude is None:
+        point = geocode(instance.location)
+        instance.latitude, instance.longitude = point if point else (None, None)
+    if instance.latitude is None or instance.longitude is None:
+        instance.geo_cell = None
+    else:
+        instance.geo_cell = grid_cell(instance.latitude, instance.longitude)
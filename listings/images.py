@@ -0,0 +1,94 @@
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, ImageOps
+
+# Fixed derivative widths (1x and 2x) for every place an image is rendered
+DERIVATIVE_SIZES = {
+    'card': (320, 640),
+    'detail': (960, 1600),
+    'avatar': (96, 192),
+}
+
+# (format, extension, Pillow save options); WebP first so <picture> prefers it
+DERIVATIVE_FORMATS = (
+    ('webp', 'webp', {'quality': 80, 'method': 4}),
+    ('jpeg', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+# Image fields that get derivatives, and the sizes each one is rendered at.
+# Manifests live in a `<field>_derivatives` JSONField next to the image.
+IMAGE_FIELDS = {
+    'Listing': {'main_image': ('card', 'detail')},
+    'ListingImage': {'image': ('card', 'detail')},
+    'UserProfile': {'profile_picture': ('avatar',)},
+}
+
+
+def get_derivative_storage():
+    return storages[getattr(settings, 'LISTING_IMAGE_STORAGE', 'default')]
+
+
+def derivative_widths(size, source_width):
+    """Configured widths for `size`, capped at the source width (never upscale)"""
+    return sorted({min(width, source_width) for width in DERIVATIVE_SIZES[size]})
+
+
+def generate_derivatives(source, sizes, storage=None):
+    """Write resized WebP/JPEG copies of `source` and return their manifest
+
+    Names are derived from the content hash, so re-processing the same upload
+    reuses the files already in storage. The manifest looks like
+    {'card': {'webp': [[320, name], [640, name]], 'jpeg': [...]}, ...}.
+    """
+    storage = storage or get_derivative_storage()
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    content = source.read()
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    digest = hashlib.sha1(content).hexdigest()[:20]
+
+    manifest = {}
+    with Image.open(BytesIO(content)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size in sizes:
+            entries = {name: [] for name, _, _ in DERIVATIVE_FORMATS}
+            for width in derivative_widths(size, image.width):
+                height = max(round(image.height * width / image.width), 1)
+                resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+                for name, extension, options in DERIVATIVE_FORMATS:
+                    path = f'derivatives/{digest}/{size}-{width}.{extension}'
+                    if not storage.exists(path):
+                        buffer = BytesIO()
+                        resized.save(buffer, format=name.upper(), **options)
+                        path = storage.save(path, ContentFile(buffer.getvalue()))
+                    entries[name].append([width, path])
+            manifest[size] = entries
+    return manifest
+
+
+def attach_derivatives(instance):
+    """Refresh derivative manifests for any newly uploaded image on `instance`
+
+    Called before save, while the image field still holds the UploadedFile
+    (CloudinaryField only uploads in pre_save). Cleared images drop their
+    manifest; untouched images keep theirs.
+    """
+    for field_name, sizes in IMAGE_FIELDS.get(type(instance).__name__, {}).items():
+        value = getattr(instance, field_name)
+        manifest_field = f'{field_name}_derivatives'
+        if isinstance(value, UploadedFile):
+            setattr(instance, manifest_field, generate_derivatives(value, sizes))
+        elif not value:
+            setattr(instance, manifest_field, {})
+
+
+def srcset(manifest, size, image_format, storage=None):
+    storage = storage or get_derivative_storage()
+    entries = manifest.get(size, {}).get(image_format, [])
+    return ', '.join(f'{storage.url(path)} {width}w' for width, path in entries)
@@ -0,0 +1,280 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+request_logger = logging.getLogger('listings.requests')
+slow_query_logger = logging.getLogger('listings.slow_queries')
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Timings and counters gathered while one request is handled"""
+
+    def __init__(self, path):
+        self.path = path
+        self.start = time.perf_counter()
+        self.total_seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.slow_queries = 0
+        self.render_seconds = 0.0
+        self.render_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Concurrent queries of one request can finish on different threads
+        self.lock = threading.Lock()
+
+
+def record_cache_lookup(hits=0, misses=0):
+    """Count cache hits/misses against the request being handled, if any"""
+    metrics = _current.get()
+    if metrics is not None:
+        with metrics.lock:
+            metrics.cache_hits += hits
+            metrics.cache_misses += misses
+
+
+def time_query(execute, sql, params, many, context):
+    """execute_wrapper timing each query against the current request's metrics
+
+    It is installed on every connection (see install_query_timer) and reads the
+    request from a context variable, so queries the async ORM runs in
+    sync_to_async threads are counted too.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        with metrics.lock:
+            metrics.queries += 1
+            metrics.query_seconds += duration
+        if duration >= getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 200) / 1000:
+            with metrics.lock:
+                metrics.slow_queries += 1
+            # Parameters are left out; they can hold personal data
+            slow_query_logger.warning(json.dumps({
+                'event': 'slow_query',
+                'path': metrics.path,
+                'database': context['connection'].alias,
+                'duration_ms': round(duration * 1000, 2),
+                'sql': sql[:2000],
+            }, sort_keys=True))
+
+
+def install_query_timer(connection):
+    """Add time_query to a connection once, however often it reconnects"""
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None or metrics.render_depth:
+            return super().render(context, request)
+        metrics.render_depth += 1
+        start, query_seconds = time.perf_counter(), metrics.query_seconds
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.render_depth -= 1
+            # Querysets evaluated by the template are already counted as db time
+            metrics.render_seconds += time.perf_counter() - start - (metrics.query_seconds - query_seconds)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for RequestMetricsMiddleware"""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def format_labels(labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped))
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name, self.help_text, self.label_names, self.buckets = name, help_text, label_names, buckets
+        self.series = {}
+
+    def observe(self, label_values, value):
+        counts = self.series.setdefault(label_values, [0] * (len(self.buckets) + 1) + [0.0])
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def exposition(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} histogram'
+        for label_values, counts in sorted(self.series.items()):
+            labels = dict(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip([*self.buckets, '+Inf'], counts):
+                cumulative += count
+                yield f'{self.name}_bucket{{{format_labels({**labels, "le": bound})}}} {cumulative}'
+            yield f'{self.name}_sum{{{format_labels(labels)}}} {counts[-1]}'
+            yield f'{self.name}_count{{{format_labels(labels)}}} {cumulative}'
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name, self.help_text, self.label_names = name, help_text, label_names
+        self.series = {}
+
+    def inc(self, label_values, amount=1):
+        self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def exposition(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} counter'
+        for label_values, value in sorted(self.series.items()):
+            yield f'{self.name}{{{format_labels(dict(zip(self.label_names, label_values)))}}} {value}'
+
+
+class MetricsRegistry:
+    """Per-process request metrics, exposed in the Prometheus text format
+
+    Each worker process keeps its own series; scrape every worker (or sum
+    them in Prometheus) to see the whole site.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            view = ('view',)
+            self.requests = Counter('roomlink_requests_total', 'Requests handled.', ('view', 'method', 'status'))
+            self.duration = Histogram(
+                'roomlink_request_duration_seconds', 'Wall time per request.', view, SECONDS_BUCKETS
+            )
+            self.db_time = Histogram(
+                'roomlink_request_db_seconds', 'Database time per request.', view, SECONDS_BUCKETS
+            )
+            self.db_queries = Histogram(
+                'roomlink_request_db_queries', 'Database queries per request.', view, QUERY_COUNT_BUCKETS
+            )
+            self.render_time = Histogram(
+                'roomlink_request_render_seconds', 'Template render time per request, excluding queries.',
+                view, SECONDS_BUCKETS,
+            )
+            self.cache_lookups = Counter('roomlink_cache_lookups_total', 'Listing cache lookups.', ('view', 'result'))
+            self.slow_queries = Counter('roomlink_slow_queries_total', 'Queries over the slow query threshold.', view)
+
+    def record(self, view, method, status, metrics):
+        with self._lock:
+            self.requests.inc((view, method, str(status)))
+            self.duration.observe((view,), metrics.total_seconds)
+            self.db_time.observe((view,), metrics.query_seconds)
+            self.db_queries.observe((view,), metrics.queries)
+            self.render_time.observe((view,), metrics.render_seconds)
+            if metrics.cache_hits:
+                self.cache_lookups.inc((view, 'hit'), metrics.cache_hits)
+            if metrics.cache_misses:
+                self.cache_lookups.inc((view, 'miss'), metrics.cache_misses)
+            if metrics.slow_queries:
+                self.slow_queries.inc((view,), metrics.slow_queries)
+
+    def exposition(self):
+        with self._lock:
+            metrics = [self.requests, self.duration, self.db_time, self.db_queries, self.render_time,
+                       self.cache_lookups, self.slow_queries]
+            return '\n'.join(line for metric in metrics for line in metric.exposition()) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def server_timing(metrics):
+    return ', '.join([
+        f'db;dur={metrics.query_seconds * 1000:.1f};desc="{metrics.queries} queries"',
+        f'render;dur={metrics.render_seconds * 1000:.1f}',
+        f'cache;desc="{metrics.cache_hits} hits, {metrics.cache_misses} misses"',
+        f'total;dur={metrics.total_seconds * 1000:.1f}',
+    ])
+
+
+class RequestMetricsMiddleware:
+    """Times each request's queries, template rendering and cache use
+
+    Results go out as a Server-Timing header, a JSON line on the
+    `listings.requests` logger and the histograms in `registry`. Keep it
+    first in MIDDLEWARE so the total covers the other middleware too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics(request.path)
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics(request.path)
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        metrics.total_seconds = time.perf_counter() - metrics.start
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        registry.record(view, request.method, response.status_code, metrics)
+        if getattr(settings, 'SERVER_TIMING_HEADER', False):
+            response['Server-Timing'] = server_timing(metrics)
+        if request_logger.isEnabledFor(logging.INFO):
+            request_logger.info(json.dumps({
+                'event': 'request',
+                'method': request.method,
+                'path': request.path,
+                'view': view,
+                'status': response.status_code,
+                'duration_ms': round(metrics.total_seconds * 1000, 2),
+                'db_queries': metrics.queries,
+                'db_ms': round(metrics.query_seconds * 1000, 2),
+                'render_ms': round(metrics.render_seconds * 1000, 2),
+                'cache_hits': metrics.cache_hits,
+                'cache_misses': metrics.cache_misses,
+                'slow_queries': metrics.slow_queries,
+            }, sort_keys=True))
+        return response
@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.benchmarks import Workload, run_server_comparison, simulated_db_latency
+
+READ_SCENARIOS = ['home', 'search', 'listing_detail']
+
+
+class Command(BaseCommand):
+    help = 'Compare the async views under ASGI with the sync views under a threaded WSGI server, as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(READ_SCENARIOS), help='Comma-separated read scenarios')
+        parser.add_argument('--concurrency', default='1,8,32', help='Comma-separated concurrent client counts')
+        parser.add_argument('--requests', type=int, default=150, help='Requests per concurrency level')
+        parser.add_argument('--wsgi-threads', type=int, default=4, help='Worker threads of the simulated WSGI server')
+        parser.add_argument('--db-latency-ms', type=float, default=0,
+                            help='Round trip added to every query, to model a database across the network')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the request mix')
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['concurrency'].split(',') if level.strip()]
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(READ_SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}. Choose from {", ".join(READ_SCENARIOS)}')
+        workload = Workload.from_database(seed=options['seed'])
+        if not workload.listing_ids:
+            raise CommandError('No live listings to request; seed some with seed_listings')
+
+        with simulated_db_latency(options['db_latency_ms']):
+            results = run_server_comparison(
+                workload, scenarios, levels, options['requests'], options['wsgi_threads']
+            )
+        settings_used = {key: options[key] for key in ('requests', 'wsgi_threads', 'db_latency_ms', 'seed')}
+        settings_used['scenarios'] = scenarios
+        self.stdout.write(json.dumps({'options': settings_used, **results}, indent=2, sort_keys=True))
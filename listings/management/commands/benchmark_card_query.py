@@ -0,0 +1,84 @@
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from listings.cards import load_cards, page_rows
+from listings.models import Listing
+from listings.pagination import CursorPaginator
+
+
+def result_bytes(sql):
+    """Size of the rows a SELECT returns, as Postgres stores them"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COALESCE(SUM(pg_column_size(result.*)), 0) FROM ({sql}) AS result')
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = 'Compare database bytes and Python allocation per feed page: whole Listing rows vs ListingCard rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=20, help='Feed pages walked per scenario')
+        parser.add_argument('--per-page', type=int, default=12, help='Cards per page')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Result sizes are measured with pg_column_size, so Postgres is required')
+        user = AnonymousUser()
+        listings = Listing.objects.live()
+        if not listings.exists():
+            raise CommandError('No live listings to page through; create or seed some first')
+
+        def models_page(cursor):
+            page = CursorPaginator(listings.with_favorite_state(user), options['per_page']).get_page(cursor)
+            return list(page), page.next_cursor
+
+        def cards_page(cursor):
+            page = CursorPaginator(page_rows(listings), options['per_page']).get_page(cursor)
+            return load_cards(page.object_list, user), page.next_cursor
+
+        scenarios = [
+            ('before: Listing instances', models_page),
+            ('after: .values() rows + ListingCard', cards_page),
+        ]
+        # Fills any missing cards, so the measured pages only read them
+        self.walk(cards_page, options['pages'])
+
+        self.stdout.write(f'{options["pages"]} pages of {options["per_page"]} cards\n')
+        self.stdout.write(f'{"scenario":<38} {"queries":>8} {"DB KB":>8} {"alloc KB":>9} {"mean ms":>8}')
+        for label, load_page in scenarios:
+            pages = self.walk(load_page, options['pages'])
+            queries = statistics.mean(len(page['sql']) for page in pages)
+            kilobytes = statistics.mean(sum(result_bytes(sql) for sql in page['sql']) for page in pages) / 1024
+            allocated = statistics.mean(page['peak'] for page in pages) / 1024
+            elapsed = statistics.mean(page['ms'] for page in pages)
+            self.stdout.write(f'{label:<38} {queries:>8.1f} {kilobytes:>8.1f} {allocated:>9.1f} {elapsed:>8.2f}')
+
+    def walk(self, load_page, count):
+        """Load `count` consecutive pages, recording each one's queries, peak allocation and time"""
+        pages, cursor = [], None
+        tracemalloc.start()
+        try:
+            for _ in range(count):
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    rows, cursor = load_page(cursor)
+                    elapsed = (time.perf_counter() - start) * 1000
+                pages.append({
+                    'sql': [query['sql'] for query in context.captured_queries],
+                    'peak': tracemalloc.get_traced_memory()[1] - baseline,
+                    'ms': elapsed,
+                })
+                del rows
+                if cursor is None:
+                    break
+        finally:
+            tracemalloc.stop()
+        return pages
@@ -0,0 +1,60 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.template import Context, Engine
+from django.template.backends.django import get_installed_libraries
+from django.test.utils import override_settings
+
+from listings.cards import load_cards, page_rows
+from listings.models import Listing
+
+PAGE_TEMPLATE = 'listings/includes/listing_cards.html'
+BASE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+
+class Command(BaseCommand):
+    help = 'Time rendering one page of listing cards with and without the template and card caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=200, help='Renders per scenario')
+        parser.add_argument('--per-page', type=int, default=12, help='Cards per page')
+
+    def handle(self, *args, **options):
+        user = AnonymousUser()
+        page = load_cards(list(page_rows(Listing.objects.live().with_favorite_state(user))[:options['per_page']]))
+        if not page:
+            raise CommandError('No live listings to render; create or seed some first')
+
+        dirs, libraries = settings.TEMPLATES[0]['DIRS'], get_installed_libraries()
+        uncached_engine = Engine(dirs=dirs, loaders=BASE_LOADERS, libraries=libraries)
+        cached_engine = Engine(
+            dirs=dirs, loaders=[('django.template.loaders.cached.Loader', BASE_LOADERS)], libraries=libraries
+        )
+
+        scenarios = [
+            ('before: uncached loader, no card cache', uncached_engine, 0),
+            ('cached loader, no card cache', cached_engine, 0),
+            ('after: cached loader, warm card cache', cached_engine, 3600),
+        ]
+        self.stdout.write(f'{len(page)} cards per page, {options["rounds"]} rounds\n')
+        self.stdout.write(f'{"scenario":<42} {"mean ms":>9} {"p50 ms":>9} {"p95 ms":>9}')
+        for label, engine, card_timeout in scenarios:
+            with override_settings(LISTING_CARD_CACHE_TIMEOUT=card_timeout):
+                self.render_page(engine, page, user)  # warm-up: compiles templates, fills the card cache
+                timings = [self.render_page(engine, page, user) for _ in range(options['rounds'])]
+            timings.sort()
+            p95 = timings[min(int(len(timings) * 0.95), len(timings) - 1)]
+            self.stdout.write(
+                f'{label:<42} {statistics.mean(timings):>9.3f} {statistics.median(timings):>9.3f} {p95:>9.3f}'
+            )
+
+    def render_page(self, engine, page, user):
+        start = time.perf_counter()
+        engine.get_template(PAGE_TEMPLATE).render(Context({'page_obj': page, 'user': user}))
+        return (time.perf_counter() - start) * 1000
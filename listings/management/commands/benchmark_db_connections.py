@@ -0,0 +1,63 @@
+import statistics
+import time
+from copy import deepcopy
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from listings.models import Listing
+
+BENCH_ALIAS = 'connection_benchmark'
+
+
+class Command(BaseCommand):
+    help = 'Time simulated requests with a new connection each time, persistent connections and a pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Simulated requests per scenario')
+
+    def handle(self, *args, **options):
+        base = deepcopy(connections['default'].settings_dict)
+        base['OPTIONS'].pop('pool', None)
+        pool = {'min_size': 1, 'max_size': 2, 'timeout': 10}
+        scenarios = [
+            ('before: new connection per request', {'CONN_MAX_AGE': 0}),
+            ('persistent connection (CONN_MAX_AGE)', {'CONN_MAX_AGE': 60}),
+        ]
+        # Pooling is a psycopg feature; other backends only get the first two
+        pooled = connections['default'].vendor == 'postgresql'
+        if pooled:
+            scenarios.append(('psycopg pool', {'CONN_MAX_AGE': 0, 'OPTIONS': {**base['OPTIONS'], 'pool': pool}}))
+        # The first page of the home feed stands in for a request's work
+        sql, params = Listing.objects.live().order_by('-created_at').values('pk', 'title')[:12].query.sql_with_params()
+
+        self.stdout.write(f'{options["requests"]} requests per scenario\n')
+        if not pooled:
+            self.stdout.write(f'Skipping the pool: {connections["default"].vendor} has no connection pool\n')
+        self.stdout.write(f'{"scenario":<40} {"mean ms":>9} {"p50 ms":>9} {"p95 ms":>9}')
+        for label, overrides in scenarios:
+            # A separate alias keeps the benchmark pool apart from the site's own
+            connections.settings[BENCH_ALIAS] = {**base, **overrides}
+            connection = connections[BENCH_ALIAS]
+            try:
+                self.simulate_request(connection, sql, params)  # warm-up: opens the pool
+                timings = sorted(self.simulate_request(connection, sql, params) for _ in range(options['requests']))
+            finally:
+                connection.close()
+                if pooled:
+                    connection.close_pool()
+                del connections[BENCH_ALIAS]
+                del connections.settings[BENCH_ALIAS]
+            p95 = timings[min(int(len(timings) * 0.95), len(timings) - 1)]
+            self.stdout.write(
+                f'{label:<40} {statistics.mean(timings):>9.3f} {statistics.median(timings):>9.3f} {p95:>9.3f}'
+            )
+
+    def simulate_request(self, connection, sql, params):
+        """One request's query plus the request_finished cleanup that closes or keeps the connection"""
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            cursor.fetchall()
+        connection.close_if_unusable_or_obsolete()
+        return (time.perf_counter() - start) * 1000
@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.benchmarks import Workload, run_flood_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Search latency of regular clients while one address floods it, with and without rate limits, as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=60, help='Seconds per phase; budgets are mostly per minute')
+        parser.add_argument('--clients', type=int, default=10, help='Regular clients, each from its own address')
+        parser.add_argument('--think-time', type=float, default=2.0, help='Mean pause between a regular client\'s searches')
+        parser.add_argument('--flood-rate', type=float, default=100, help='Searches per second the flooding address offers')
+        parser.add_argument('--flood-concurrency', type=int, default=16, help='Concurrent connections of the flooding address')
+        parser.add_argument('--wsgi-threads', type=int, default=4, help='Worker threads of the simulated WSGI server')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the searches')
+
+    def handle(self, *args, **options):
+        workload = Workload.from_database(seed=options['seed'])
+        if not workload.listing_ids:
+            raise CommandError('No live listings to search; seed some with seed_listings')
+        results = run_flood_benchmark(
+            workload, options['duration'], options['clients'], options['flood_rate'], options['flood_concurrency'],
+            options['wsgi_threads'], options['think_time'],
+        )
+        self.stdout.write(json.dumps({'options': options_used(options), **results}, indent=2, sort_keys=True))
+
+
+def options_used(options):
+    return {key: options[key] for key in ('duration', 'clients', 'think_time', 'flood_rate', 'flood_concurrency', 'wsgi_threads', 'seed')}
@@ -0,0 +1,31 @@
+import os
+from collections import defaultdict
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from listings.staticfiles import size_report
+
+
+class Command(BaseCommand):
+    help = 'Collect static files with hashed names, precompressed copies and WebP photos, then report their sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Empty STATIC_ROOT first')
+
+    def handle(self, *args, **options):
+        call_command('collectstatic', interactive=False, clear=options['clear'], verbosity=0)
+        rows = size_report()
+
+        self.stdout.write(f'{"asset":<44} {"files":>6} {"before KB":>10} {"after KB":>10} {"saved":>6}')
+        # Photos one by one, text assets summed per extension
+        groups = defaultdict(lambda: [0, 0, 0])
+        for name, kind, original, served in rows:
+            key = name if kind == 'image' else f'*{os.path.splitext(name)[1]}'
+            groups[key][0] += 1
+            groups[key][1] += original
+            groups[key][2] += served
+        groups['total'] = [sum(column) for column in zip(*groups.values())] if groups else [0, 0, 0]
+        for key, (files, original, served) in groups.items():
+            saved = f'{100 - served * 100 / original:.0f}%' if original else '-'
+            self.stdout.write(f'{key:<44} {files:>6} {original / 1024:>10.1f} {served / 1024:>10.1f} {saved:>6}')
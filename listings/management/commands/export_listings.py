@@ -0,0 +1,23 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from listings.models import Listing
+from listings.transfer import FORMATS, export_lines
+
+
+class Command(BaseCommand):
+    help = 'Stream every listing to a CSV or JSON lines file, a chunk of rows at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--output', help='File to write (default: standard output)')
+
+    def handle(self, *args, **options):
+        lines = export_lines(Listing.objects.all(), options['format'])
+        if not options['output']:
+            sys.stdout.writelines(lines)
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            output.writelines(lines)
+        self.stdout.write(self.style.SUCCESS(f'Listings written to {options["output"]}'))
@@ -0,0 +1,44 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.transfer import FORMATS, IMPORT_BATCH_SIZE, detect_format, import_listings
+
+
+class Command(BaseCommand):
+    help = 'Import listings from a CSV or JSON lines file, validated with the listing form rules'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for standard input')
+        parser.add_argument('--owner', required=True, help='Username the listings are posted by')
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the file extension, else csv)')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Rows validated and inserted per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Validate every row without creating listings')
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user named {options["owner"]!r}')
+
+        path = options['path']
+        format = options['format'] or ('csv' if path == '-' else detect_format(path))
+        start = time.perf_counter()
+        if path == '-':
+            report = import_listings(sys.stdin, owner, format, options['batch_size'], options['dry_run'])
+        else:
+            with open(path, encoding='utf-8-sig', newline='') as stream:
+                report = import_listings(stream, owner, format, options['batch_size'], options['dry_run'])
+        elapsed = time.perf_counter() - start
+
+        for row in report['errors']:
+            messages = '; '.join(f'{field}: {" ".join(errors)}' for field, errors in row['errors'].items())
+            self.stderr.write(f'line {row["line"]}: {messages}')
+        if report['failed'] > len(report['errors']):
+            self.stderr.write(f'... {report["failed"] - len(report["errors"])} more rows with errors')
+        self.stdout.write(self.style.SUCCESS(
+            f'{report["rows"]} rows read in {elapsed:.1f}s: {report["valid"]} valid, '
+            f'{report["failed"]} with errors, {report["created"]} listings created'
+        ))
@@ -0,0 +1,33 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from listings.media import claim_jobs, process_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Process queued image uploads (originals, derivatives and retries) off the request path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+        parser.add_argument('--batch-size', type=int, default=10, help='Jobs claimed per poll')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Seconds after which a running job is considered abandoned')
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            requeue_stale_jobs(timedelta(seconds=options['stale_after']))
+            jobs = claim_jobs(options['batch_size'])
+            for job in jobs:
+                process_job(job)
+                processed += 1
+
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} media job(s)'))
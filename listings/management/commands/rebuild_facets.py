@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from listings.facets import rebuild_facet_counts
+
+
+class Command(BaseCommand):
+    help = 'Recount the stored search facet summary from the live listings (run after bulk imports or updates)'
+
+    def handle(self, *args, **options):
+        counts = rebuild_facet_counts()
+        for name, values in counts.items():
+            summary = ', '.join(f'{value}={count}' for value, count in values.items())
+            self.stdout.write(f'{name}: {summary}')
+        self.stdout.write(self.style.SUCCESS('Facet counts rebuilt'))
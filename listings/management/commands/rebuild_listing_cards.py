@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from listings.cards import rebuild_cards
+
+
+class Command(BaseCommand):
+    help = 'Rewrite the denormalized listing cards the feeds read (run after bulk updates or to backfill)'
+
+    def handle(self, *args, **options):
+        written = rebuild_cards()
+        self.stdout.write(self.style.SUCCESS(f'{written} listing card(s) rebuilt'))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.benchmarks import (
+    SCENARIOS, RateLimited, Workload, build_report, run_client_benchmark, run_load_benchmark,
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the main pages and report p50/p95/p99 latency, queries per request and throughput as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['client', 'load'], default='client',
+                            help='client: in-process test client with query counts; load: concurrent HTTP against --url')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated scenarios to run')
+        parser.add_argument('--requests', type=int, default=100, help='Requests per scenario (client mode)')
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server to load, started with RATELIMIT_ENABLED=False (load mode)')
+        parser.add_argument('--users', type=int, default=20, help='Concurrent virtual users (load mode)')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run (load mode)')
+        parser.add_argument('--think-time', type=float, default=0.5, help='Mean pause between a user\'s requests (load mode)')
+        parser.add_argument('--username', default=None, help='User to log in as; defaults to the first seeded user')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the request mix')
+        parser.add_argument('--output', default=None, help='Write the JSON report here instead of stdout')
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}. Choose from {", ".join(SCENARIOS)}')
+
+        workload = Workload.from_database(username=options['username'], seed=options['seed'])
+        if workload.user is None and {'profile', 'toggle_favorite'} & set(scenarios):
+            raise CommandError('profile and toggle_favorite need a user; seed some with seed_listings')
+        if not workload.listing_ids and {'listing_detail', 'toggle_favorite'} & set(scenarios):
+            raise CommandError('No live listings to request; seed some with seed_listings')
+
+        if options['mode'] == 'client':
+            settings_used = {'requests': options['requests'], 'seed': options['seed']}
+            samples, elapsed, total = run_client_benchmark(workload, scenarios, options['requests'])
+        else:
+            settings_used = {key: options[key] for key in ('url', 'users', 'duration', 'think_time', 'seed')}
+            try:
+                samples, elapsed, total = run_load_benchmark(
+                    workload, scenarios, options['url'], options['users'], options['duration'], options['think_time']
+                )
+            except RateLimited as error:
+                raise CommandError(f'{error}. Start the target with RATELIMIT_ENABLED=False to load it') from error
+
+        report = build_report(options['mode'], samples, elapsed, total, settings_used)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+            self.stderr.write(f'Wrote {options["output"]}')
+        else:
+            self.stdout.write(report)
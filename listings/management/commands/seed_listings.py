@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.seed import SEED_PASSWORD, seed_dataset
+
+
+class Command(BaseCommand):
+    help = 'Bulk-insert synthetic Nairobi users, profiles, listings, gallery images and favorites'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Users (each with a profile)')
+        parser.add_argument('--listings', type=int, default=10000, help='Listings, posted by the landlord users')
+        parser.add_argument('--gallery', type=int, default=2, help='Average gallery images per listing')
+        parser.add_argument('--favorites', type=int, default=20000, help='Favorites, skewed towards popular listings')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for a reproducible dataset')
+        parser.add_argument('--prefix', default='seed-user-', help='Username prefix for generated users')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 and options['listings']:
+            raise CommandError('Listings need at least one user to post them')
+
+        start = time.perf_counter()
+        counts = seed_dataset(
+            users=options['users'],
+            listings=options['listings'],
+            gallery=options['gallery'],
+            favorites=options['favorites'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            prefix=options['prefix'],
+            log=lambda message: self.stdout.write(f'  {message}'),
+        )
+        elapsed = time.perf_counter() - start
+        rows = sum(counts.values())
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {summary} in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s). '
+            f'Seeded users log in with the password "{SEED_PASSWORD}".'
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from listings.saved_searches import SavedSearchIndex, match_new_listings, send_digests
+
+
+class Command(BaseCommand):
+    help = 'Match newly live listings against the saved searches and email each user a digest (run periodically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Queued listings matched per transaction')
+        parser.add_argument('--no-email', action='store_true', help='Only record matches; send digests on a later run')
+
+    def handle(self, *args, **options):
+        index = SavedSearchIndex.load()
+        matched = match_new_listings(index, batch_size=options['batch_size'])
+        self.stdout.write(f'{matched} new match(es) across {index.size} saved search(es)')
+        if not options['no_email']:
+            sent = send_digests()
+            self.stdout.write(f'{sent} digest email(s) sent')
+        self.stdout.write(self.style.SUCCESS('Saved search digests done'))
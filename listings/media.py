@@ -0,0 +1,203 @@
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import cloudinary.uploader
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, storages
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.utils.text import get_valid_filename
+
+from .images import IMAGE_FIELDS, generate_derivatives
+from .models import ListingImage, MediaJob
+
+logger = logging.getLogger(__name__)
+
+
+class CloudinaryMediaAdapter:
+    """Uploads the original image to Cloudinary, as CloudinaryField.pre_save would"""
+
+    def store(self, instance, field_name, upload):
+        field = instance._meta.get_field(field_name)
+        options = {'type': field.type, 'resource_type': field.resource_type}
+        options.update({key: value(instance) if callable(value) else value for key, value in field.options.items()})
+        return cloudinary.uploader.upload_resource(upload, **options)
+
+
+class LocalMediaAdapter:
+    """Keeps originals in Django storage; stands in for Cloudinary in dev and tests"""
+
+    storage_alias = 'default'
+
+    def store(self, instance, field_name, upload):
+        name = f'uploads/{instance._meta.label_lower}/{field_name}/{get_valid_filename(upload.name)}'
+        return storages[self.storage_alias].save(name, upload)
+
+
+def get_media_adapter():
+    return import_string(getattr(settings, 'MEDIA_UPLOAD_ADAPTER', 'listings.media.CloudinaryMediaAdapter'))()
+
+
+def get_staging_storage():
+    return FileSystemStorage(location=settings.MEDIA_STAGING_ROOT)
+
+
+def save_with_deferred_uploads(instance):
+    """Save `instance` now and queue any freshly uploaded images for the worker
+
+    Each UploadedFile on an image field is written to local staging and
+    replaced by the field's previous value (nothing for new rows), so the
+    request never waits on remote storage or Pillow.
+    """
+    fields = IMAGE_FIELDS.get(type(instance).__name__, {})
+    uploads = {name: getattr(instance, name) for name in fields if isinstance(getattr(instance, name), UploadedFile)}
+
+    previous = {}
+    if uploads and instance.pk:
+        previous = type(instance)._default_manager.filter(pk=instance.pk).values(*uploads).first() or {}
+
+    for name in uploads:
+        setattr(instance, name, previous.get(name))
+        if hasattr(instance, f'{name}_status'):
+            setattr(instance, f'{name}_status', 'pending')
+
+    staging = get_staging_storage()
+    with transaction.atomic():
+        instance.save()
+        for name, upload in uploads.items():
+            staged_name = stage_upload(upload, staging)
+            MediaJob.objects.create(
+                model_label=instance._meta.label,
+                object_id=instance.pk,
+                field_name=name,
+                staged_name=staged_name,
+                original_name=upload.name,
+                content_type=getattr(upload, 'content_type', '') or '',
+            )
+    return instance
+
+
+def stage_upload(upload, staging=None):
+    """Stream `upload` into local staging in chunks and return the staged name"""
+    staging = staging or get_staging_storage()
+    return staging.save(f'{uuid.uuid4().hex}-{get_valid_filename(upload.name)}', upload)
+
+
+def add_gallery_images(listing, uploads):
+    """Attach many uploaded photos to `listing` with one INSERT for the rows
+
+    Files are staged concurrently; the ListingImage rows and their MediaJobs
+    are each created with a single bulk_create, and the worker fills in the
+    images afterwards.
+    """
+    if not uploads:
+        return []
+    staging = get_staging_storage()
+    workers = min(len(uploads), getattr(settings, 'GALLERY_UPLOAD_WORKERS', 4))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        staged_names = list(pool.map(lambda upload: stage_upload(upload, staging), uploads))
+
+    try:
+        with transaction.atomic():
+            images = ListingImage.objects.bulk_create([
+                ListingImage(listing=listing, image='', image_status='pending') for _ in uploads
+            ])
+            MediaJob.objects.bulk_create([
+                MediaJob(
+                    model_label=image._meta.label,
+                    object_id=image.pk,
+                    field_name='image',
+                    staged_name=staged_name,
+                    original_name=upload.name,
+                    content_type=getattr(upload, 'content_type', '') or '',
+                )
+                for image, upload, staged_name in zip(images, uploads, staged_names)
+            ])
+    except Exception:
+        for staged_name in staged_names:
+            staging.delete(staged_name)
+        raise
+    return images
+
+
+def claim_jobs(limit):
+    """Atomically move up to `limit` due jobs to running; concurrent workers skip locked rows"""
+    with transaction.atomic():
+        jobs = list(
+            MediaJob.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', run_after__lte=timezone.now())
+            .order_by('run_after')[:limit]
+        )
+        for job in jobs:
+            job.status = 'running'
+            job.attempts += 1
+            job.save(update_fields=['status', 'attempts', 'updated_at'])
+    return jobs
+
+
+def requeue_stale_jobs(older_than):
+    """Return jobs abandoned by a crashed worker to the queue"""
+    cutoff = timezone.now() - older_than
+    return MediaJob.objects.filter(status='running', updated_at__lt=cutoff).update(status='pending')
+
+
+def process_job(job, adapter=None):
+    """Upload one staged image, build its derivatives and attach both to the target row"""
+    adapter = adapter or get_media_adapter()
+    staging = get_staging_storage()
+    model = apps.get_model(job.model_label)
+    instance = model._default_manager.filter(pk=job.object_id).first()
+    if instance is None:
+        # Target was deleted while queued
+        staging.delete(job.staged_name)
+        MediaJob.objects.filter(pk=job.pk).update(status='done', last_error='Target no longer exists')
+        return
+
+    try:
+        with staging.open(job.staged_name) as staged:
+            upload = UploadedFile(staged, name=job.original_name, content_type=job.content_type, size=staged.size)
+            manifest = generate_derivatives(upload, IMAGE_FIELDS[model.__name__][job.field_name])
+            upload.seek(0)
+            value = adapter.store(instance, job.field_name, upload)
+    except Exception as exc:
+        logger.exception('Media job %s failed (attempt %s)', job.pk, job.attempts)
+        fail_job(job, instance, exc)
+        return
+
+    update_fields = [job.field_name, f'{job.field_name}_derivatives']
+    setattr(instance, job.field_name, value)
+    setattr(instance, f'{job.field_name}_derivatives', manifest)
+    if hasattr(instance, f'{job.field_name}_status'):
+        setattr(instance, f'{job.field_name}_status', 'ready')
+        update_fields.append(f'{job.field_name}_status')
+    if hasattr(instance, 'updated_at'):
+        # Moves cached listing cards (keyed on updated_at) to the new image
+        update_fields.append('updated_at')
+
+    with transaction.atomic():
+        instance.save(update_fields=update_fields)
+        MediaJob.objects.filter(pk=job.pk).update(status='done', last_error='', updated_at=timezone.now())
+    staging.delete(job.staged_name)
+
+
+def fail_job(job, instance, exc):
+    """Schedule a retry with exponential backoff, or give up after MEDIA_JOB_MAX_ATTEMPTS"""
+    max_attempts = getattr(settings, 'MEDIA_JOB_MAX_ATTEMPTS', 5)
+    if job.attempts < max_attempts:
+        delay = timedelta(seconds=30 * 2 ** (job.attempts - 1))
+        MediaJob.objects.filter(pk=job.pk).update(
+            status='pending', run_after=timezone.now() + delay, last_error=repr(exc), updated_at=timezone.now()
+        )
+        return
+
+    # The staged file is kept so the upload can be retried by hand
+    MediaJob.objects.filter(pk=job.pk).update(status='failed', last_error=repr(exc), updated_at=timezone.now())
+    if hasattr(instance, f'{job.field_name}_status'):
+        # Saved through the model so a listing's card shows the failure too
+        setattr(instance, f'{job.field_name}_status', 'failed')
+        instance.save(update_fields=[f'{job.field_name}_status'])
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['is_active', 'availability', '-created_at'], name='listing_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('availability', 'available'), ('is_active', True)), fields=['-created_at'], name='listing_live_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('availability', 'available'), ('is_active', True)), fields=['property_type', '-created_at'], name='listing_live_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('availability', 'available'), ('is_active', True)), fields=['price'], name='listing_live_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('availability', 'available'), ('is_active', True)), fields=['bedrooms', 'price'], name='listing_live_bedrooms_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:47
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Postgres-only DDL. Other backends (SQLite dev setups) keep the plain column
+# and use the icontains fallback in listings.search.
+FORWARD_SQL = [
+    """
+    CREATE FUNCTION listings_listing_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.location, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.amenities, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER listings_listing_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, location, amenities, description ON listings_listing
+    FOR EACH ROW EXECUTE FUNCTION listings_listing_search_vector_update()
+    """,
+    # Backfill existing rows through the trigger
+    'UPDATE listings_listing SET title = title',
+    """
+    CREATE INDEX listing_search_vector_idx ON listings_listing USING gin (search_vector)
+    WHERE is_active AND availability = 'available'
+    """,
+    # pg_trgm ships with contrib but may be missing from minimal builds
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            CREATE INDEX listing_location_trgm_idx ON listings_listing USING gin (location gin_trgm_ops)
+            WHERE is_active AND availability = 'available';
+        END IF;
+    END
+    $$
+    """,
+]
+
+REVERSE_SQL = [
+    'DROP INDEX IF EXISTS listing_location_trgm_idx',
+    'DROP INDEX IF EXISTS listing_search_vector_idx',
+    'DROP TRIGGER IF EXISTS listings_listing_search_vector_trigger ON listings_listing',
+    'DROP FUNCTION IF EXISTS listings_listing_search_vector_update()',
+]
+
+
+def run_postgres_sql(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0002_listing_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run_postgres_sql(FORWARD_SQL), run_postgres_sql(REVERSE_SQL)),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:53
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_favorite_counts(apps, schema_editor):
+    Listing = apps.get_model('listings', 'Listing')
+    Favorite = apps.get_model('listings', 'Favorite')
+    counts = (
+        Favorite.objects.filter(listing=OuterRef('pk'))
+        .order_by()
+        .values('listing')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    Listing.objects.update(favorite_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0003_listing_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='favorite_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_favorite_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_media_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingimage',
+            name='image_status',
+            field=models.CharField(choices=[('ready', 'Ready'), ('pending', 'Processing'), ('failed', 'Failed')], default='ready', editable=False, max_length=10),
+        ),
+    ]
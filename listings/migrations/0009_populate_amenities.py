@@ -0,0 +1,69 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:07
+
+import re
+
+from django.db import migrations
+
+BATCH_SIZE = 5000
+
+# Frozen copy of listings.amenities as of this migration, so later edits to
+# the vocabulary do not change how it tags existing listings
+AMENITIES = [
+    ('parking', 'Parking', ['parking', 'garage', 'car park', 'carport']),
+    ('wifi', 'Wi-Fi', ['wifi', 'wi-fi', 'internet', 'fibre', 'fiber']),
+    ('security', 'Security', ['security', 'guard', 'guards', 'cctv', 'gated']),
+    ('water', 'Water', ['water', 'borehole']),
+    ('electricity', 'Electricity', ['electricity', 'power', 'tokens']),
+    ('backup-power', 'Backup Power', ['generator', 'backup power', 'solar']),
+    ('gym', 'Gym', ['gym', 'fitness']),
+    ('swimming-pool', 'Swimming Pool', ['pool', 'swimming']),
+    ('balcony', 'Balcony', ['balcony', 'balconies']),
+    ('garden', 'Garden', ['garden', 'compound', 'yard']),
+    ('lift', 'Lift', ['lift', 'elevator']),
+    ('pet-friendly', 'Pet Friendly', ['pet', 'pets', 'pet-friendly']),
+    ('laundry', 'Laundry', ['laundry', 'washing machine']),
+    ('cable-tv', 'Cable TV', ['dstv', 'cable', 'tv']),
+]
+
+PATTERNS = [
+    (slug, re.compile(r'\b(?:%s)\b' % '|'.join(re.escape(word) for word in words), re.IGNORECASE))
+    for slug, _, words in AMENITIES
+]
+
+
+def parse_amenities(text):
+    return [slug for slug, pattern in PATTERNS if pattern.search(text)]
+
+
+def populate_amenities(apps, schema_editor):
+    """Create the amenity vocabulary and tag existing listings from their free text"""
+    Amenity = apps.get_model('listings', 'Amenity')
+    Listing = apps.get_model('listings', 'Listing')
+    ListingAmenity = apps.get_model('listings', 'ListingAmenity')
+
+    Amenity.objects.bulk_create(
+        [Amenity(slug=slug, name=name) for slug, name, _ in AMENITIES], ignore_conflicts=True
+    )
+    amenity_ids = dict(Amenity.objects.values_list('slug', 'pk'))
+
+    batch = []
+    rows = Listing.objects.exclude(amenities='').values_list('pk', 'amenities').iterator(chunk_size=BATCH_SIZE)
+    for listing_id, text in rows:
+        batch.extend(
+            ListingAmenity(listing_id=listing_id, amenity_id=amenity_ids[slug]) for slug in parse_amenities(text)
+        )
+        if len(batch) >= BATCH_SIZE:
+            ListingAmenity.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    ListingAmenity.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0008_amenity'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_amenities, migrations.RunPython.noop),
+    ]
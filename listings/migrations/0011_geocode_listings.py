@@ -0,0 +1,107 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:12
+
+import math
+import re
+
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+# Frozen copy of listings.geo as of this migration, so later edits to the
+# gazetteer or the grid do not change where it places existing listings.
+# Approximate centres of Nairobi neighbourhoods: slug -> (name, latitude, longitude, aliases)
+GAZETTEER = {
+    'cbd': ('CBD', -1.2864, 36.8172, ['city centre', 'town centre', 'nairobi cbd']),
+    'westlands': ('Westlands', -1.2676, 36.8108, []),
+    'parklands': ('Parklands', -1.2630, 36.8190, []),
+    'kilimani': ('Kilimani', -1.2905, 36.7856, []),
+    'kileleshwa': ('Kileleshwa', -1.2804, 36.7770, []),
+    'lavington': ('Lavington', -1.2800, 36.7680, []),
+    'hurlingham': ('Hurlingham', -1.2950, 36.7930, []),
+    'upper-hill': ('Upper Hill', -1.2986, 36.8150, ['upperhill']),
+    'ngong-road': ('Ngong Road', -1.2999, 36.7800, []),
+    'riverside': ('Riverside', -1.2710, 36.8000, []),
+    'spring-valley': ('Spring Valley', -1.2420, 36.7870, []),
+    'loresho': ('Loresho', -1.2500, 36.7620, []),
+    'kitisuru': ('Kitisuru', -1.2190, 36.7800, []),
+    'runda': ('Runda', -1.2180, 36.8080, []),
+    'gigiri': ('Gigiri', -1.2340, 36.8050, []),
+    'muthaiga': ('Muthaiga', -1.2500, 36.8320, []),
+    'ruaka': ('Ruaka', -1.2080, 36.7780, []),
+    'karen': ('Karen', -1.3195, 36.7073, []),
+    'langata': ('Langata', -1.3620, 36.7450, ["lang'ata"]),
+    'rongai': ('Rongai', -1.3960, 36.7550, ['ongata rongai']),
+    'dagoretti': ('Dagoretti', -1.2990, 36.7460, []),
+    'kawangware': ('Kawangware', -1.2830, 36.7500, []),
+    'madaraka': ('Madaraka', -1.3080, 36.8200, []),
+    'south-b': ('South B', -1.3107, 36.8390, []),
+    'south-c': ('South C', -1.3200, 36.8270, []),
+    'ngara': ('Ngara', -1.2740, 36.8250, []),
+    'pangani': ('Pangani', -1.2660, 36.8360, []),
+    'eastleigh': ('Eastleigh', -1.2740, 36.8500, []),
+    'buruburu': ('Buruburu', -1.2860, 36.8790, ['buru buru']),
+    'donholm': ('Donholm', -1.2960, 36.8900, []),
+    'embakasi': ('Embakasi', -1.3200, 36.9000, []),
+    'syokimau': ('Syokimau', -1.3660, 36.9370, []),
+    'ruaraka': ('Ruaraka', -1.2430, 36.8750, []),
+    'thome': ('Thome', -1.2070, 36.8820, []),
+    'roysambu': ('Roysambu', -1.2180, 36.8870, []),
+    'kasarani': ('Kasarani', -1.2210, 36.8970, []),
+    'kahawa': ('Kahawa', -1.1830, 36.9300, []),
+}
+
+# Longest names first so "South C" never matches as a bare "South"
+NAME_PATTERNS = sorted(
+    (
+        (name, re.compile(r'\b%s\b' % re.escape(name), re.IGNORECASE), slug)
+        for slug, (display, _, _, aliases) in GAZETTEER.items()
+        for name in [display, *aliases]
+    ),
+    key=lambda entry: -len(entry[0]),
+)
+GEO_CELL_DEGREES = 0.01
+
+
+def geocode(text):
+    if not text:
+        return None
+    for _, pattern, slug in NAME_PATTERNS:
+        if pattern.search(text):
+            _, latitude, longitude, _ = GAZETTEER[slug]
+            return latitude, longitude
+    return None
+
+
+def grid_cell(latitude, longitude):
+    row = math.floor(latitude / GEO_CELL_DEGREES) + 9000
+    col = math.floor(longitude / GEO_CELL_DEGREES) + 18000
+    return row * 36000 + col
+
+
+def geocode_listings(apps, schema_editor):
+    """Place existing listings at their neighbourhood's centre"""
+    Listing = apps.get_model('listings', 'Listing')
+    batch = []
+    rows = Listing.objects.filter(latitude__isnull=True).only('pk', 'location').iterator(chunk_size=BATCH_SIZE)
+    for listing in rows:
+        point = geocode(listing.location)
+        if point is None:
+            continue
+        listing.latitude, listing.longitude = point
+        listing.geo_cell = grid_cell(*point)
+        batch.append(listing)
+        if len(batch) >= BATCH_SIZE:
+            Listing.objects.bulk_update(batch, ['latitude', 'longitude', 'geo_cell'])
+            batch = []
+    Listing.objects.bulk_update(batch, ['latitude', 'longitude', 'geo_cell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0010_listing_coordinates'),
+    ]
+
+    operations = [
+        migrations.RunPython(geocode_listings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:38
+
+from django.db import migrations, models
+
+# Frozen copies of listings.facets as of this migration: later edits to the
+# facets or the model choices must not change what it counts
+LIVE_LOOKUPS = {'is_active': True, 'availability': 'available'}
+PRICE_BANDS = [(0, 15000), (15000, 30000), (30000, 60000), (60000, 100000), (100000, None)]
+FACET_OPTIONS = (
+    [('property_type', value, {'property_type': value}) for value in ['apartment', 'house', 'room', 'studio', 'shared_room']]
+    + [('furnished', value, {'furnished': value}) for value in ['furnished', 'semi_furnished', 'unfurnished']]
+    + [('bedrooms', str(minimum), {'bedrooms__gte': minimum}) for minimum in [1, 2, 3, 4]]
+    + [
+        ('price', f'{low}-' if high is None else f'{low}-{high}',
+         {'price__gte': low} if high is None else {'price__gte': low, 'price__lte': high})
+        for low, high in PRICE_BANDS
+    ]
+)
+
+
+def count_facets(apps, schema_editor):
+    """Fill the facet summary from the existing live listings"""
+    FacetCount = apps.get_model('listings', 'FacetCount')
+    Listing = apps.get_model('listings', 'Listing')
+    totals = Listing.objects.filter(**LIVE_LOOKUPS).aggregate(**{
+        f'option_{index}': models.Count('pk', filter=models.Q(**lookups))
+        for index, (_, _, lookups) in enumerate(FACET_OPTIONS)
+    })
+    FacetCount.objects.bulk_create(
+        FacetCount(facet=name, value=value, count=totals[f'option_{index}'])
+        for index, (name, value, _) in enumerate(FACET_OPTIONS)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0011_geocode_listings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=30)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('facet', 'value'), name='facet_count_option_unique')],
+            },
+        ),
+        migrations.RunPython(count_facets, migrations.RunPython.noop),
+    ]
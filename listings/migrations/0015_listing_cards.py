@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0014_saved_searches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingCard',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='listings.listing')),
+                ('title', models.CharField(max_length=200)),
+                ('location', models.CharField(max_length=200)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('property_type', models.CharField(max_length=20)),
+                ('bedrooms', models.PositiveIntegerField()),
+                ('bathrooms', models.PositiveIntegerField()),
+                ('favorite_count', models.PositiveIntegerField(default=0)),
+                ('main_image_status', models.CharField(default='ready', max_length=20)),
+                ('image', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+            ],
+        ),
+    ]
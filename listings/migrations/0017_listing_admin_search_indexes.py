@@ -0,0 +1,45 @@
+from django.db import migrations
+
+# The indexes from migration 0003 only cover live listings, which is all the
+# public search can return; the admin searches every row, including by
+# address. Postgres-only, like 0003: other backends use the icontains fallback.
+FORWARD_SQL = [
+    'CREATE INDEX listing_search_vector_all_idx ON listings_listing USING gin (search_vector)',
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+            CREATE INDEX listing_location_trgm_all_idx ON listings_listing USING gin (location gin_trgm_ops);
+            -- address__icontains compiles to a LIKE on UPPER(address)
+            CREATE INDEX listing_address_trgm_idx ON listings_listing USING gin (UPPER(address) gin_trgm_ops);
+        END IF;
+    END
+    $$
+    """,
+]
+
+REVERSE_SQL = [
+    'DROP INDEX IF EXISTS listing_address_trgm_idx',
+    'DROP INDEX IF EXISTS listing_location_trgm_all_idx',
+    'DROP INDEX IF EXISTS listing_search_vector_all_idx',
+]
+
+
+def run_postgres_sql(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0016_listing_views'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_postgres_sql(FORWARD_SQL), run_postgres_sql(REVERSE_SQL)),
+    ]
@@ -1,14 +1,24 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from cloudinary.models import CloudinaryField
 from django.utils import timezone
+from .geo import DEFAULT_RADIUS_KM, haversine_expression, nearby_filter, neighbourhood_point
+from .search import get_search_backend
+
+MEDIA_STATUS_CHOICES = [
+    ('ready', 'Ready'),
+    ('pending', 'Processing'),
+    ('failed', 'Failed'),
+]
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     phone_number = models.CharField(max_length=15, blank=True, null=True)
     bio = models.TextField(max_length=500, blank=True)
     profile_picture = CloudinaryField('profile_pictures', blank=True, null=True)
+    profile_picture_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     is_landlord = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -16,6 +26,97 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
+class ListingQuerySet(models.QuerySet):
+    def live(self):
+        """Listings that are visible on the public feeds"""
+        return self.filter(is_active=True, availability='available')
+
+    def search(self, cleaned_data):
+        """Apply the SearchForm filters to the queryset"""
+        location = cleaned_data.get('location')
+        property_type = cleaned_data.get('property_type')
+        furnished = cleaned_data.get('furnished')
+        min_price = cleaned_data.get('min_price')
+        max_price = cleaned_data.get('max_price')
+        bedrooms = cleaned_data.get('bedrooms')
+        amenities = cleaned_data.get('amenities')
+        point = None
+        if cleaned_data.get('lat') is not None and cleaned_data.get('lng') is not None:
+            point = (cleaned_data['lat'], cleaned_data['lng'])
+        elif cleaned_data.get('near'):
+            point = neighbourhood_point(cleaned_data['near'])
+
+        queryset = self
+        if location:
+            queryset = get_search_backend().search(queryset, location)
+        if property_type:
+            queryset = queryset.filter(property_type=property_type)
+        if furnished:
+            queryset = queryset.filter(furnished=furnished)
+        if min_price:
+            queryset = queryset.filter(price__gte=min_price)
+        if max_price:
+            queryset = queryset.filter(price__lte=max_price)
+        if bedrooms:
+            queryset = queryset.filter(bedrooms__gte=bedrooms)
+        if amenities:
+            queryset = queryset.with_amenities(amenities)
+        if point:
+            # Last, so distance ordering replaces any text-search ranking
+            queryset = queryset.nearby(*point, cleaned_data.get('radius_km') or DEFAULT_RADIUS_KM)
+        if cleaned_data.get('sort') == 'trending':
+            # An explicit sort outranks both relevance and distance
+            queryset = queryset.order_by('-trending_score', '-id')
+        return queryset
+
+    def nearby(self, latitude, longitude, radius_km):
+        """Listings within `radius_km` of the point, nearest first, annotated with `distance_km`
+
+        Grid cell ranges narrow the search to the bounding box through the
+        geo_cell index; the exact haversine distance only runs on those rows.
+        """
+        return (
+            self.filter(nearby_filter(latitude, longitude, radius_km))
+            .annotate(distance_km=haversine_expression(latitude, longitude))
+            .filter(distance_km__lte=radius_km)
+            .order_by('distance_km', '-created_at')
+        )
+
+    def with_amenities(self, slugs):
+        """Listings tagged with every amenity in `slugs`
+
+        Relational division over the (amenity, listing) unique index: each
+        amenity is an index range scan, and only listings matching all of them
+        survive the HAVING clause.
+        """
+        slugs = set(slugs)
+        if not slugs:
+            return self
+        # Literal ids (not a join on slug) let the planner use per-amenity statistics
+        amenity_ids = list(Amenity.objects.filter(slug__in=slugs).values_list('pk', flat=True))
+        if len(amenity_ids) < len(slugs):
+            return self.none()
+        matching = (
+            ListingAmenity.objects.filter(amenity__in=amenity_ids)
+            .values('listing')
+            .annotate(matched=models.Count('amenity'))
+            .filter(matched=len(slugs))
+            .values('listing')
+        )
+        return self.filter(pk__in=matching)
+
+    def with_favorite_state(self, user):
+        """Annotate `is_favorited` for `user` inside the same query (one query per page of cards)"""
+        if not user.is_authenticated:
+            return self.annotate(is_favorited=models.Value(False))
+        favorites = Favorite.objects.filter(user=user, listing=models.OuterRef('pk'))
+        return self.annotate(is_favorited=models.Exists(favorites))
+
+class ListingManager(models.Manager.from_queryset(ListingQuerySet)):
+    def get_queryset(self):
+        # The tsvector is only read inside the database, never by Python code
+        return super().get_queryset().defer('search_vector')
+
 class Listing(models.Model):
     PROPERTY_TYPE_CHOICES = [
         ('apartment', 'Apartment'),
@@ -57,34 +158,139 @@ class Listing(models.Model):
     contact_phone = models.CharField(max_length=15, blank=True)
     contact_email = models.EmailField(blank=True)
     
-    # Amenities (as a text field for now, could be expanded to a separate model)
+    # Filled from the location by the gazetteer in listings.geo unless set explicitly
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    # Grid cell of (latitude, longitude), kept in step on save (see listings.geo)
+    geo_cell = models.IntegerField(blank=True, null=True, editable=False)
+    
+    # Free-text amenity notes, plus the structured tags that search filters on
     amenities = models.TextField(blank=True)
+    amenity_tags = models.ManyToManyField('Amenity', through='ListingAmenity', related_name='listings', blank=True)
     
     # Image fields
     main_image = CloudinaryField('listing_images', blank=True, null=True)
+    # Resized copies generated on upload (see listings.images)
+    main_image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    # Uploads are processed by the media worker (see listings.media)
+    main_image_status = models.CharField(max_length=20, choices=MEDIA_STATUS_CHOICES, default='ready', editable=False)
+
+    # Maintained by the Favorite signals in listings.signals
+    favorite_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Detail page views, written in batches by listings.popularity; the
+    # trending score is their time-decayed total on a log2 scale
+    view_count = models.PositiveIntegerField(default=0, editable=False)
+    trending_score = models.FloatField(default=0, editable=False)
+
+    # Maintained by a database trigger on Postgres (see migration 0003)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ListingManager()
+
+    # Moved only by in-place UPDATEs (the Favorite signals, flush_views); save()
+    # never writes them back, since an instance read before one would undo it
+    COUNTER_FIELDS = frozenset(['favorite_count', 'view_count', 'trending_score'])
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Every public feed filters on these two flags and sorts newest first
+            models.Index(fields=['is_active', 'availability', '-created_at'], name='listing_feed_idx'),
+            # Partial indexes limited to the rows the search views can actually return
+            models.Index(
+                fields=['-created_at'],
+                name='listing_live_created_idx',
+                condition=models.Q(is_active=True, availability='available'),
+            ),
+            models.Index(
+                fields=['property_type', '-created_at'],
+                name='listing_live_type_idx',
+                condition=models.Q(is_active=True, availability='available'),
+            ),
+            models.Index(
+                fields=['price'],
+                name='listing_live_price_idx',
+                condition=models.Q(is_active=True, availability='available'),
+            ),
+            models.Index(
+                fields=['bedrooms', 'price'],
+                name='listing_live_bedrooms_idx',
+                condition=models.Q(is_active=True, availability='available'),
+            ),
+            models.Index(
+                fields=['geo_cell'],
+                name='listing_live_geo_idx',
+                condition=models.Q(is_active=True, availability='available'),
+            ),
+            # The admin changelist's order (-created_at, then -pk as a tie-breaker)
+            models.Index(fields=['-created_at', '-id'], name='listing_created_idx'),
+            # sort=trending
+            models.Index(
+                fields=['-trending_score', '-id'],
+                name='listing_live_trending_idx',
+                condition=models.Q(is_active=True, availability='available'),
+            ),
+        ]
     
     def __str__(self):
         return self.title
     
     def get_absolute_url(self):
         from django.urls import reverse
-        return reverse('listing_detail', kwargs={'pk': self.pk})
+        return reverse('listings:listing_detail', kwargs={'pk': self.pk})
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
 class ListingImage(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='images')
     image = CloudinaryField('listing_images')
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    image_status = models.CharField(max_length=10, choices=MEDIA_STATUS_CHOICES, default='ready', editable=False)
     caption = models.CharField(max_length=200, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['uploaded_at']
+        indexes = [
+            # The admin changelist's order (uploaded_at, then -pk as a tie-breaker)
+            models.Index(fields=['uploaded_at', '-id'], name='listingimage_uploaded_idx'),
+        ]
     
     def __str__(self):
         return f"Image for {self.listing.title}"
 
+class Amenity(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    slug = models.SlugField(max_length=50, unique=True)
+
+    class Meta:
+        ordering = ['name']
+        verbose_name_plural = 'amenities'
+
+    def __str__(self):
+        return self.name
+
+class ListingAmenity(models.Model):
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE)
+    amenity = models.ForeignKey(Amenity, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            # Amenity first: the search filter looks up listings by amenity
+            models.UniqueConstraint(fields=['amenity', 'listing'], name='listing_amenity_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.amenity} at {self.listing}"
+
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorites')
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='favorited_by')
@@ -93,6 +299,131 @@ class Favorite(models.Model):
     class Meta:
         unique_together = ['user', 'listing']
         ordering = ['-created_at']
+        indexes = [
+            # The admin changelist's order (-created_at, then -pk as a tie-breaker)
+            models.Index(fields=['-created_at', '-id'], name='favorite_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} favorited {self.listing.title}"
+
+
+class FacetCount(models.Model):
+    """Live listings per search facet option (see listings.facets)
+
+    Kept current by the Listing signals; `rebuild_facets` recounts from scratch.
+    """
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=30)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'value'], name='facet_count_option_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.facet}={self.value}: {self.count}"
+
+
+class ListingCard(models.Model):
+    """The columns a listing card shows, denormalized for the feeds (see listings.cards)
+
+    Written on every Listing save that changes them, so a feed page reads a
+    dozen narrow rows instead of whole listings with their long text fields.
+    """
+    listing = models.OneToOneField(Listing, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    title = models.CharField(max_length=200)
+    location = models.CharField(max_length=200)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    property_type = models.CharField(max_length=20)
+    bedrooms = models.PositiveIntegerField()
+    bathrooms = models.PositiveIntegerField()
+    favorite_count = models.PositiveIntegerField(default=0)
+    main_image_status = models.CharField(max_length=20, default='ready')
+    # Card-size picture URLs: {'src', 'jpeg', 'webp'} (srcsets), or {} without a photo
+    image = models.JSONField(default=dict)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.title
+
+
+class SavedSearch(models.Model):
+    """A tenant's SearchForm filters, matched against new listings (see listings.saved_searches)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_searches')
+    name = models.CharField(max_length=200)
+    # SearchForm cleaned_data as normalize_params returns it
+    params = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_notified_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'params'], name='saved_search_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.name}"
+
+
+class UnmatchedListing(models.Model):
+    """A listing that went live and has not been checked against the saved searches yet"""
+    listing = models.OneToOneField(Listing, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    queued_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Listing #{self.listing_id}"
+
+
+class SavedSearchMatch(models.Model):
+    """A new listing for a saved search, waiting for (or already in) a digest email"""
+    saved_search = models.ForeignKey(SavedSearch, on_delete=models.CASCADE, related_name='matches')
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['saved_search', 'listing'], name='saved_search_match_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['saved_search'], condition=models.Q(sent_at__isnull=True), name='saved_search_match_unsent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.saved_search} -> {self.listing_id}"
+
+
+class MediaJob(models.Model):
+    """A deferred image upload, processed by the `process_media_jobs` worker"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    model_label = models.CharField(max_length=100)
+    object_id = models.PositiveBigIntegerField()
+    field_name = models.CharField(max_length=100)
+    staged_name = models.CharField(max_length=255)
+    original_name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_after']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='mediajob_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model_label}#{self.object_id}.{self.field_name} ({self.status})"
@@ -0,0 +1,134 @@
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.db.models import F
+
+from .models import Listing
+
+logger = logging.getLogger(__name__)
+
+# Trending scores are log2(sum of views * 2^((viewed_at - epoch) / half-life)).
+# Instead of decaying every row as time passes, each new view counts for more,
+# which orders listings the same way: one UPDATE per flush, and the index on
+# the score never has to be rebuilt. The log keeps the values small.
+TRENDING_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp()
+FLUSH_BATCH_SIZE = 500
+# 2^-60 of a score is below float precision, and Postgres raises on underflow
+MIN_EXPONENT = -60
+
+
+def half_life_seconds():
+    return getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24) * 3600
+
+
+def view_score(views, now=None):
+    """Trending score of `views` views at `now`"""
+    now = time.time() if now is None else now
+    return math.log2(views) + (now - TRENDING_EPOCH) / half_life_seconds()
+
+
+def recent_views(score, now=None):
+    """How many views at `now` a trending score is worth, e.g. for display"""
+    now = time.time() if now is None else now
+    return 2 ** (score - (now - TRENDING_EPOCH) / half_life_seconds())
+
+
+def add_scores(old, new):
+    """log2(2^old + 2^new), computed from the larger of the two so it cannot overflow"""
+    high, low = max(old, new), min(old, new)
+    return high + math.log2(1 + 2 ** max(low - high, MIN_EXPONENT))
+
+
+def flush_views(counts, now=None, using=DEFAULT_DB_ALIAS):
+    """Add {listing id: views} to the listings' counters in batched UPDATE ... FROM (VALUES ...)
+
+    The new score is log2(2^old + 2^batch), see add_scores. Rows are updated
+    in id order, so concurrent flushes from several processes lock them in
+    the same order. Other databases get one UPDATE per listing instead.
+    """
+    now = time.time() if now is None else now
+    rows = sorted((pk, views, view_score(views, now)) for pk, views in counts.items() if views > 0)
+    if connections[using].vendor != 'postgresql':
+        return flush_views_per_row(rows, using)
+    table = connections[using].ops.quote_name(Listing._meta.db_table)
+    with connections[using].cursor() as cursor:
+        for start in range(0, len(rows), FLUSH_BATCH_SIZE):
+            batch = rows[start:start + FLUSH_BATCH_SIZE]
+            values = ', '.join(['(%s::bigint, %s::integer, %s::double precision)'] * len(batch))
+            cursor.execute(
+                f'UPDATE {table} AS listing '
+                'SET view_count = listing.view_count + batch.views, '
+                'trending_score = GREATEST(listing.trending_score, batch.score) + LN(1 + POWER(2, GREATEST('
+                'LEAST(listing.trending_score, batch.score) - GREATEST(listing.trending_score, batch.score), %s'
+                '))) / LN(2) '
+                f'FROM (VALUES {values}) AS batch (id, views, score) '
+                'WHERE listing.id = batch.id',
+                [MIN_EXPONENT] + [value for row in batch for value in row],
+            )
+    return len(rows)
+
+
+def flush_views_per_row(rows, using):
+    """flush_views for databases without UPDATE ... FROM: scores are added in Python
+
+    The old scores are read under select_for_update, which locks the rows
+    where the database supports it (SQLite serializes writers anyway).
+    """
+    with transaction.atomic(using=using):
+        scores = dict(
+            Listing.objects.using(using).select_for_update()
+            .filter(pk__in=[pk for pk, _, _ in rows]).order_by('pk').values_list('pk', 'trending_score')
+        )
+        for pk, views, score in rows:
+            if pk in scores:
+                Listing.objects.using(using).filter(pk=pk).update(
+                    view_count=F('view_count') + views, trending_score=add_scores(scores[pk], score),
+                )
+    return len(rows)
+
+
+class ViewBuffer:
+    """Listing views counted in memory and written in batches
+
+    Recording a view is a dict increment under a lock. The buffer asks to be
+    flushed once LISTING_VIEW_FLUSH_SECONDS have passed, so the primary sees
+    a few batched UPDATEs per interval per process however busy the detail
+    pages are. Views still buffered when a process is killed are lost, which
+    a popularity ranking can afford.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    def record(self, listing_id):
+        """Count one view; returns True when the buffer is due for a flush"""
+        with self.lock:
+            self.counts[listing_id] += 1
+            return time.monotonic() - self.last_flush >= getattr(settings, 'LISTING_VIEW_FLUSH_SECONDS', 10)
+
+    def flush(self):
+        """Write out the buffered views; returns the number of listings updated"""
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            self.last_flush = time.monotonic()
+        if not counts:
+            return 0
+        try:
+            return flush_views(counts)
+        except DatabaseError:
+            # Keep them for the next flush rather than fail the page view
+            logger.exception('Could not flush %d listing view counts', len(counts))
+            with self.lock:
+                self.counts.update(counts)
+            return 0
+
+
+view_buffer = ViewBuffer()
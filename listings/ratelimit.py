@@ -0,0 +1,208 @@
+import logging
+import math
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+THROTTLED_MESSAGE = 'Too many requests. Please wait a moment and try again.'
+
+
+def parse_rate(rate):
+    """'30/m' -> (30, 60): requests allowed per period in seconds"""
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period]
+
+
+def get_cache():
+    return caches[getattr(settings, 'RATELIMIT_CACHE_ALIAS', '') or 'default']
+
+
+def window_keys(key, period, now):
+    """Cache keys of the current and previous fixed windows, and seconds into the current one"""
+    window = int(now // period)
+    return f'ratelimit:{key}:{period}:{window}', f'ratelimit:{key}:{period}:{window - 1}', now - window * period
+
+
+def evaluate(current, previous, limit, period, elapsed):
+    """Seconds to wait before the next request fits the budget, 0 if it fits now
+
+    The sliding window estimate counts all of the current window plus the
+    part of the previous one still inside the last `period` seconds. The
+    budget so refills smoothly, like a token bucket, instead of resetting
+    all at once on the window boundary.
+    """
+    weight = 1 - elapsed / period
+    if previous * weight + current < limit:
+        return 0
+    if current < limit:
+        # Wait for the previous window to slide far enough out
+        wait = period * (1 - (limit - current) / previous) - elapsed
+    else:
+        # The current window alone is over: wait for it to become the previous one and slide
+        wait = period - elapsed + period * (1 - limit / current)
+    return max(math.ceil(wait), 1)
+
+
+def hit(key, rate, now=None):
+    """Count a request against `key`'s budget; returns the Retry-After seconds, 0 if allowed
+
+    Two cache round trips whatever the traffic: one read of both window
+    counters and one increment. Refused requests are not counted, so a
+    client that keeps retrying gets back in once it slows down.
+    """
+    limit, period = parse_rate(rate)
+    current_key, previous_key, elapsed = window_keys(key, period, time.time() if now is None else now)
+    cache = get_cache()
+    counts = cache.get_many([current_key, previous_key])
+    retry_after = evaluate(counts.get(current_key, 0), counts.get(previous_key, 0), limit, period, elapsed)
+    if not retry_after:
+        # Kept for two periods: it is read as the previous window after this one
+        if not cache.add(current_key, 1, period * 2):
+            cache.incr(current_key)
+    return retry_after
+
+
+async def ahit(key, rate, now=None):
+    limit, period = parse_rate(rate)
+    current_key, previous_key, elapsed = window_keys(key, period, time.time() if now is None else now)
+    cache = get_cache()
+    counts = await cache.aget_many([current_key, previous_key])
+    retry_after = evaluate(counts.get(current_key, 0), counts.get(previous_key, 0), limit, period, elapsed)
+    if not retry_after:
+        if not await cache.aadd(current_key, 1, period * 2):
+            await cache.aincr(current_key)
+    return retry_after
+
+
+def client_ip(request):
+    """The client's address, read from X-Forwarded-For behind RATELIMIT_TRUSTED_PROXIES proxies
+
+    Each trusted proxy appends the address it received the request from, so
+    the client is that many entries from the right; anything further left is
+    whatever the client chose to send.
+    """
+    proxies = getattr(settings, 'RATELIMIT_TRUSTED_PROXIES', 0)
+    if proxies:
+        forwarded = [address.strip() for address in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        forwarded = [address for address in forwarded if address]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def budget(request, scope, user=None):
+    """(cache key, rate) a request counts against in `scope`, or None if it has no limit
+
+    Signed-in users spend their own budget wherever they connect from;
+    anonymous requests share their address's.
+    """
+    if not getattr(settings, 'RATELIMIT_ENABLED', True):
+        return None
+    rates = getattr(settings, 'RATELIMITS', {}).get(scope, {})
+    if user is not None and user.is_authenticated and rates.get('user'):
+        return f'{scope}:user:{user.pk}', rates['user']
+    if rates.get('ip'):
+        return f'{scope}:ip:{client_ip(request)}', rates['ip']
+    return None
+
+
+def too_many_requests(request, retry_after):
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        response = JsonResponse({'error': THROTTLED_MESSAGE, 'retry_after': retry_after}, status=429)
+    else:
+        response = HttpResponse(THROTTLED_MESSAGE, status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def ratelimit(scope, methods=None):
+    """Refuse requests over the view's RATELIMITS[scope] budget with a 429
+
+    Only requests whose method is in `methods` are counted, when given, so a
+    form view can throttle submissions without throttling the empty form.
+    Works for sync and async views; put it under login_required so the user
+    is known.
+    """
+    def applies(request):
+        return methods is None or request.method in methods
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if applies(request):
+                    limit = budget(request, scope, await request.auser())
+                    retry_after = limit and await ahit(*limit)
+                    if retry_after:
+                        return too_many_requests(request, retry_after)
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if applies(request):
+                limit = budget(request, scope, request.user)
+                retry_after = limit and hit(*limit)
+                if retry_after:
+                    return too_many_requests(request, retry_after)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RateLimitMiddleware:
+    """Per-address budget over every request (RATELIMITS['global']), off unless configured
+
+    A flood guard ahead of the sessions, auth and views, so refused requests
+    cost two cache round trips and no queries. Static and media files are
+    not counted. The tighter per-view budgets are the ratelimit decorator's.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        self.exempt_prefixes = tuple(
+            '/' + url.lstrip('/') for url in (settings.STATIC_URL, settings.MEDIA_URL) if url and url != '/'
+        )
+        self.warned_about_proxy = False
+
+    def limit(self, request):
+        if request.path.startswith(self.exempt_prefixes):
+            return None
+        limit = budget(request, 'global')
+        if limit and not self.warned_about_proxy and 'HTTP_X_FORWARDED_FOR' in request.META \
+                and not getattr(settings, 'RATELIMIT_TRUSTED_PROXIES', 0):
+            # Behind a proxy every visitor arrives from its address and shares one budget
+            logger.error(
+                'Requests carry X-Forwarded-For but RATELIMIT_TRUSTED_PROXIES is 0: the global rate '
+                'limit counts every client behind the proxy as one address'
+            )
+            self.warned_about_proxy = True
+        return limit
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        limit = self.limit(request)
+        retry_after = limit and hit(*limit)
+        if retry_after:
+            return too_many_requests(request, retry_after)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        limit = self.limit(request)
+        retry_after = limit and await ahit(*limit)
+        if retry_after:
+            return too_many_requests(request, retry_after)
+        return await self.get_response(request)
@@ -0,0 +1,105 @@
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'db_primary_pin'
+SAFE_METHODS = ('GET', 'HEAD')
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def replica_alias():
+    return getattr(settings, 'DATABASE_READ_REPLICA', '')
+
+
+class ReplicaRouter:
+    """Sends reads made inside `read_from_replica` views to the replica
+
+    Everything else, writes included, stays on default.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as default
+        aliases = {DEFAULT_DB_ALIAS, replica_alias() or DEFAULT_DB_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if replica_alias() and db == replica_alias():
+            return False
+        return None
+
+
+def read_from_replica(view):
+    """Run a read-only view's queries against the replica
+
+    Skipped for unsafe methods and for browsers that wrote recently (see
+    PrimaryPinMiddleware), which keep reading from default. Works for sync
+    and async views; sync_to_async carries the choice into ORM threads.
+    """
+    def use_replica(request):
+        alias = replica_alias()
+        if alias and request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES:
+            return alias
+        return None
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            token = _read_alias.set(use_replica(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _read_alias.set(use_replica(request))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+    return wrapper
+
+
+class PrimaryPinMiddleware:
+    """Pin a browser to default for a few seconds after it writes
+
+    Replication lag would otherwise hide a user's own new listing or
+    favorite on the page they are redirected to.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.pin(request, await self.get_response(request))
+
+    def pin(self, request, response):
+        if replica_alias() and request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 10),
+                httponly=True, samesite='Lax',
+            )
+        return response
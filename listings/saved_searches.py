@@ -0,0 +1,259 @@
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal
+from itertools import groupby
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from .facets import LIVE_LOOKUPS, PRICE_BANDS
+from .geo import DEFAULT_RADIUS_KM, GAZETTEER, haversine_km, neighbourhood_point
+from .models import Amenity, Listing, SavedSearch, SavedSearchMatch, UnmatchedListing
+from .search import get_search_backend
+
+# Lower bounds of PRICE_BANDS after the first; bisecting a price gives its band
+BAND_EDGES = [low for low, _ in PRICE_BANDS[1:]]
+MATCH_BATCH_SIZE = 500
+INDEX_CHUNK_SIZE = 5000
+DIGEST_CHUNK_SIZE = 2000
+# Listings shown per saved search in a digest; the rest are behind its search link
+DIGEST_LISTINGS_PER_SEARCH = 10
+
+
+def price_band(price):
+    return bisect_right(BAND_EDGES, price)
+
+
+def search_bands(params):
+    """Price bands a saved search can match a listing in"""
+    low = price_band(Decimal(params['min_price'])) if params.get('min_price') else 0
+    high = price_band(Decimal(params['max_price'])) if params.get('max_price') else len(BAND_EDGES)
+    return range(low, high + 1)
+
+
+def search_point(params):
+    if params.get('lat') is not None and params.get('lng') is not None:
+        return params['lat'], params['lng']
+    if params.get('near') in GAZETTEER:
+        return neighbourhood_point(params['near'])
+    return None
+
+
+def compile_filters(params):
+    """A saved search's filters, parsed once when the index is loaded
+
+    The property type is left out: the index bucket already settles it.
+    """
+    return (
+        params.get('furnished'),
+        Decimal(params['min_price']) if params.get('min_price') else None,
+        Decimal(params['max_price']) if params.get('max_price') else None,
+        params.get('bedrooms'),
+        frozenset(params.get('amenities', ())),
+        search_point(params),
+        params.get('radius_km') or DEFAULT_RADIUS_KM,
+        params.get('location'),
+    )
+
+
+def matches_filters(listing, amenity_slugs, filters):
+    """Whether `listing` passes the structured filters of ListingQuerySet.search
+
+    The location text is left to the search backend, see SavedSearchIndex.match.
+    """
+    furnished, min_price, max_price, bedrooms, amenities, point, radius_km, _ = filters
+    if furnished and listing.furnished != furnished:
+        return False
+    if min_price and listing.price < min_price:
+        return False
+    if max_price and listing.price > max_price:
+        return False
+    if bedrooms and listing.bedrooms < bedrooms:
+        return False
+    if amenities and not amenities <= amenity_slugs:
+        return False
+    if point:
+        if listing.latitude is None or listing.longitude is None:
+            return False
+        if haversine_km(*point, listing.latitude, listing.longitude) > radius_km:
+            return False
+    return True
+
+
+class SavedSearchIndex:
+    """Saved searches bucketed by property type and price band
+
+    A new listing is only compared with the searches in its own two buckets
+    (its property type, and searches of any type) for its price band, so the
+    cost of matching one listing does not grow with every saved search.
+    """
+
+    def __init__(self):
+        # (property type or '', price band) -> [(saved search id, compiled filters)]
+        self.buckets = defaultdict(list)
+        self.size = 0
+
+    @classmethod
+    def load(cls, queryset=None):
+        index = cls()
+        queryset = SavedSearch.objects.all() if queryset is None else queryset
+        for pk, params in queryset.order_by().values_list('pk', 'params').iterator(chunk_size=INDEX_CHUNK_SIZE):
+            index.add(pk, params)
+        return index
+
+    def add(self, pk, params):
+        entry = (pk, compile_filters(params))
+        for band in search_bands(params):
+            self.buckets[params.get('property_type', ''), band].append(entry)
+        self.size += 1
+
+    def candidates(self, listing):
+        band = price_band(listing.price)
+        return self.buckets.get((listing.property_type, band), []) + self.buckets.get(('', band), [])
+
+    def match(self, listing, amenity_slugs):
+        """Ids of the saved searches `listing` satisfies"""
+        matched = []
+        by_location = defaultdict(list)
+        for pk, filters in self.candidates(listing):
+            if not matches_filters(listing, amenity_slugs, filters):
+                continue
+            if filters[-1]:
+                by_location[filters[-1]].append(pk)
+            else:
+                matched.append(pk)
+        # Text matching stays with the search backend so results agree with the
+        # search page; one query per distinct phrase among the remaining candidates
+        for location, pks in by_location.items():
+            if get_search_backend().search(Listing.objects.filter(pk=listing.pk), location).exists():
+                matched.extend(pks)
+        return matched
+
+
+def queue_listing(listing, using=None):
+    """Have the next `send_search_digests` run check a newly live listing"""
+    UnmatchedListing.objects.using(using).bulk_create([UnmatchedListing(listing_id=listing.pk)], ignore_conflicts=True)
+
+
+def match_new_listings(index=None, batch_size=MATCH_BATCH_SIZE):
+    """Check the queued listings against every saved search; returns the number of matches
+
+    Queued rows are claimed with SKIP LOCKED, so concurrent runs split the
+    queue. Listings no longer live by now are dropped without matching.
+    """
+    index = SavedSearchIndex.load() if index is None else index
+    matched = 0
+    while True:
+        with transaction.atomic():
+            queued = list(
+                UnmatchedListing.objects.select_for_update(skip_locked=True)
+                .order_by('queued_at').values_list('listing_id', flat=True)[:batch_size]
+            )
+            if not queued:
+                break
+            listings = Listing.objects.live().filter(pk__in=queued).prefetch_related(
+                Prefetch('amenity_tags', queryset=Amenity.objects.only('slug'))
+            )
+            matches = [
+                SavedSearchMatch(saved_search_id=pk, listing=listing)
+                for listing in listings
+                for pk in index.match(listing, {amenity.slug for amenity in listing.amenity_tags.all()})
+            ]
+            SavedSearchMatch.objects.bulk_create(matches, ignore_conflicts=True)
+            UnmatchedListing.objects.filter(listing_id__in=queued).delete()
+        matched += len(matches)
+    return matched
+
+
+def is_live(listing):
+    return all(getattr(listing, field) == value for field, value in LIVE_LOOKUPS.items())
+
+
+def search_url(params):
+    query = urlencode(params, doseq=True)
+    return f'{settings.SITE_URL}{reverse("listings:search")}?{query}'
+
+
+def digest_message(user, matches):
+    """The digest email for one user's unsent matches, ordered by saved search"""
+    searches = []
+    for saved_search, search_matches in groupby(matches, key=lambda match: match.saved_search):
+        listings = [match.listing for match in search_matches if is_live(match.listing)]
+        if listings:
+            searches.append({
+                'name': saved_search.name,
+                'url': search_url(saved_search.params),
+                'listings': [
+                    {'listing': listing, 'url': f'{settings.SITE_URL}{listing.get_absolute_url()}'}
+                    for listing in listings[:DIGEST_LISTINGS_PER_SEARCH]
+                ],
+                'more': max(len(listings) - DIGEST_LISTINGS_PER_SEARCH, 0),
+            })
+    if not searches:
+        return None
+    total = sum(len(search['listings']) + search['more'] for search in searches)
+    body = render_to_string('listings/emails/search_digest.txt', {
+        'user': user,
+        'searches': searches,
+        'total': total,
+        'manage_url': f'{settings.SITE_URL}{reverse("listings:saved_searches")}',
+    })
+    return EmailMessage(f'{total} new listing(s) for your saved searches', body, to=[user.email])
+
+
+def send_digests():
+    """Email each user their unsent matches in one message; returns the number of emails
+
+    Matches are marked sent per user, so a failure part way through only
+    repeats the digests that were not sent yet. Matches whose listing has
+    gone off the market since are marked sent without being shown.
+    """
+    unsent = (
+        SavedSearchMatch.objects.filter(sent_at__isnull=True)
+        .select_related('saved_search__user', 'listing')
+        .order_by('saved_search__user_id', 'saved_search_id', '-listing__created_at')
+    )
+    sent = 0
+    with get_connection() as connection:
+        for user, matches in groupby(unsent.iterator(chunk_size=DIGEST_CHUNK_SIZE), key=lambda match: match.saved_search.user):
+            matches = list(matches)
+            message = digest_message(user, matches) if user.email else None
+            if message:
+                connection.send_messages([message])
+                sent += 1
+            now = timezone.now()
+            SavedSearchMatch.objects.filter(pk__in=[match.pk for match in matches]).update(sent_at=now)
+            SavedSearch.objects.filter(pk__in={match.saved_search_id for match in matches}).update(last_notified_at=now)
+    return sent
+
+
+def describe(params):
+    """A short name for a saved search, e.g. 'Apartment, 2+ bedrooms, up to KSh 30,000'"""
+    parts = []
+    if params.get('location'):
+        parts.append(f"'{params['location']}'")
+    if params.get('property_type'):
+        parts.append(dict(Listing.PROPERTY_TYPE_CHOICES).get(params['property_type'], params['property_type']))
+    if params.get('furnished'):
+        parts.append(dict(Listing.FURNISHED_CHOICES).get(params['furnished'], params['furnished']))
+    if params.get('bedrooms'):
+        parts.append(f"{params['bedrooms']}+ bedrooms")
+    if params.get('min_price') and params.get('max_price'):
+        parts.append(f"KSh {Decimal(params['min_price']):,.0f} - {Decimal(params['max_price']):,.0f}")
+    elif params.get('min_price'):
+        parts.append(f"from KSh {Decimal(params['min_price']):,.0f}")
+    elif params.get('max_price'):
+        parts.append(f"up to KSh {Decimal(params['max_price']):,.0f}")
+    if params.get('near') in GAZETTEER:
+        parts.append(f"near {GAZETTEER[params['near']][0]}")
+    elif params.get('lat') is not None:
+        parts.append('near a point on the map')
+    if params.get('amenities'):
+        parts.append(', '.join(params['amenities']))
+    return ', '.join(parts)[:200] or 'All listings'
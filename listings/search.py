@@ -0,0 +1,66 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connections
+from django.db.models import F, Q, Value
+from django.utils.module_loading import import_string
+
+
+class SimpleSearchBackend:
+    """Portable fallback that works on any database (used for SQLite dev setups)"""
+
+    fields = ['location', 'title', 'amenities', 'description']
+
+    def search(self, queryset, text):
+        query = Q()
+        for field in self.fields:
+            query |= Q(**{f'{field}__icontains': text})
+        return queryset.filter(query)
+
+
+class PostgresSearchBackend:
+    """Full-text search over the search_vector column plus pg_trgm matching on location
+
+    Both conditions are served by the GIN indexes created in migration 0003, so
+    matching and ranking happen in a single indexed query.
+    """
+
+    config = 'english'
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    @property
+    def has_trigram(self):
+        return _has_extension(self.using, 'pg_trgm')
+
+    def search(self, queryset, text):
+        query = SearchQuery(text, search_type='websearch', config=self.config)
+        condition = Q(search_vector=query)
+        rank = SearchRank(F('search_vector'), query)
+
+        # Typo-tolerant neighbourhood matching ("Kilimni" -> "Kilimani")
+        if self.has_trigram:
+            condition |= Q(location__trigram_word_similar=text)
+            rank = rank + TrigramWordSimilarity(Value(text), 'location')
+
+        return queryset.filter(condition).annotate(rank=rank).order_by('-rank', '-created_at')
+
+
+@lru_cache
+def _has_extension(using, name):
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_extension WHERE extname = %s', [name])
+        return cursor.fetchone() is not None
+
+
+@lru_cache
+def get_search_backend():
+    """Return the configured search backend, picking one from the DB vendor by default"""
+    backend_path = getattr(settings, 'LISTING_SEARCH_BACKEND', '')
+    if backend_path:
+        return import_string(backend_path)()
+    if connections['default'].vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return SimpleSearchBackend()
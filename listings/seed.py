@@ -0,0 +1,267 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from .amenities import AMENITIES
+from .cache import bump_listing_generation
+from .cards import rebuild_cards
+from .facets import rebuild_facet_counts
+from .geo import GAZETTEER, grid_cell
+from .images import IMAGE_FIELDS, generate_derivatives
+from .models import Amenity, Favorite, Listing, ListingAmenity, ListingCard, ListingImage, UserProfile
+
+SEED_PASSWORD = 'roomlink-seed'
+
+# Neighbourhood slug -> (share of listings, rent multiplier)
+NEIGHBOURHOODS = {
+    'kilimani': (12, 1.2), 'westlands': (10, 1.4), 'kileleshwa': (8, 1.3), 'lavington': (6, 1.6),
+    'south-b': (6, 0.8), 'parklands': (5, 1.1), 'south-c': (5, 0.85), 'ngong-road': (5, 1.0),
+    'rongai': (5, 0.5), 'embakasi': (5, 0.5), 'roysambu': (5, 0.5), 'upper-hill': (4, 1.3),
+    'hurlingham': (4, 1.2), 'langata': (4, 0.9), 'eastleigh': (4, 0.6), 'buruburu': (4, 0.55),
+    'kasarani': (4, 0.5), 'ruaka': (4, 0.7), 'karen': (3, 2.2), 'madaraka': (3, 0.8),
+    'donholm': (3, 0.5), 'kahawa': (3, 0.45), 'syokimau': (3, 0.55), 'kawangware': (3, 0.35),
+    'runda': (2, 2.5), 'cbd': (2, 0.9), 'riverside': (2, 1.6), 'pangani': (2, 0.6),
+    'ngara': (2, 0.6), 'thome': (2, 0.7), 'ruaraka': (2, 0.55), 'dagoretti': (2, 0.45),
+    'gigiri': (1, 2.3), 'muthaiga': (1, 2.5), 'spring-valley': (1, 2.0), 'kitisuru': (1, 2.0),
+    'loresho': (1, 1.7),
+}
+
+# Property type -> (share of listings, base monthly rent in KSh, bedroom counts to draw from)
+PROPERTY_TYPES = {
+    'apartment': (45, 35000, [1, 1, 2, 2, 2, 3, 3]),
+    'studio': (18, 18000, [1]),
+    'room': (15, 9000, [1]),
+    'house': (12, 90000, [3, 3, 4, 4, 5]),
+    'shared_room': (10, 6000, [1]),
+}
+
+FURNISHED = {'unfurnished': (55, 1.0), 'semi_furnished': (20, 1.1), 'furnished': (25, 1.25)}
+AVAILABILITY = {'available': 80, 'rented': 15, 'pending': 5}
+
+# Chance that a listing of any type mentions each amenity; houses and apartments override a few
+AMENITY_ODDS = {
+    'water': 0.9, 'electricity': 0.85, 'security': 0.7, 'parking': 0.6, 'wifi': 0.35,
+    'backup-power': 0.25, 'balcony': 0.3, 'garden': 0.2, 'laundry': 0.2, 'cable-tv': 0.2,
+    'lift': 0.05, 'gym': 0.1, 'swimming-pool': 0.08, 'pet-friendly': 0.1,
+}
+AMENITY_ODDS_BY_TYPE = {
+    'house': {'parking': 0.95, 'garden': 0.7, 'pet-friendly': 0.3},
+    'apartment': {'lift': 0.35, 'gym': 0.2, 'swimming-pool': 0.15},
+}
+
+STREETS = ['Argwings Kodhek', 'Ngong', 'Waiyaki Way', 'James Gichuru', 'Mombasa', 'Thika', 'Langata',
+           'Kiambu', 'Jogoo', 'Dennis Pritt', 'Lenana', 'Riverside Drive', 'Rhapta', 'Muthithi']
+
+AMENITY_NAMES = {slug: name for slug, name, _ in AMENITIES}
+
+PLACEHOLDER_COLOURS = ['#8d6e63', '#607d8b', '#a1887f', '#90a4ae', '#bcaaa4', '#78909c', '#c5cae9', '#b2dfdb']
+
+
+def weighted(rng, table):
+    """Draw a key from {key: weight} or {key: (weight, ...)}"""
+    keys = list(table)
+    weights = [value[0] if isinstance(value, tuple) else value for value in table.values()]
+    return rng.choices(keys, weights)[0]
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+@contextmanager
+def explicit_timestamps(model):
+    """Let bulk_create keep the created_at/updated_at values we generate"""
+    fields = [field for field in model._meta.concrete_fields if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def placeholder_manifests(count):
+    """Derivative manifests for `count` generated placeholder photos
+
+    Derivative names are content-addressed, so seeded rows share these files
+    and repeated runs reuse them.
+    """
+    manifests = []
+    sizes = IMAGE_FIELDS['Listing']['main_image']
+    for colour in PLACEHOLDER_COLOURS[:count]:
+        image = Image.new('RGB', (1600, 1067), colour)
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((500, 400, 1100, 900), outline='white', width=12)
+        draw.polygon([(450, 420), (800, 180), (1150, 420)], outline='white', width=12)
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', quality=85)
+        manifests.append(generate_derivatives(SimpleUploadedFile('placeholder.jpg', buffer.getvalue()), sizes))
+    return manifests
+
+
+def make_users(rng, prefix, count, landlord_share):
+    start = User.objects.filter(username__startswith=prefix).count()
+    password = make_password(SEED_PASSWORD)
+    now = timezone.now()
+    users = User.objects.bulk_create(
+        User(
+            username=f'{prefix}{n}', email=f'{prefix}{n}@example.com', password=password,
+            first_name=rng.choice(['Wanjiru', 'Otieno', 'Achieng', 'Kamau', 'Njeri', 'Mwangi', 'Akinyi', 'Kiprop']),
+            last_name=rng.choice(['Mutua', 'Odhiambo', 'Wambui', 'Kariuki', 'Chebet', 'Omondi', 'Njoroge']),
+            date_joined=now,
+        )
+        for n in range(start, start + count)
+    )
+    landlords = set(rng.sample(range(len(users)), max(1, round(len(users) * landlord_share))))
+    UserProfile.objects.bulk_create(
+        UserProfile(user=user, phone_number=f'07{rng.randrange(10**8):08d}', is_landlord=n in landlords)
+        for n, user in enumerate(users)
+    )
+    return [users[n] for n in sorted(landlords)], users
+
+
+def make_listing(rng, landlord, now):
+    neighbourhood = weighted(rng, NEIGHBOURHOODS)
+    name, latitude, longitude, _ = GAZETTEER[neighbourhood]
+    rent_multiplier = NEIGHBOURHOODS[neighbourhood][1]
+    property_type = weighted(rng, PROPERTY_TYPES)
+    _, base_rent, bedroom_counts = PROPERTY_TYPES[property_type]
+    bedrooms = rng.choice(bedroom_counts)
+    furnished = weighted(rng, FURNISHED)
+
+    price = base_rent * rent_multiplier * FURNISHED[furnished][1] * (1 + 0.15 * (bedrooms - 1))
+    price = max(round(price * rng.lognormvariate(0, 0.25) / 500) * 500, 2000)
+
+    odds = {**AMENITY_ODDS, **AMENITY_ODDS_BY_TYPE.get(property_type, {})}
+    amenity_slugs = [slug for slug, _, _ in AMENITIES if rng.random() < odds.get(slug, 0)]
+
+    label = dict(Listing.PROPERTY_TYPE_CHOICES)[property_type]
+    title = f'{bedrooms} bedroom {label.lower()} in {name}' if property_type in ('apartment', 'house') else f'{label} to let in {name}'
+
+    # Recent listings are more common than old ones
+    created_at = now - timedelta(days=365 * rng.random() ** 2, seconds=rng.randrange(86400))
+    latitude += rng.gauss(0, 0.008)
+    longitude += rng.gauss(0, 0.008)
+    listing = Listing(
+        title=title,
+        description=f'{title}. Close to shops and public transport, {rng.randint(2, 20)} minutes from {rng.choice(STREETS)} Road.',
+        property_type=property_type,
+        furnished=furnished,
+        location=name,
+        address=f'{rng.choice(STREETS)} Road, {name}',
+        price=price,
+        bedrooms=bedrooms,
+        bathrooms=max(1, bedrooms - rng.choice([0, 0, 1])),
+        availability=weighted(rng, AVAILABILITY),
+        posted_by=landlord,
+        created_at=created_at,
+        updated_at=created_at + timedelta(hours=rng.random() * 48),
+        is_active=rng.random() < 0.95,
+        contact_phone=f'07{rng.randrange(10**8):08d}',
+        amenities=', '.join(AMENITY_NAMES[slug] for slug in amenity_slugs),
+        latitude=latitude,
+        longitude=longitude,
+        geo_cell=grid_cell(latitude, longitude),
+    )
+    return listing, amenity_slugs
+
+
+def seed_dataset(users=100, listings=1000, gallery=2, favorites=2000, batch_size=5000,
+                 seed=None, prefix='seed-user-', landlord_share=0.3, log=None):
+    """Bulk-insert a synthetic Nairobi dataset and return row counts per table
+
+    Signals do not run for bulk_create, so everything they maintain (grid
+    cells, amenity tags, favorite counters, facet counts, the search
+    generation) is filled in here; the search vector comes from the Postgres trigger.
+    """
+    log = log or (lambda message: None)
+    rng = random.Random(seed)
+    now = timezone.now()
+    counts = {}
+
+    landlords, all_users = make_users(rng, prefix, users, landlord_share)
+    counts['users'] = counts['profiles'] = len(all_users)
+    log(f'{len(all_users)} users and profiles ({len(landlords)} landlords)')
+
+    manifests = placeholder_manifests(len(PLACEHOLDER_COLOURS)) if listings else []
+    amenity_ids = dict(Amenity.objects.values_list('slug', 'pk'))
+    listing_ids = []
+    counts.update(listings=0, amenities=0, images=0)
+    with explicit_timestamps(Listing):
+        rows = (make_listing(rng, rng.choice(landlords), now) for _ in range(listings))
+        for batch in batched(rows, batch_size):
+            for listing, _ in batch:
+                if rng.random() < 0.9:
+                    listing.main_image_derivatives = rng.choice(manifests)
+            created = Listing.objects.bulk_create([listing for listing, _ in batch])
+            listing_ids.extend(listing.pk for listing in created)
+
+            tags = [
+                ListingAmenity(listing_id=listing.pk, amenity_id=amenity_ids[slug])
+                for listing, (_, slugs) in zip(created, batch) for slug in slugs if slug in amenity_ids
+            ]
+            ListingAmenity.objects.bulk_create(tags, batch_size=batch_size)
+            images = [
+                ListingImage(listing_id=listing.pk, image='', image_derivatives=rng.choice(manifests), caption=f'Photo {n + 1}')
+                for listing in created for n in range(rng.randint(0, gallery * 2) if gallery else 0)
+            ]
+            ListingImage.objects.bulk_create(images, batch_size=batch_size)
+
+            counts['listings'] += len(created)
+            counts['amenities'] += len(tags)
+            counts['images'] += len(images)
+            log(f'{counts["listings"]}/{listings} listings')
+
+    counts['favorites'] = seed_favorites(rng, all_users, listing_ids, favorites, batch_size)
+    log(f'{counts["favorites"]} favorites')
+
+    if listing_ids:
+        favorite_totals = (
+            Favorite.objects.filter(listing=OuterRef('pk')).order_by().values('listing')
+            .annotate(total=Count('pk')).values('total')
+        )
+        Listing.objects.filter(pk__gte=min(listing_ids)).update(favorite_count=Coalesce(Subquery(favorite_totals), 0))
+        # After the favorite counts, which the cards copy
+        rebuild_cards(Listing.objects.filter(pk__gte=min(listing_ids)))
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for model in (User, Listing, ListingCard, ListingAmenity, ListingImage, Favorite):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+    rebuild_facet_counts()
+    bump_listing_generation()
+    return counts
+
+
+def seed_favorites(rng, users, listing_ids, count, batch_size):
+    """Favorites skewed towards a minority of popular listings"""
+    if not users or not listing_ids:
+        return 0
+    # Keep well below the number of possible pairs so the skewed draw terminates quickly
+    count = min(count, len(users) * len(listing_ids) // 4)
+    pairs = set()
+    while len(pairs) < count:
+        listing_id = listing_ids[int(len(listing_ids) * rng.random() ** 3)]
+        pairs.add((rng.choice(users).pk, listing_id))
+    created = 0
+    for batch in batched(pairs, batch_size):
+        created += len(Favorite.objects.bulk_create(
+            [Favorite(user_id=user_id, listing_id=listing_id) for user_id, listing_id in batch],
+            ignore_conflicts=True,
+        ))
+    return created
@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_listing_generation
+from .cards import CARD_SOURCE_FIELDS, add_to_favorite_count, sync_cards
+from .facets import FACET_FIELDS, apply_facet_delta, instance_facet_keys, stored_facet_keys
+from .geo import assign_coordinates
+from .images import attach_derivatives
+from .instrumentation import install_query_timer
+from .models import Favorite, Listing, ListingImage, UserProfile
+from .saved_searches import queue_listing
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    """Count every connection's queries against the request being served"""
+    install_query_timer(connection)
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def invalidate_search_cache(sender, instance, **kwargs):
+    """Any listing write (views, admin list_editable, shell) invalidates cached searches"""
+    # Bump after commit so no reader can cache pre-commit rows under the new generation
+    transaction.on_commit(bump_listing_generation)
+
+
+def touches_facets(update_fields):
+    return update_fields is None or not FACET_FIELDS.isdisjoint(update_fields)
+
+
+@receiver(pre_save, sender=Listing)
+def remember_facet_keys(sender, instance, using, update_fields=None, **kwargs):
+    """Note which facet options the row counted towards before this save"""
+    if touches_facets(update_fields):
+        adding = instance._state.adding or instance.pk is None
+        instance._facet_keys_before = set() if adding else stored_facet_keys(instance.pk, using)
+
+
+@receiver(post_save, sender=Listing)
+def update_facet_counts(sender, instance, using, update_fields=None, **kwargs):
+    """Runs in the caller's transaction, so the counts move with the listing row"""
+    if touches_facets(update_fields):
+        before = instance.__dict__.pop('_facet_keys_before', set())
+        after = instance_facet_keys(instance)
+        apply_facet_delta(before, after, using)
+        if after and not before:
+            # Created live, reactivated or back on the market: tell saved searches
+            queue_listing(instance, using)
+
+
+@receiver(post_delete, sender=Listing)
+def remove_facet_counts(sender, instance, using, **kwargs):
+    apply_facet_delta(instance_facet_keys(instance), set(), using)
+
+
+@receiver(post_save, sender=Listing)
+def update_listing_card(sender, instance, using, update_fields=None, **kwargs):
+    """Runs in the caller's transaction, so the card moves with the listing row"""
+    if update_fields is None or not CARD_SOURCE_FIELDS.isdisjoint(update_fields):
+        sync_cards([instance], using)
+
+
+@receiver(post_save, sender=Favorite)
+def increment_favorite_count(sender, instance, created, **kwargs):
+    """Runs in the caller's transaction, so the count moves with the Favorite row"""
+    if created:
+        Listing.objects.filter(pk=instance.listing_id).update(favorite_count=F('favorite_count') + 1)
+        add_to_favorite_count(instance.listing_id, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def decrement_favorite_count(sender, instance, **kwargs):
+    Listing.objects.filter(pk=instance.listing_id, favorite_count__gt=0).update(
+        favorite_count=F('favorite_count') - 1
+    )
+    add_to_favorite_count(instance.listing_id, -1)
+
+
+@receiver(pre_save, sender=Listing)
+@receiver(pre_save, sender=ListingImage)
+@receiver(pre_save, sender=UserProfile)
+def generate_image_derivatives(sender, instance, **kwargs):
+    attach_derivatives(instance)
+
+
+@receiver(pre_save, sender=Listing)
+def geocode_listing(sender, instance, **kwargs):
+    assign_coordinates(instance)
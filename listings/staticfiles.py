@@ -0,0 +1,217 @@
+import gzip
+import mimetypes
+import os
+import posixpath
+from io import BytesIO
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+from PIL import Image, ImageOps
+
+from .images import DERIVATIVE_FORMATS
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it only .gz copies are written
+    brotli = None
+
+# Widths the bundled photos are re-encoded to, as '<name>.<width>.webp'
+# manifest entries, e.g. {% static 'pexels-pixabay-271624.1280.webp' %}
+STATIC_IMAGE_WIDTHS = (640, 1280, 1920)
+STATIC_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+WEBP_OPTIONS = dict((name, options) for name, _, options in DERIVATIVE_FORMATS)['webp']
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico')
+# Smaller files gain less from compression than the extra header costs
+MIN_COMPRESS_SIZE = 256
+# Content-Encoding per precompressed suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def webp_variant_name(name, width):
+    return f'{os.path.splitext(name)[0]}.{width}.webp'
+
+
+def webp_variants(name, storage=None):
+    """(width, name) of the manifest's WebP copies of the photo `name`, narrowest first
+
+    The widths are STATIC_IMAGE_WIDTHS, capped at the photo's own width.
+    """
+    storage = storage or staticfiles_storage
+    stem = os.path.splitext(name)[0] + '.'
+    variants = []
+    for variant in getattr(storage, 'hashed_files', {}):
+        width = variant[len(stem):-len('.webp')]
+        if variant.startswith(stem) and variant.endswith('.webp') and width.isdigit():
+            variants.append((int(width), variant))
+    return sorted(variants)
+
+
+def compress(content):
+    """{suffix: bytes} of the precompressed copies worth keeping for `content`"""
+    copies = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        copies['.br'] = brotli.compress(content, quality=11)
+    return {suffix: data for suffix, data in copies.items() if len(data) < len(content) * 0.9}
+
+
+class OptimizedStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also precompresses and re-encodes
+
+    After collectstatic has hashed the files, text assets get .gz (and .br,
+    with brotli installed) copies next to them for StaticFilesMiddleware,
+    and the bundled photos get WebP copies at STATIC_IMAGE_WIDTHS. The WebP
+    copies are named after the hashed source, so they are just as safe to
+    cache forever, and are listed in the manifest under their own names.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name, hashed_name in list(self.hashed_files.items()):
+            extension = os.path.splitext(name)[1].lower()
+            if extension in STATIC_IMAGE_EXTENSIONS:
+                for variant, hashed_variant in self.encode_webp(name, hashed_name):
+                    self.hashed_files[variant] = hashed_variant
+                    yield variant, hashed_variant, True
+            elif extension in COMPRESSIBLE_EXTENSIONS:
+                self.precompress(hashed_name)
+        self.save_manifest()
+
+    def precompress(self, name):
+        with self.open(name) as source:
+            content = source.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+        for suffix, data in compress(content).items():
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(data))
+
+    def encode_webp(self, name, hashed_name):
+        """Write the WebP copies of one image; returns (name, hashed name) pairs"""
+        with self.open(hashed_name) as source, Image.open(BytesIO(source.read())) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            widths = sorted({min(width, image.width) for width in STATIC_IMAGE_WIDTHS})
+            variants = []
+            for width in widths:
+                hashed_variant = webp_variant_name(hashed_name, width)
+                if not self.exists(hashed_variant):
+                    height = max(round(image.height * width / image.width), 1)
+                    resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+                    buffer = BytesIO()
+                    resized.save(buffer, format='WEBP', **WEBP_OPTIONS)
+                    self._save(hashed_variant, ContentFile(buffer.getvalue()))
+                variants.append((webp_variant_name(name, width), hashed_variant))
+        return variants
+
+    def stored_name(self, name):
+        # Before the first collectstatic (development, tests) there is no
+        # manifest to look names up in; serve them unhashed
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+
+def size_report(storage=None):
+    """Bytes per collected asset before and after: rows of (name, kind, original, served)
+
+    Text assets are served at their smallest precompressed size, photos at
+    their widest WebP copy (the 1x/2x copies below it are smaller still).
+    """
+    storage = storage or staticfiles_storage
+    rows = []
+    for name, hashed_name in sorted(storage.hashed_files.items()):
+        extension = os.path.splitext(name)[1].lower()
+        original = storage.size(hashed_name)
+        if extension in STATIC_IMAGE_EXTENSIONS:
+            variants = webp_variants(name, storage)
+            served = storage.size(storage.hashed_files[variants[-1][1]]) if variants else original
+            rows.append((name, 'image', original, served))
+        elif extension in COMPRESSIBLE_EXTENSIONS:
+            sizes = [storage.size(hashed_name + suffix) for _, suffix in ENCODINGS if storage.exists(hashed_name + suffix)]
+            rows.append((name, 'text', original, min(sizes + [original])))
+    return rows
+
+
+def accepted_encodings(header):
+    """Codings the client accepts from an Accept-Encoding header (q=0 excluded)"""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFilesMiddleware:
+    """Serve collected static files from STATIC_ROOT without reaching the views
+
+    Hashed names (the ones {% static %} renders) are cached for a year as
+    immutable; anything else must be revalidated. Text assets are sent from
+    their precompressed copy when the client accepts one.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.hashed_names = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        # A stat or two; not worth a thread hop
+        return self.serve(request) or await self.get_response(request)
+
+    def serve(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path.startswith(self.prefix) or not settings.STATIC_ROOT:
+            return None
+        name = posixpath.normpath(request.path[len(self.prefix):]).lstrip('/')
+        try:
+            path = staticfiles_storage.path(name)
+        except SuspiciousFileOperation:
+            return None
+        if not name or not os.path.isfile(path):
+            return None
+
+        mtime = os.stat(path).st_mtime
+        immutable = name in self.hashed_names
+        if not immutable and not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), mtime):
+            return HttpResponseNotModified()
+
+        variants = [(coding, path + suffix) for coding, suffix in ENCODINGS if os.path.isfile(path + suffix)]
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        coding, served_path = next(((coding, variant) for coding, variant in variants if coding in accepted), (None, path))
+
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        response = FileResponse(open(served_path, 'rb'), content_type=content_type, filename=posixpath.basename(name))
+        if coding:
+            response['Content-Encoding'] = coding
+        if variants:
+            response['Vary'] = 'Accept-Encoding'
+        response['Last-Modified'] = http_date(mtime)
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else 'public, max-age=0, must-revalidate'
+        return response
@@ -0,0 +1,41 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from ..cache import card_cache_key, card_cache_timeout, get_cache
+from ..instrumentation import record_cache_lookup
+
+register = template.Library()
+
+CARD_TEMPLATE = 'listings/includes/listing_card.html'
+
+
+@register.simple_tag(takes_context=True)
+def listing_cards(context, listings):
+    """Render a card per listing, reusing cached fragments
+
+    All of a page's fragments are fetched with one get_many and the misses
+    stored with one set_many.
+    """
+    user = context.get('user')
+    is_authenticated = bool(user and user.is_authenticated)
+    card_template = context.template.engine.get_template(CARD_TEMPLATE)
+    listings = list(listings)
+
+    def render(listing):
+        return card_template.render(template.Context({'listing': listing, 'user': user}, autoescape=context.autoescape))
+
+    timeout = card_cache_timeout()
+    if not timeout:
+        return mark_safe(''.join(render(listing) for listing in listings))
+
+    cache = get_cache()
+    keys = [card_cache_key(listing, is_authenticated) for listing in listings]
+    cached = cache.get_many(keys)
+    missing = {}
+    for key, listing in zip(keys, listings):
+        if key not in cached:
+            missing[key] = render(listing)
+    record_cache_lookup(hits=len(cached), misses=len(missing))
+    if missing:
+        cache.set_many(missing, timeout)
+    return mark_safe(''.join(cached.get(key) or missing[key] for key in keys))
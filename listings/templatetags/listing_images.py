@@ -0,0 +1,54 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from ..images import get_derivative_storage, srcset
+from ..staticfiles import webp_variants
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(obj, field_name, size, alt='', css_class='', sizes='100vw'):
+    """Render `obj.<field_name>` as a <picture> with WebP/JPEG srcsets for `size`
+
+    Falls back to the original image URL when no derivatives exist yet
+    (e.g. images uploaded before the pipeline was added).
+    """
+    image = getattr(obj, field_name)
+    manifest = getattr(obj, f'{field_name}_derivatives', None) or {}
+    jpeg_srcset = srcset(manifest, size, 'jpeg')
+
+    if not jpeg_srcset:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy">', image.url, alt, css_class)
+
+    smallest_jpeg = get_derivative_storage().url(manifest[size]['jpeg'][0][1])
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        srcset(manifest, size, 'webp'), sizes,
+        smallest_jpeg, jpeg_srcset, sizes, alt, css_class,
+    )
+
+
+@register.simple_tag
+def static_picture(name, alt='', css_class='', sizes='100vw'):
+    """Render the bundled photo `name` as a <picture> with its WebP copies
+
+    The copies are written by build_static; before it, and under DEBUG
+    (where runserver serves static/ as it is), the original is used alone.
+    """
+    variants = [] if settings.DEBUG else webp_variants(name)
+    if not variants:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy">', static(name), alt, css_class)
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        ', '.join(f'{static(variant)} {width}w' for width, variant in variants), sizes,
+        static(name), alt, css_class,
+    )
@@ -1,3 +1,1802 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+from importlib import import_module
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+
+from django.apps import apps as django_apps
+from django.contrib.admin import site
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.template import Context, Template
+from django.templatetags.static import static
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import api
+from .admin import ListingAdmin
+from .amenities import parse_amenities
+from .benchmarks import SCENARIOS, percentile
+from .cache import card_cache_key, listing_generation, normalize_params, search_cache
+from .cards import load_cards, page_rows, sync_cards
+from .facets import facet_counts, global_facet_counts, rebuild_facet_counts
+from .forms import ListingForm
+from .geo import GEO_CELL_DEGREES, geocode, grid_cell, grid_cell_ranges, haversine_km, neighbourhood_point
+from .instrumentation import PROMETHEUS_CONTENT_TYPE, registry
+from .images import attach_derivatives, generate_derivatives, get_derivative_storage
+from .media import get_staging_storage
+from .models import (
+    Amenity, FacetCount, Favorite, Listing, ListingAmenity, ListingCard, ListingImage, MediaJob, SavedSearch,
+    SavedSearchMatch, UnmatchedListing, UserProfile,
+)
+from .pagination import CursorPaginator, EstimatedCountPaginator
+from .ratelimit import budget, evaluate, hit
+from .popularity import flush_views, flush_views_per_row, half_life_seconds, recent_views, view_buffer, view_score
+from .routers import PIN_COOKIE, ReplicaRouter, read_from_replica
+from .saved_searches import SavedSearchIndex, match_new_listings, price_band
+from .search import PostgresSearchBackend, SimpleSearchBackend, get_search_backend
+from .transfer import import_listings
+from .views import flip_favorite
+
+
+def seed_listings(user, count):
+    """Insert `count` synthetic listings straight from generate_series"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO listings_listing (
+                title, description, property_type, furnished, location, address,
+                price, bedrooms, bathrooms, availability, posted_by_id,
+                created_at, updated_at, is_active, contact_phone, contact_email, amenities, favorite_count,
+                main_image_derivatives, main_image_status, latitude, longitude, view_count, trending_score
+            )
+            SELECT
+                'Listing ' || n, '', (ARRAY['apartment', 'house', 'room', 'studio', 'shared_room'])[1 + n %% 5],
+                'furnished',
+                (ARRAY['Kilimani', 'Westlands', 'Kileleshwa', 'Lavington', 'Karen',
+                       'Upper Hill', 'Parklands', 'South B', 'Ngong Road', 'Runda'])[1 + (n / 25) %% 10],
+                '', 5000 + (n * 7919) %% 295000, n %% 6, 1,
+                -- Type, availability and location vary independently of each other
+                (ARRAY['available', 'available', 'available', 'rented', 'pending'])[1 + (n / 5) %% 5],
+                %s, NOW() - n * INTERVAL '1 minute', NOW(), n %% 20 <> 0, '', '', '', 0, '{}', 'ready',
+                -- Scattered over a 22 x 33 km box around Nairobi
+                -1.40 + ((n * 7919) %% 20000) / 100000.0, 36.65 + ((n::bigint * 104729) %% 30000) / 100000.0,
+                (n * 31) %% 500, ((n * 7919) %% 10000) / 10.0
+            FROM generate_series(1, %s) AS n
+            """,
+            [user.pk, count],
+        )
+        # Same formula as listings.geo.grid_cell
+        cursor.execute(
+            """
+            UPDATE listings_listing
+            SET geo_cell = (floor(latitude / %s)::int + 9000) * 36000 + floor(longitude / %s)::int + 18000
+            WHERE latitude IS NOT NULL
+            """,
+            [GEO_CELL_DEGREES, GEO_CELL_DEGREES],
+        )
+        cursor.execute('ANALYZE listings_listing')
+
+
+def plan_nodes(plan):
+    """Yield every node of a Postgres JSON plan tree"""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN checks need the Postgres backend')
+class SearchQueryPlanTests(TestCase):
+    """The search views must use the indexes meant for them, not scan the listings table"""
+
+    SEED_SIZE = 100_000
+    PAGE_SIZE = 12
+    # Rows a plan may read only to discard them, 5% of the seed: an index
+    # walked in the wrong order for the filter discards tens of thousands
+    MAX_ROWS_REMOVED = 5_000
+    FEED_INDEXES = ('listing_live_created_idx',)
+    FILTER_INDEXES = FEED_INDEXES + ('listing_live_type_idx', 'listing_live_price_idx', 'listing_live_bedrooms_idx')
+    SEARCH_INDEXES = (
+        'listing_search_vector_idx', 'listing_search_vector_all_idx', 'listing_location_trgm_idx', 'listing_location_trgm_all_idx',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='seeder', password='seeder-pass')
+        seed_listings(cls.user, cls.SEED_SIZE)
+        with connection.cursor() as cursor:
+            # Common amenities on most listings, rare ones on a few
+            cursor.execute(
+                """
+                INSERT INTO listings_listingamenity (listing_id, amenity_id)
+                SELECT listing.id, amenity.id
+                FROM listings_listing AS listing
+                JOIN listings_amenity AS amenity ON (
+                    (amenity.slug = 'water')
+                    OR (amenity.slug = 'parking' AND listing.id % 2 = 0)
+                    OR (amenity.slug = 'wifi' AND listing.id % 3 = 0)
+                    OR (amenity.slug = 'swimming-pool' AND listing.id % 97 = 0)
+                    OR (amenity.slug = 'lift' AND listing.id % 89 = 0)
+                )
+                """
+            )
+            cursor.execute('ANALYZE listings_listingamenity')
+
+    def assertIndexedPlan(self, queryset, indexes, tables=(Listing._meta.db_table,), max_removed=MAX_ROWS_REMOVED):
+        """No sequential scan, one of `indexes` used, and few rows read only to be filtered out
+
+        An index walked in the wrong order can discard most of the table
+        without ever showing a Seq Scan, so the executed plan's "Rows Removed
+        by Filter" is bounded too.
+        """
+        nodes = list(plan_nodes(json.loads(queryset.explain(format='json', analyze=True))[0]['Plan']))
+        for node in nodes:
+            if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in tables:
+                self.fail(f'Sequential scan on {node["Relation Name"]}:\n{queryset.explain(analyze=True)}')
+        if {node.get('Index Name') for node in nodes}.isdisjoint(indexes):
+            self.fail(f'None of {", ".join(indexes)} used:\n{queryset.explain(analyze=True)}')
+        removed = sum(node.get('Rows Removed by Filter', 0) for node in nodes if node.get('Relation Name') in tables)
+        if max_removed is not None and removed > max_removed:
+            self.fail(f'{removed} rows removed by filter:\n{queryset.explain(analyze=True)}')
+
+    def page_query(self, **cleaned_data):
+        return Listing.objects.live().search(cleaned_data)[:self.PAGE_SIZE]
+
+    def test_unfiltered_feed(self):
+        self.assertIndexedPlan(self.page_query(), self.FEED_INDEXES)
+
+    def test_deep_keyset_page(self):
+        last = Listing.objects.live()[self.PAGE_SIZE * 4000]
+        paginator = CursorPaginator(Listing.objects.live(), self.PAGE_SIZE)
+        self.assertIndexedPlan(paginator.keyset_queryset({'key': [last.created_at.isoformat(), last.pk]}), self.FEED_INDEXES)
+
+    def test_property_type_filter(self):
+        self.assertIndexedPlan(self.page_query(property_type='studio'), self.FILTER_INDEXES)
+
+    def test_price_range_filter(self):
+        self.assertIndexedPlan(self.page_query(min_price=20000, max_price=21000), self.FILTER_INDEXES)
+        self.assertIndexedPlan(Listing.objects.live().search({'min_price': 20000, 'max_price': 21000}), ['listing_live_price_idx'])
+
+    def test_bedrooms_filter(self):
+        self.assertIndexedPlan(self.page_query(bedrooms=5), self.FILTER_INDEXES)
+        self.assertIndexedPlan(self.page_query(bedrooms=5, max_price=30000), self.FILTER_INDEXES)
+
+    def test_combined_filters(self):
+        self.assertIndexedPlan(
+            self.page_query(property_type='house', min_price=50000, max_price=90000, bedrooms=3), self.FILTER_INDEXES
+        )
+
+    def test_location_search(self):
+        # A neighbourhood holding a tenth of the listings: ranking needs every
+        # match, and Postgres prices the per-row @@ check too low to see that
+        # the full-text index would discard fewer rows than walking the live
+        # ones, so only the scan type is checked here
+        self.assertIndexedPlan(self.page_query(location='Lavington'), self.FEED_INDEXES + self.SEARCH_INDEXES, max_removed=None)
+        self.assertIndexedPlan(self.page_query(location='Upper Hill', property_type='house'), self.SEARCH_INDEXES)
+
+    def test_amenity_filter(self):
+        tables = (Listing._meta.db_table, ListingAmenity._meta.db_table)
+        # The matching listings are fetched by primary key
+        indexes = ['listings_listing_pkey']
+        self.assertIndexedPlan(self.page_query(amenities=['swimming-pool', 'lift']), indexes, tables)
+        self.assertIndexedPlan(self.page_query(amenities=['parking', 'wifi']), indexes, tables)
+        self.assertIndexedPlan(self.page_query(amenities=['wifi'], property_type='studio'), indexes, tables)
+
+    def test_trending_sort(self):
+        self.assertIndexedPlan(self.page_query(sort='trending'), ['listing_live_trending_idx'])
+
+    def test_admin_search(self):
+        terms = ('Lavington', 'Listing 4242', 'seeder', 'Kileleshwa Rd')
+        # Common terms walk the changelist order until a page is full
+        indexes = self.SEARCH_INDEXES + ('listing_created_idx',)
+        for term in terms:
+            self.assertIndexedPlan(get_search_backend().search(Listing.objects.all(), term).order_by('-created_at')[:100], indexes)
+        if not PostgresSearchBackend().has_trigram:
+            self.skipTest('address__icontains is only indexed with pg_trgm')
+        admin_site = ListingAdmin(Listing, site)
+        for term in terms:
+            queryset, _ = admin_site.get_search_results(RequestFactory().get('/'), Listing.objects.all(), term)
+            self.assertIndexedPlan(queryset.order_by('-created_at', '-id')[:100], indexes + ('listing_address_trgm_idx',))
+
+    def test_nearby_search(self):
+        self.assertIndexedPlan(self.page_query(near='upper-hill', radius_km=3), ['listing_live_geo_idx'])
+        self.assertIndexedPlan(
+            self.page_query(lat=-1.2921, lng=36.8219, radius_km=1, property_type='studio'), ['listing_live_geo_idx']
+        )
+
+
+class SearchBackendTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='landlord', password='landlord-pass')
+        defaults = {
+            'description': 'Spacious unit close to shops',
+            'property_type': 'apartment',
+            'furnished': 'furnished',
+            'address': 'Nairobi',
+            'price': 45000,
+            'bedrooms': 2,
+            'bathrooms': 1,
+            'posted_by': user,
+        }
+        cls.kilimani = Listing.objects.create(
+            title='Modern flat', location='Kilimani, Nairobi', amenities='Parking, WiFi', **defaults
+        )
+        cls.westlands = Listing.objects.create(
+            title='Cosy studio', location='Westlands', amenities='Gym', **defaults
+        )
+
+    def test_simple_backend_matches_location_and_amenities(self):
+        backend = SimpleSearchBackend()
+        self.assertEqual(list(backend.search(Listing.objects.live(), 'kilimani')), [self.kilimani])
+        self.assertEqual(list(backend.search(Listing.objects.live(), 'gym')), [self.westlands])
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search needs the Postgres backend')
+    def test_postgres_backend_full_text(self):
+        backend = PostgresSearchBackend()
+        self.assertEqual(list(backend.search(Listing.objects.live(), 'Westlands')), [self.westlands])
+        self.assertEqual(list(backend.search(Listing.objects.live(), 'parking')), [self.kilimani])
+
+    @skipUnless(connection.vendor == 'postgresql', 'trigram search needs the Postgres backend')
+    def test_postgres_backend_tolerates_typos(self):
+        backend = PostgresSearchBackend()
+        if not backend.has_trigram:
+            self.skipTest('pg_trgm is not installed')
+        self.assertEqual(list(backend.search(Listing.objects.live(), 'Kilimni')), [self.kilimani])
+        self.assertEqual(list(backend.search(Listing.objects.live(), 'Westland')), [self.westlands])
+
+
+def make_listings(user, count, **overrides):
+    fields = {
+        'description': 'Test listing',
+        'property_type': 'apartment',
+        'furnished': 'furnished',
+        'location': 'Kilimani',
+        'address': 'Nairobi',
+        'price': 30000,
+        'bedrooms': 1,
+        'bathrooms': 1,
+        'posted_by': user,
+    }
+    fields.update(overrides)
+    return Listing.objects.bulk_create(Listing(title=f'Listing {n}', **fields) for n in range(count))
+
+
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='landlord', password='landlord-pass')
+        make_listings(cls.user, 30)
+        # Identical timestamps force the id tiebreaker to do the work
+        Listing.objects.update(created_at=timezone.now())
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, queryset, per_page=7):
+        paginator = CursorPaginator(queryset, per_page)
+        seen, cursor = [], None
+        while True:
+            page = paginator.get_page(cursor)
+            seen.extend(listing.pk for listing in page)
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_keyset_pages_cover_every_row_once(self):
+        seen = self.walk(Listing.objects.live())
+        self.assertEqual(seen, list(Listing.objects.order_by('-created_at', '-id').values_list('pk', flat=True)))
+
+    def test_ordered_querysets_use_offset_cursors(self):
+        seen = self.walk(Listing.objects.live().order_by('price', 'id'))
+        self.assertEqual(seen, list(Listing.objects.order_by('price', 'id').values_list('pk', flat=True)))
+
+    def test_tampered_cursor_restarts_from_first_page(self):
+        paginator = CursorPaginator(Listing.objects.live(), 7)
+        first = paginator.get_page()
+        self.assertEqual(list(paginator.get_page(first.next_cursor + 'x')), list(first))
+
+    def test_pages_need_no_count(self):
+        paginator = CursorPaginator(Listing.objects.live(), 7)
+        with self.assertNumQueries(1):
+            paginator.get_page()
+
+    def test_home_load_more(self):
+        response = self.client.get(reverse('listings:home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 12)
+        self.assertEqual(response.context['total_listings'], 30)
+
+        response = self.client.get(response.context['next_page_url'], headers={'X-Requested-With': 'XMLHttpRequest'})
+        data = response.json()
+        self.assertEqual(data['html'].count('listing-card'), 12)
+        self.assertIsNotNone(data['next_page_url'])
+
+
+class AmenityFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='landlord', password='landlord-pass')
+        cls.both, cls.parking_only, cls.untagged = make_listings(cls.user, 3)
+        parking, wifi = Amenity.objects.get(slug='parking'), Amenity.objects.get(slug='wifi')
+        cls.both.amenity_tags.set([parking, wifi])
+        cls.parking_only.amenity_tags.set([parking])
+
+    def test_parse_free_text(self):
+        self.assertEqual(parse_amenities('Ample parking, Wi-Fi and 24hr CCTV'), ['parking', 'wifi', 'security'])
+        self.assertEqual(parse_amenities('Spacious and bright'), [])
+
+    def test_filter_requires_every_amenity(self):
+        live = Listing.objects.live()
+        self.assertEqual(set(live.with_amenities(['parking'])), {self.both, self.parking_only})
+        self.assertEqual(list(live.with_amenities(['parking', 'wifi'])), [self.both])
+        self.assertEqual(list(live.with_amenities(['parking', 'no-such-amenity'])), [])
+
+    def test_search_view_filters_on_amenities(self):
+        response = self.client.get(reverse('listings:search'), {'amenities': ['wifi', 'parking']})
+        self.assertEqual([card['id'] for card in response.context['page_obj']], [self.both.pk])
+        response = self.client.get(reverse('listings:search'), {'amenities': ['helipad']})
+        self.assertFalse(response.context['search_form'].is_valid())
+
+    def test_listing_form_tags_from_free_text(self):
+        form = ListingForm({
+            'title': 'Garden flat', 'description': 'Quiet', 'property_type': 'apartment',
+            'furnished': 'furnished', 'location': 'Lavington', 'address': 'James Gichuru Rd',
+            'price': '65000', 'bedrooms': '2', 'bathrooms': '1', 'availability': 'available',
+            'amenities': 'Borehole water, lift and a gym',
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        listing = form.save(commit=False)
+        listing.posted_by = self.user
+        listing.save()
+        form.save_m2m()
+        self.assertEqual(set(listing.amenity_tags.values_list('slug', flat=True)), {'water', 'lift', 'gym'})
+
+    def test_data_migration_parses_existing_text(self):
+        Listing.objects.filter(pk=self.untagged.pk).update(amenities='Secure parking\nDSTV')
+        import_module('listings.migrations.0009_populate_amenities').populate_amenities(django_apps, None)
+        self.assertEqual(set(self.untagged.amenity_tags.values_list('slug', flat=True)), {'parking', 'cable-tv'})
+        # Existing tags are left alone
+        self.assertEqual(self.both.amenity_tags.count(), 2)
+
+
+class GeoSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='landlord', password='landlord-pass')
+        # bulk_create skips the geocoding signal, so save one by one
+        cls.upper_hill, cls.kilimani, cls.karen = [
+            Listing.objects.create(
+                title=location, description='Two bedroom flat', property_type='apartment', furnished='furnished',
+                location=location, address='Nairobi', price=40000, bedrooms=2, bathrooms=1, posted_by=cls.user,
+            )
+            for location in ('Upper Hill', 'Kilimani, off Argwings Kodhek', 'Karen')
+        ]
+
+    def test_geocode_from_gazetteer(self):
+        self.assertEqual(geocode('Near Yaya Centre, Kilimani'), neighbourhood_point('kilimani'))
+        self.assertEqual(geocode('south c'), neighbourhood_point('south-c'))
+        self.assertIsNone(geocode('Somewhere else'))
+
+    def test_save_geocodes_and_tracks_the_grid_cell(self):
+        latitude, longitude = neighbourhood_point('upper-hill')
+        self.assertEqual((self.upper_hill.latitude, self.upper_hill.longitude), (latitude, longitude))
+        self.assertEqual(self.upper_hill.geo_cell, grid_cell(latitude, longitude))
+
+    def test_cell_ranges_cover_the_bounding_box(self):
+        ranges = grid_cell_ranges(-1.31, -1.27, 36.78, 36.83)
+        self.assertEqual(len(ranges), 5)
+        for latitude in (-1.3099, -1.29, -1.2701):
+            for longitude in (36.7801, 36.80, 36.8299):
+                cell = grid_cell(latitude, longitude)
+                self.assertTrue(any(first <= cell <= last for first, last in ranges))
+
+    def test_nearby_is_exact_and_sorted_by_distance(self):
+        origin = neighbourhood_point('upper-hill')
+        kilimani_km = haversine_km(*origin, *neighbourhood_point('kilimani'))
+        results = list(Listing.objects.live().nearby(*origin, 5))
+        self.assertEqual(results, [self.upper_hill, self.kilimani])
+        self.assertAlmostEqual(results[1].distance_km, kilimani_km, places=3)
+        self.assertEqual(list(Listing.objects.live().nearby(*origin, kilimani_km - 0.01)), [self.upper_hill])
+
+    def test_search_view_radius_mode(self):
+        for _ in range(2):  # second request is served from the page cache
+            response = self.client.get(reverse('listings:search'), {'near': 'upper-hill', 'radius_km': 5})
+            self.assertEqual([card['id'] for card in response.context['page_obj']], [self.upper_hill.pk, self.kilimani.pk])
+            self.assertContains(response, 'km away')
+        response = self.client.get(reverse('listings:search'), {'lat': -1.2986})
+        self.assertFalse(response.context['search_form'].is_valid())
+
+    def test_editing_the_location_geocodes_again(self):
+        self.client.force_login(self.user)
+        form = ListingForm(instance=self.karen)
+        data = {name: value for name, value in form.initial.items() if value is not None and name != 'main_image'}
+        data.update(location='Westlands', amenity_tags=[])
+        response = self.client.post(reverse('listings:edit_listing', args=[self.karen.pk]), data)
+        self.assertEqual(response.status_code, 302, response.context and response.context['form'].errors)
+        self.karen.refresh_from_db()
+        self.assertEqual((self.karen.latitude, self.karen.longitude), neighbourhood_point('westlands'))
+
+
+class SearchResultCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='landlord', password='landlord-pass')
+        make_listings(cls.user, 5, property_type='house')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_repeated_search_is_served_from_cache(self):
+        url = reverse('listings:search') + '?property_type=house'
+        self.client.get(url)
+        hits = search_cache.stats()['hits']
+        # One pk lookup for the cached page ids
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        # Page ids, total and facet counts
+        self.assertEqual(search_cache.stats()['hits'], hits + 3)
+        self.assertEqual(response.context['total_listings'], 5)
+
+    def test_listing_writes_invalidate_cached_pages(self):
+        url = reverse('listings:search') + '?property_type=house'
+        self.client.get(url)
+
+        listing = Listing.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.availability = 'rented'
+            listing.save()
+        self.assertEqual(self.client.get(url).context['total_listings'], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Listing.objects.last().delete()
+        self.assertEqual(self.client.get(url).context['total_listings'], 3)
+
+    def test_file_backed_cache(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location,
+        }}):
+            url = reverse('listings:search') + '?property_type=house'
+            self.client.get(url)
+            with self.assertNumQueries(1):
+                self.client.get(url)
+
+    def test_equivalent_filters_share_a_key(self):
+        self.assertEqual(
+            normalize_params({'location': ' Kilimani', 'min_price': Decimal('20000.00'), 'bedrooms': None}),
+            normalize_params({'location': 'kilimani', 'min_price': Decimal('2E+4')}),
+        )
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='landlord', password='landlord-pass')
+        make_listings(cls.user, 3, property_type='house', bedrooms=3, price=45000)
+        make_listings(cls.user, 2, furnished='unfurnished', price=12000)
+        make_listings(cls.user, 1, property_type='house', availability='rented')
+        rebuild_facet_counts()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_match_the_search_filters_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = facet_counts(Listing.objects.live())
+        self.assertEqual(counts['property_type'], {'apartment': 2, 'house': 3, 'room': 0, 'studio': 0, 'shared_room': 0})
+        self.assertEqual(counts['furnished']['unfurnished'], 2)
+        # Bedroom options are minimums, like the bedrooms filter
+        self.assertEqual(counts['bedrooms'], {'1': 5, '2': 3, '3': 3, '4': 0})
+        self.assertEqual(counts['price']['0-15000'], 2)
+        self.assertEqual(counts['price']['30000-60000'], 3)
+
+        search = Listing.objects.live().search({'furnished': 'unfurnished', 'max_price': Decimal('15000')})
+        self.assertEqual(search.count(), 2)
+        self.assertEqual(facet_counts(search)['property_type']['apartment'], 2)
+
+    def test_listing_writes_update_the_stored_summary(self):
+        self.assertEqual(global_facet_counts(), facet_counts(Listing.objects.live()))
+
+        listing = Listing.objects.create(
+            title='New', description='New', property_type='studio', furnished='furnished', location='Kilimani',
+            address='Nairobi', price='150000', bedrooms=1, bathrooms=1, posted_by=self.user,
+        )
+        self.assertEqual(global_facet_counts()['price']['100000-'], 1)
+        listing.property_type = 'room'
+        listing.save()
+        house = Listing.objects.filter(property_type='house', availability='available').first()
+        house.availability = 'rented'
+        house.save()
+        Listing.objects.filter(furnished='unfurnished').first().delete()
+        # Saves that leave the facet fields alone skip the bookkeeping (the
+        # second query is the card upsert)
+        with self.assertNumQueries(2):
+            listing.save(update_fields=['title'])
+
+        counts = global_facet_counts()
+        self.assertEqual(counts, facet_counts(Listing.objects.live()))
+        self.assertEqual(counts['property_type']['room'], 1)
+        self.assertEqual(counts['property_type']['house'], 2)
+        self.assertEqual(counts['furnished']['unfurnished'], 1)
+
+    def test_home_reads_the_summary_and_search_aggregates(self):
+        FacetCount.objects.filter(facet='property_type', value='house').update(count=1204)
+        response = self.client.get(reverse('listings:home'))
+        property_types = response.context['facets'][0]
+        self.assertEqual(property_types['name'], 'property_type')
+        self.assertContains(response, '(1,204)')
+        self.assertEqual(
+            [option['url'] for option in property_types['options'] if option['label'] == 'House'],
+            [reverse('listings:search') + '?property_type=house'],
+        )
+
+        response = self.client.get(reverse('listings:search'), {'max_price': '50000', 'property_type': 'house'})
+        options = {facet['name']: facet['options'] for facet in response.context['facets']}
+        self.assertEqual([(option['label'], option['count'], option['selected']) for option in options['property_type']],
+                         [('House', 3, True)])
+        self.assertIn('max_price=60000', options['price'][0]['url'])
+
+
+class SavedSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.landlord = User.objects.create_user(username='landlord', password='landlord-pass')
+        cls.tenant = User.objects.create_user(username='tenant', password='tenant-pass', email='tenant@example.com')
+        Amenity.objects.get_or_create(slug='wifi', defaults={'name': 'WiFi'})
+
+    def add_listing(self, **overrides):
+        fields = {
+            'title': 'Garden flat', 'description': 'Quiet garden flat', 'property_type': 'apartment',
+            'furnished': 'furnished', 'location': 'Kilimani', 'address': 'Argwings Kodhek Rd', 'price': 45000,
+            'bedrooms': 2, 'bathrooms': 1, 'posted_by': self.landlord,
+        }
+        fields.update(overrides)
+        return Listing.objects.create(**fields)
+
+    def save_search(self, user=None, **params):
+        return SavedSearch.objects.create(user=user or self.tenant, name='Search', params=normalize_params(params))
+
+    def test_index_compares_a_listing_with_its_buckets_only(self):
+        studio = self.save_search(property_type='studio')
+        cheap = self.save_search(max_price=Decimal('20000'))
+        mid_range = self.save_search(min_price=Decimal('30000'), max_price=Decimal('60000'), bedrooms=2)
+        wifi = self.save_search(amenities=['wifi'])
+        nearby = self.save_search(near='kilimani', radius_km=1)
+        far = self.save_search(near='karen', radius_km=1)
+        text = self.save_search(location='garden')
+        other_text = self.save_search(location='penthouse')
+        index = SavedSearchIndex.load()
+        self.assertEqual(index.size, 8)
+        self.assertEqual((price_band(14999), price_band(15000), price_band(100000)), (0, 1, 4))
+
+        listing = self.add_listing()
+        # Searches for other property types or price ranges are never looked at
+        self.assertNotIn(studio.pk, [pk for pk, _ in index.candidates(listing)])
+        self.assertNotIn(cheap.pk, [pk for pk, _ in index.candidates(listing)])
+        self.assertEqual(set(index.match(listing, set())), {mid_range.pk, nearby.pk, text.pk})
+        self.assertIn(wifi.pk, index.match(listing, {'wifi'}))
+        self.assertNotIn(far.pk, index.match(listing, {'wifi'}))
+        self.assertNotIn(other_text.pk, index.match(listing, {'wifi'}))
+
+        # Matches agree with running each search on the search page
+        for saved_search in SavedSearch.objects.all():
+            found = Listing.objects.live().search(saved_search.params).filter(pk=listing.pk).exists()
+            self.assertEqual(found, saved_search.pk in index.match(listing, set()), saved_search.params)
+
+    def test_new_and_relisted_listings_are_matched_and_emailed_once(self):
+        saved_search = self.save_search(property_type='apartment', max_price=Decimal('50000'))
+        self.save_search(user=self.landlord, property_type='apartment')
+        new = self.add_listing()
+        rented = self.add_listing(title='Taken flat', availability='rented')
+        self.add_listing(title='Too dear', price=80000)
+        self.assertEqual(UnmatchedListing.objects.count(), 2)
+
+        rented.availability = 'available'
+        rented.save()
+        rented.bedrooms = 3
+        rented.save()
+        self.assertEqual(UnmatchedListing.objects.count(), 3)
+
+        out = StringIO()
+        call_command('send_search_digests', stdout=out)
+        self.assertIn('5 new match(es) across 2 saved search(es)', out.getvalue())
+        self.assertFalse(UnmatchedListing.objects.exists())
+        # The landlord has no email address, so only the tenant gets a digest
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['tenant@example.com'])
+        self.assertIn('2 new listing(s)', mail.outbox[0].subject)
+        self.assertIn(new.get_absolute_url(), mail.outbox[0].body)
+        self.assertIn('Taken flat', mail.outbox[0].body)
+        self.assertNotIn('Too dear', mail.outbox[0].body)
+        saved_search.refresh_from_db()
+        self.assertIsNotNone(saved_search.last_notified_at)
+
+        call_command('send_search_digests', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(SavedSearchMatch.objects.filter(sent_at__isnull=True).exists())
+
+    def test_matching_skips_listings_taken_down_before_the_run(self):
+        self.save_search(property_type='apartment')
+        listing = self.add_listing()
+        listing.is_active = False
+        listing.save()
+        self.assertEqual(match_new_listings(), 0)
+        self.assertFalse(UnmatchedListing.objects.exists())
+
+    def test_save_list_and_delete_searches(self):
+        self.client.force_login(self.tenant)
+        url = reverse('listings:save_search')
+        query = {'property_type': 'apartment', 'max_price': '30000', 'near': 'kilimani'}
+        response = self.client.post(f'{url}?property_type=apartment&max_price=30000&near=kilimani')
+        self.assertRedirects(response, f"{reverse('listings:search')}?property_type=apartment&max_price=30000&near=kilimani")
+        saved_search = SavedSearch.objects.get(user=self.tenant)
+        self.assertEqual(saved_search.params, normalize_params(query))
+        self.assertEqual(saved_search.name, 'Apartment, up to KSh 30,000, near Kilimani')
+
+        # The same filters in another order are the same search
+        self.client.post(f'{url}?near=kilimani&max_price=30000.00&property_type=apartment')
+        self.assertEqual(SavedSearch.objects.count(), 1)
+        self.client.post(url)
+        self.assertEqual(SavedSearch.objects.count(), 1)
+
+        response = self.client.get(reverse('listings:saved_searches'))
+        self.assertContains(response, 'Apartment, up to KSh 30,000, near Kilimani')
+        self.assertContains(response, 'max_price=30000')
+
+        self.client.force_login(self.landlord)
+        self.assertEqual(self.client.post(reverse('listings:delete_saved_search', args=[saved_search.pk])).status_code, 404)
+        self.client.force_login(self.tenant)
+        self.client.post(reverse('listings:delete_saved_search', args=[saved_search.pk]))
+        self.assertFalse(SavedSearch.objects.exists())
+
+
+class QueryBudgetMixin:
+    """Assertions that keep a view's query count fixed as its data grows"""
+
+    def get_with_queries(self, url, **kwargs):
+        cache.clear()
+        # A due flush of buffered listing views would count against the page
+        view_buffer.flush()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response, context.captured_queries
+
+    def assertQueryBudget(self, url, budget, **kwargs):
+        """GET `url` and fail if it runs more than `budget` queries"""
+        response, queries = self.get_with_queries(url, **kwargs)
+        if len(queries) > budget:
+            listing = '\n'.join(f'{n}. {query["sql"]}' for n, query in enumerate(queries, 1))
+            self.fail(f'{url} ran {len(queries)} queries (budget {budget}):\n{listing}')
+        return response
+
+    def assertQueriesIndependentOfRows(self, url, add_rows, **kwargs):
+        """GET `url`, call `add_rows()`, GET again and require the same query count"""
+        _, before = self.get_with_queries(url, **kwargs)
+        add_rows()
+        _, after = self.get_with_queries(url, **kwargs)
+        self.assertEqual(
+            len(before), len(after),
+            f'{url} went from {len(before)} to {len(after)} queries after adding rows (per-row query?)',
+        )
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', password='owner-pass', first_name='Wanjiru')
+        cls.tenant = User.objects.create_user(username='tenant', password='tenant-pass')
+        UserProfile.objects.bulk_create([UserProfile(user=cls.owner), UserProfile(user=cls.tenant)])
+        cls.listings = make_listings(cls.owner, 3)
+        Favorite.objects.bulk_create(Favorite(user=cls.tenant, listing=listing) for listing in cls.listings)
+
+    def add_favorited_listings(self):
+        listings = make_listings(self.owner, 5, location='Westlands')
+        Favorite.objects.bulk_create(Favorite(user=self.tenant, listing=listing) for listing in listings)
+
+    def add_gallery_images(self):
+        ListingImage.objects.bulk_create(
+            ListingImage(listing=self.listings[0], image='', image_status='pending') for _ in range(6)
+        )
+
+    def test_listing_detail_anonymous(self):
+        # listing (owner joined in) + gallery and amenity prefetches
+        response = self.assertQueryBudget(reverse('listings:listing_detail', args=[self.listings[0].pk]), 3)
+        self.assertContains(response, 'Wanjiru')
+
+    def test_listing_detail_authenticated(self):
+        self.client.force_login(self.tenant)
+        # session + user + listing (owner and favorite state joined in) + two prefetches
+        response = self.assertQueryBudget(reverse('listings:listing_detail', args=[self.listings[0].pk]), 5)
+        self.assertTrue(response.context['is_favorited'])
+
+    def test_listing_detail_gallery(self):
+        self.assertQueriesIndependentOfRows(
+            reverse('listings:listing_detail', args=[self.listings[0].pk]), self.add_gallery_images
+        )
+
+    def test_profile(self):
+        self.client.force_login(self.tenant)
+        # session + user + profile + listings + favorites (with listings joined)
+        self.assertQueryBudget(reverse('listings:profile'), 5)
+        self.assertQueriesIndependentOfRows(reverse('listings:profile'), self.add_favorited_listings)
+
+    def test_owner_profile(self):
+        self.client.force_login(self.owner)
+        self.assertQueriesIndependentOfRows(
+            reverse('listings:profile'), lambda: make_listings(self.owner, 5, location='Karen')
+        )
+
+    def test_delete_listing_returns_to_the_profile(self):
+        self.client.force_login(self.owner)
+        response = self.client.post(reverse('listings:delete_listing', args=[self.listings[0].pk]))
+        self.assertRedirects(response, reverse('listings:profile'))
+
+
+class FavoriteCounterTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', password='owner-pass')
+        cls.tenant = User.objects.create_user(username='tenant', password='tenant-pass')
+        cls.listing = make_listings(cls.owner, 1)[0]
+
+    def toggle(self):
+        return self.client.post(
+            reverse('listings:toggle_favorite', args=[self.listing.pk]),
+            headers={'X-Requested-With': 'XMLHttpRequest'},
+        ).json()
+
+    def test_toggle_keeps_the_counter_in_step(self):
+        self.client.force_login(self.tenant)
+        self.assertEqual(self.toggle(), {'is_favorited': True, 'favorite_count': 1, 'message': 'Added to favorites!'})
+        Favorite.objects.create(user=self.owner, listing=self.listing)
+        self.assertEqual(self.toggle()['favorite_count'], 1)
+        self.assertFalse(Favorite.objects.filter(user=self.tenant).exists())
+
+        self.owner.delete()
+        self.assertFalse(Listing.objects.exists())
+
+    def test_cascaded_favorite_deletes_update_the_counter(self):
+        Favorite.objects.create(user=self.tenant, listing=self.listing)
+        self.tenant.delete()
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.favorite_count, 0)
+
+    def test_grid_marks_favorites_without_per_card_queries(self):
+        Favorite.objects.create(user=self.tenant, listing=self.listing)
+        self.client.force_login(self.tenant)
+
+        def favorite_more():
+            for listing in make_listings(self.owner, 6, location='Runda'):
+                Favorite.objects.create(user=self.tenant, listing=listing)
+
+        self.assertQueriesIndependentOfRows(reverse('listings:home'), favorite_more)
+        response = self.client.get(reverse('listings:home'))
+        self.assertTrue(all(card['is_favorited'] for card in response.context['page_obj']))
+        self.assertContains(response, '1 saved', count=7)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs concurrent transactions on a server database')
+class FavoriteConcurrencyTests(TransactionTestCase):
+    def test_overlapping_toggles_keep_the_counter_exact(self):
+        owner = User.objects.create_user(username='owner', password='owner-pass')
+        tenants = [User.objects.create_user(username=f'tenant-{n}', password='tenant-pass') for n in range(4)]
+        listing = make_listings(owner, 1)[0]
+        sync_cards([listing])
+        barrier = threading.Barrier(len(tenants) * 3)
+        results, errors = [], []
+
+        def click(user):
+            try:
+                barrier.wait()
+                results.append((user.pk, flip_favorite(user, listing)))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        # Three overlapping clicks per user: each ends favorited
+        threads = [threading.Thread(target=click, args=(user,)) for user in tenants for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        rows = Favorite.objects.filter(listing=listing).count()
+        self.assertEqual(rows, len(tenants))
+        listing.refresh_from_db()
+        self.assertEqual(listing.favorite_count, rows)
+        self.assertEqual(ListingCard.objects.get(pk=listing.pk).favorite_count, rows)
+        # Each user's clicks saw the states in turn: on, off, on
+        for user in tenants:
+            self.assertEqual(sorted(state for pk, state in results if pk == user.pk), [False, True, True])
+
+
+class ListingViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', password='owner-pass')
+        cls.listings = make_listings(cls.owner, 3)
+
+    def setUp(self):
+        cache.clear()
+        view_buffer.flush()
+
+    @override_settings(LISTING_VIEW_FLUSH_SECONDS=3600)
+    def test_views_are_buffered_until_flushed(self):
+        listing = self.listings[0]
+        url = reverse('listings:listing_detail', args=[listing.pk])
+        with CaptureQueriesContext(connection) as context:
+            for _ in range(3):
+                self.client.get(url)
+        self.assertFalse([query for query in context.captured_queries if 'UPDATE' in query['sql']])
+        # The owner's own visits are not counted
+        self.client.force_login(self.owner)
+        self.client.get(url)
+        self.assertEqual(view_buffer.counts[listing.pk], 3)
+
+        listing.refresh_from_db()
+        self.assertEqual(listing.view_count, 0)
+        self.assertEqual(view_buffer.flush(), 1)
+        listing.refresh_from_db()
+        self.assertEqual(listing.view_count, 3)
+
+    @override_settings(LISTING_VIEW_FLUSH_SECONDS=0)
+    def test_due_buffer_is_flushed_by_the_next_view(self):
+        self.client.get(reverse('listings:listing_detail', args=[self.listings[1].pk]))
+        self.assertFalse(view_buffer.counts)
+        self.listings[1].refresh_from_db()
+        self.assertEqual(self.listings[1].view_count, 1)
+
+    def test_one_update_per_batch_and_decay(self):
+        first, second, third = self.listings
+        now = 1_800_000_000
+        with CaptureQueriesContext(connection) as context:
+            flush_views({first.pk: 10, second.pk: 4, third.pk: 1}, now=now)
+        if connection.vendor == 'postgresql':
+            self.assertEqual(len(context.captured_queries), 1)
+            self.assertIn('FROM (VALUES', context.captured_queries[0]['sql'])
+
+        # Two half-lives later 4 fresh views outrank the 10 old ones plus 1
+        later = now + 2 * half_life_seconds()
+        flush_views({first.pk: 1, third.pk: 4}, now=later)
+        scores = dict(Listing.objects.values_list('pk', 'trending_score'))
+        self.assertAlmostEqual(recent_views(scores[first.pk], later), 10 / 4 + 1)
+        self.assertAlmostEqual(recent_views(scores[second.pk], later), 1)
+        self.assertAlmostEqual(recent_views(scores[third.pk], later), 1 / 4 + 4)
+        self.assertEqual(Listing.objects.get(pk=first.pk).view_count, 11)
+
+        response = self.client.get(reverse('listings:search'), {'sort': 'trending'})
+        self.assertEqual([card['id'] for card in response.context['page_obj']], [third.pk, first.pk, second.pk])
+        self.assertContains(response, '<option value="trending" selected>')
+
+    def test_per_row_flush_matches_the_batched_one(self):
+        first, second, _ = self.listings
+        now = 1_800_000_000
+        flush_views({first.pk: 10}, now=now)
+        flush_views_per_row([(second.pk, 10, view_score(10, now))], DEFAULT_DB_ALIAS)
+        flush_views({first.pk: 3}, now=now + half_life_seconds())
+        flush_views_per_row([(second.pk, 3, view_score(3, now + half_life_seconds()))], DEFAULT_DB_ALIAS)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.view_count, second.view_count), (13, 13))
+        self.assertAlmostEqual(first.trending_score, second.trending_score)
+
+    def test_full_saves_keep_flushed_views(self):
+        stale = Listing.objects.get(pk=self.listings[0].pk)
+        flush_views({stale.pk: 5}, now=1_800_000_000)
+        stale.price = 32000
+        stale.save()
+        listing = Listing.objects.get(pk=stale.pk)
+        self.assertEqual((listing.price, listing.view_count), (32000, 5))
+        self.assertAlmostEqual(listing.trending_score, view_score(5, 1_800_000_000))
+
+
+class ListingAdminTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='admin-pass')
+        cls.landlord = User.objects.create_user(username='landlord', password='landlord-pass')
+        cls.listings = make_listings(cls.landlord, 3, property_type='house')
+        rebuild_facet_counts()
+        Listing.objects.create(
+            title='Garden cottage', description='Quiet garden', property_type='house', furnished='furnished',
+            location='Karen', address='Karen Rd', price=60000, bedrooms=2, bathrooms=1, posted_by=cls.landlord,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelists_use_a_fixed_number_of_queries(self):
+        def add_rows():
+            other = User.objects.create_user(username='other', password='other-pass')
+            Favorite.objects.bulk_create(Favorite(user=other, listing=listing) for listing in make_listings(other, 5))
+
+        for name in ('listing', 'favorite'):
+            url = reverse(f'admin:listings_{name}_changelist')
+            self.assertQueriesIndependentOfRows(url, add_rows if name == 'listing' else lambda: None)
+        response = self.client.get(reverse('admin:listings_listing_changelist'))
+        self.assertIsInstance(response.context['cl'].paginator, EstimatedCountPaginator)
+        self.assertFalse(response.context['cl'].show_full_result_count)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Stemming needs the Postgres search backend')
+    def test_search_uses_the_search_backend(self):
+        response = self.client.get(reverse('admin:listings_listing_changelist'), {'q': 'gardens'})
+        self.assertEqual([listing.title for listing in response.context['cl'].result_list], ['Garden cottage'])
+
+    def test_search_matches_owner_and_address(self):
+        url = reverse('admin:listings_listing_changelist')
+        response = self.client.get(url, {'q': 'Karen Rd'})
+        self.assertEqual([listing.title for listing in response.context['cl'].result_list], ['Garden cottage'])
+        response = self.client.get(url, {'q': 'landlo'})
+        self.assertEqual(len(response.context['cl'].result_list), 4)
+
+    def test_bulk_actions_run_one_update(self):
+        url = reverse('admin:listings_listing_changelist')
+        pks = [listing.pk for listing in self.listings[:2]]
+        generation = listing_generation()
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, {'action': 'mark_rented', '_selected_action': pks})
+        self.assertEqual(response.status_code, 302)
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE "listings_listing"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Listing.objects.filter(availability='rented').count(), 2)
+        self.assertGreater(listing_generation(), generation)
+        self.assertEqual(global_facet_counts(), facet_counts(Listing.objects.live()))
+        self.assertEqual(global_facet_counts()['property_type']['house'], 2)
+
+        # Hiding an already hidden listing again leaves the counts alone
+        self.client.post(url, {'action': 'deactivate', '_selected_action': pks + [self.listings[2].pk]})
+        self.assertEqual(Listing.objects.filter(is_active=False).count(), 3)
+        self.assertEqual(global_facet_counts(), facet_counts(Listing.objects.live()))
+
+
+def make_upload(width=2000, height=1500, name='photo.jpg'):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), (200, 120, 40)).save(buffer, format='JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ListingApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='landlord', password='landlord-pass')
+        cls.listings = make_listings(cls.user, 25)
+        make_listings(cls.user, 3, property_type='house', price=90000)
+        make_listings(cls.user, 2, is_active=False)
+
+    def test_list_pages_with_a_cursor_in_one_query_each(self):
+        url = reverse('listings:api_listing_list')
+        with self.assertNumQueries(1):
+            first = self.client.get(url).json()
+        self.assertEqual(len(first['results']), 20)
+        self.assertEqual(set(first['results'][0]), set(api.LIST_FIELDS))
+        second = self.client.get(first['next']).json()
+        self.assertIsNone(second['next'])
+        ids = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(len(set(ids)), 28)
+
+    def test_list_applies_search_form_filters(self):
+        response = self.client.get(reverse('listings:api_listing_list'), {'property_type': 'house', 'min_price': 50000})
+        self.assertEqual([row['price'] for row in response.json()['results']], ['90000.00'] * 3)
+        response = self.client.get(reverse('listings:api_listing_list'), {'min_price': 'lots'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('min_price', response.json()['errors'])
+
+    def test_fields_selection(self):
+        url = reverse('listings:api_listing_detail', args=[self.listings[0].pk])
+        self.assertEqual(self.client.get(url, {'fields': 'title,owner'}).json(), {'title': 'Listing 0', 'owner': 'landlord'})
+        response = self.client.get(url, {'fields': 'title,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['errors']['fields'][0])
+
+    def test_detail_etag_and_conditional_get(self):
+        listing = self.listings[0]
+        url = reverse('listings:api_listing_detail', args=[listing.pk])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        # A different projection is a different representation
+        self.assertEqual(self.client.get(url, {'fields': 'title'}, headers={'If-None-Match': etag}).status_code, 200)
+
+        listing.title = 'Renovated'
+        listing.save()
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_etag_changes_when_the_page_changes(self):
+        url = reverse('listings:api_listing_list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        make_listings(self.user, 1)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_etags_change_with_the_favorite_count(self):
+        listing = Listing.objects.live().first()
+        urls = [reverse('listings:api_listing_list'), reverse('listings:api_listing_detail', args=[listing.pk])]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        # Counted by the Favorite signals without touching updated_at
+        Favorite.objects.create(user=self.user, listing=listing)
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_inactive_listing_is_not_found(self):
+        inactive = Listing.objects.filter(is_active=False).first()
+        response = self.client.get(reverse('listings:api_listing_detail', args=[inactive.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class CardFragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', password='owner-pass')
+        cls.tenant = User.objects.create_user(username='tenant', password='tenant-pass')
+        cls.listing = make_listings(cls.owner, 1)[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def render_cards(self):
+        page = load_cards(list(page_rows(Listing.objects.all())), self.tenant)
+        context = Context({'page_obj': page, 'user': self.tenant})
+        return Template('{% load listing_cards %}{% listing_cards page_obj %}').render(context)
+
+    def test_cards_are_served_from_the_cache(self):
+        html = self.render_cards()
+        key = card_cache_key(load_cards(list(page_rows(Listing.objects.all())), self.tenant)[0], True)
+        self.assertEqual(cache.get(key), html)
+        cache.set(key, 'cached card')
+        self.assertEqual(self.render_cards(), 'cached card')
+
+    def test_saving_the_listing_replaces_its_card(self):
+        self.assertIn('Listing 0', self.render_cards())
+        self.listing.title = 'Renovated bedsitter'
+        self.listing.save()
+        self.assertIn('Renovated bedsitter', self.render_cards())
+
+    def test_viewer_state_is_not_shared(self):
+        self.assertIn('far fa-heart', self.render_cards())
+        Favorite.objects.create(user=self.tenant, listing=self.listing)
+        html = self.render_cards()
+        self.assertIn('fas fa-heart text-red-500', html)
+        self.assertIn('1 saved', html)
+        anonymous = self.client.get(reverse('listings:home'))
+        self.assertNotContains(anonymous, 'id="favorite-btn-')
+
+    @override_settings(LISTING_CARD_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        self.render_cards()
+        self.assertFalse(cache.get(card_cache_key(load_cards(list(page_rows(Listing.objects.all())), self.tenant)[0], True)))
+
+
+class ListingCardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', password='owner-pass')
+        cls.tenant = User.objects.create_user(username='tenant', password='tenant-pass')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cards_follow_listing_and_favorite_writes(self):
+        listing = Listing.objects.create(
+            title='Garden flat', description='Quiet', property_type='apartment', furnished='furnished',
+            location='Kilimani', address='Nairobi', price=45000, bedrooms=2, bathrooms=1, posted_by=self.owner,
+        )
+        self.assertEqual((listing.card.title, listing.card.price, listing.card.image), ('Garden flat', 45000, {}))
+        listing.title = 'Renovated garden flat'
+        listing.save()
+        with self.assertNumQueries(1):
+            listing.save(update_fields=['description'])
+        Favorite.objects.create(user=self.tenant, listing=listing)
+        listing.card.refresh_from_db()
+        self.assertEqual((listing.card.title, listing.card.favorite_count), ('Renovated garden flat', 1))
+        Favorite.objects.all().delete()
+        listing.card.refresh_from_db()
+        self.assertEqual(listing.card.favorite_count, 0)
+        listing.delete()
+        self.assertFalse(ListingCard.objects.exists())
+
+    def test_full_saves_keep_concurrent_favorites(self):
+        listing = make_listings(self.owner, 1)[0]
+        sync_cards([listing])
+        stale = Listing.objects.get(pk=listing.pk)
+        Favorite.objects.create(user=self.tenant, listing=listing)
+        stale.title = 'Edited after the favorite'
+        stale.save()
+        listing.refresh_from_db()
+        self.assertEqual((listing.title, listing.favorite_count), ('Edited after the favorite', 1))
+        self.assertEqual(ListingCard.objects.get(pk=listing.pk).favorite_count, 1)
+
+    def test_pages_read_cards_in_one_query(self):
+        listings = make_listings(self.owner, 14)
+        Favorite.objects.create(user=self.tenant, listing=listings[0])
+        rows = list(page_rows(Listing.objects.live()).order_by('id'))
+        # Bulk-created listings get their cards on first view
+        cards = load_cards(rows, self.tenant)
+        self.assertEqual(ListingCard.objects.count(), 14)
+        with self.assertNumQueries(1):
+            self.assertEqual(load_cards(rows, self.tenant), cards)
+        self.assertEqual([card['id'] for card in cards], [listing.pk for listing in listings])
+        self.assertEqual([card['is_favorited'] for card in cards[:2]], [True, False])
+        self.assertNotIn('description', cards[0])
+
+        self.client.get(reverse('listings:home'))
+        # A cached page is a single card lookup
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('listings:home'))
+        self.assertEqual(len(response.context['page_obj']), 12)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Result sizes are measured with pg_column_size')
+    def test_benchmark_reports_both_read_paths(self):
+        make_listings(self.owner, 5)
+        out = StringIO()
+        call_command('benchmark_card_query', '--pages', '2', '--per-page', '3', stdout=out)
+        self.assertIn('before: Listing instances', out.getvalue())
+        self.assertIn('after: .values() rows + ListingCard', out.getvalue())
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_generates_fixed_width_webp_and_jpeg(self):
+        manifest = generate_derivatives(make_upload(), ['card', 'avatar'])
+        self.assertEqual([width for width, _ in manifest['card']['webp']], [320, 640])
+        self.assertEqual([width for width, _ in manifest['avatar']['jpeg']], [96, 192])
+
+        storage = get_derivative_storage()
+        width, path = manifest['card']['webp'][0]
+        with storage.open(path) as derivative, Image.open(derivative) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (320, 240)))
+
+    def test_never_upscales_small_sources(self):
+        manifest = generate_derivatives(make_upload(500, 400), ['detail'])
+        self.assertEqual([width for width, _ in manifest['detail']['jpeg']], [500])
+
+    def test_attaches_manifests_for_new_uploads_only(self):
+        listing = Listing(main_image=make_upload())
+        attach_derivatives(listing)
+        self.assertEqual(set(listing.main_image_derivatives), {'card', 'detail'})
+
+        listing.main_image = None
+        attach_derivatives(listing)
+        self.assertEqual(listing.main_image_derivatives, {})
+
+        profile = UserProfile(profile_picture=make_upload(300, 300))
+        attach_derivatives(profile)
+        self.assertEqual(set(profile.profile_picture_derivatives), {'avatar'})
+
+    def test_responsive_image_tag_emits_srcset(self):
+        listing = Listing(main_image=make_upload())
+        attach_derivatives(listing)
+        html = Template(
+            "{% load listing_images %}{% responsive_image listing 'main_image' 'card' alt='Flat' sizes='50vw' %}"
+        ).render(Context({'listing': listing}))
+        self.assertIn('<source type="image/webp" srcset="/media/derivatives/', html)
+        self.assertIn('-320.webp 320w, ', html)
+        self.assertIn('card-640.jpg 640w" sizes="50vw" alt="Flat"', html)
+
+
+class FailingMediaAdapter:
+    def store(self, instance, field_name, upload):
+        raise ConnectionError('storage unavailable')
+
+
+@override_settings(MEDIA_UPLOAD_ADAPTER='listings.media.LocalMediaAdapter', MEDIA_JOB_MAX_ATTEMPTS=2)
+class MediaQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='landlord', password='landlord-pass')
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name, MEDIA_STAGING_ROOT=f'{media_root.name}/staging')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client.force_login(self.user)
+
+    def post_listing(self, url, **overrides):
+        data = {
+            'title': 'Garden flat', 'description': 'Quiet', 'property_type': 'apartment',
+            'furnished': 'furnished', 'location': 'Lavington', 'address': 'James Gichuru Rd',
+            'price': '65000', 'bedrooms': '2', 'bathrooms': '1', 'availability': 'available',
+            'main_image': make_upload(),
+        }
+        data.update(overrides)
+        return self.client.post(url, data)
+
+    def test_create_listing_defers_the_upload_to_the_worker(self):
+        response = self.post_listing(reverse('listings:create_listing'))
+        listing = Listing.objects.get()
+        self.assertRedirects(response, reverse('listings:listing_detail', args=[listing.pk]))
+        self.assertFalse(listing.main_image)
+        self.assertEqual(listing.main_image_status, 'pending')
+        job = MediaJob.objects.get()
+        self.assertTrue(get_staging_storage().exists(job.staged_name))
+
+        call_command('process_media_jobs', '--once', stdout=StringIO())
+
+        listing.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual(listing.main_image_status, 'ready')
+        self.assertTrue(str(listing.main_image.public_id).startswith('uploads/listings.listing/main_image/'))
+        self.assertEqual(set(listing.main_image_derivatives), {'card', 'detail'})
+        self.assertEqual(job.status, 'done')
+        self.assertFalse(get_staging_storage().exists(job.staged_name))
+
+    def test_edit_keeps_the_current_image_until_processed(self):
+        self.post_listing(reverse('listings:create_listing'))
+        call_command('process_media_jobs', '--once', stdout=StringIO())
+        listing = Listing.objects.get()
+        original = listing.main_image.public_id
+
+        self.post_listing(reverse('listings:edit_listing', args=[listing.pk]), main_image=make_upload(800, 600, 'new.jpg'))
+        listing.refresh_from_db()
+        self.assertEqual((listing.main_image.public_id, listing.main_image_status), (original, 'pending'))
+
+        call_command('process_media_jobs', '--once', stdout=StringIO())
+        listing.refresh_from_db()
+        self.assertTrue(listing.main_image.public_id.endswith('new'))
+
+    @override_settings(MEDIA_UPLOAD_ADAPTER='listings.tests.FailingMediaAdapter')
+    def test_failed_uploads_retry_then_give_up(self):
+        self.post_listing(reverse('listings:create_listing'))
+        with self.assertLogs('listings.media', 'ERROR'):
+            call_command('process_media_jobs', '--once', stdout=StringIO())
+        job = MediaJob.objects.get()
+        self.assertEqual((job.status, job.attempts), ('pending', 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn('storage unavailable', job.last_error)
+
+        MediaJob.objects.update(run_after=timezone.now())
+        with self.assertLogs('listings.media', 'ERROR'):
+            call_command('process_media_jobs', '--once', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual(Listing.objects.get().main_image_status, 'failed')
+
+    def upload_gallery(self, listing, *files):
+        return self.client.post(
+            reverse('listings:upload_gallery', args=[listing.pk]), {'images': list(files)},
+            headers={'X-Requested-With': 'XMLHttpRequest'},
+        )
+
+    def test_gallery_upload_inserts_all_rows_at_once(self):
+        listing = make_listings(self.user, 1)[0]
+        files = [make_upload(400, 300, f'room-{n}.jpg') for n in range(3)]
+        with CaptureQueriesContext(connection) as context:
+            response = self.upload_gallery(listing, *files)
+        self.assertEqual(response.status_code, 201)
+        inserts = [q['sql'] for q in context.captured_queries if q['sql'].startswith('INSERT INTO "listings_listingimage"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(list(listing.images.values_list('image_status', flat=True)), ['pending'] * 3)
+        self.assertEqual(MediaJob.objects.filter(model_label='listings.ListingImage').count(), 3)
+
+        call_command('process_media_jobs', '--once', stdout=StringIO())
+        for image in listing.images.all():
+            self.assertEqual(image.image_status, 'ready')
+            self.assertEqual(set(image.image_derivatives), {'card', 'detail'})
+        response = self.client.get(reverse('listings:listing_detail', args=[listing.pk]))
+        self.assertContains(response, '<picture>', count=3)
+
+    def test_gallery_upload_rejects_invalid_files(self):
+        listing = make_listings(self.user, 1)[0]
+        bogus = SimpleUploadedFile('notes.jpg', b'not an image', content_type='image/jpeg')
+        response = self.upload_gallery(listing, make_upload(), bogus)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('notes.jpg', response.json()['errors'][0])
+        self.assertFalse(listing.images.exists())
+        self.assertFalse(MediaJob.objects.exists())
+
+    def test_gallery_upload_is_owner_only(self):
+        other = User.objects.create_user(username='other', password='other-pass')
+        listing = make_listings(other, 1)[0]
+        self.assertEqual(self.upload_gallery(listing, make_upload()).status_code, 404)
+
+
+IMPORT_CSV = """title,description,property_type,furnished,location,address,price,bedrooms,bathrooms,amenity_tags,amenities
+Garden flat,Quiet,apartment,furnished,Kilimani,Argwings Kodhek Rd,45000,2,1,"wifi,parking",
+Bedsitter,Near stage,studio,unfurnished,Roysambu,TRM Drive,9000,0,1,,Borehole water and CCTV
+Castle,Too big,palace,furnished,Karen,Karen Rd,-5,9,9,,
+Maisonette,Family home,house,semi_furnished,Westlands,Rhapta Rd,120000,4,3,gym,
+"""
+
+
+class ListingTransferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = User.objects.create_user(username='agent', password='agent-pass')
+        cls.admin = User.objects.create_user(username='admin', password='admin-pass', is_staff=True)
+
+    def upload(self, content, name='units.csv', **data):
+        self.client.force_login(self.agent)
+        return self.client.post(
+            reverse('listings:import_listings'),
+            {'file': SimpleUploadedFile(name, content.encode()), **data},
+            headers={'X-Requested-With': 'XMLHttpRequest'},
+        )
+
+    def test_csv_import_creates_valid_rows_and_reports_the_rest(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            report = self.upload(IMPORT_CSV).json()
+        self.assertEqual((report['rows'], report['created'], report['failed']), (4, 3, 1))
+        self.assertEqual(report['errors'][0]['line'], 4)
+        self.assertEqual(set(report['errors'][0]['errors']), {'property_type', 'price'})
+
+        flat = Listing.objects.get(title='Garden flat')
+        self.assertEqual(flat.posted_by, self.agent)
+        self.assertEqual((flat.latitude, flat.longitude), geocode('Kilimani'))
+        self.assertEqual(set(flat.amenity_tags.values_list('slug', flat=True)), {'wifi', 'parking'})
+        # Free-text amenities are tagged as in the listing form
+        bedsitter = Listing.objects.get(title='Bedsitter')
+        self.assertEqual(set(bedsitter.amenity_tags.values_list('slug', flat=True)), {'water', 'security'})
+        self.assertEqual(global_facet_counts()['property_type']['house'], 1)
+
+        response = self.client.post(reverse('listings:import_listings'), {
+            'file': SimpleUploadedFile('units.jsonl', b'{"title": "No price"}\n'), 'dry_run': 'on',
+        })
+        self.assertContains(response, '1 row(s) read: 0 valid, 1 with errors')
+        self.assertContains(response, 'price: This field is required.')
+
+    def test_batches_dry_runs_and_bad_jsonl_lines(self):
+        lines = [json.dumps({'title': f'Unit {n}', 'description': 'Unit', 'property_type': 'room', 'furnished': 'furnished',
+                             'location': 'Ngara', 'address': 'Ngara Rd', 'price': 7000 + n, 'bedrooms': 1, 'bathrooms': 1,
+                             'square_feet': None, 'amenity_tags': ['wifi']}) for n in range(5)]
+        stream = StringIO('\n'.join(lines[:2] + ['{not json', '[1, 2]'] + lines[2:]))
+        report = import_listings(stream, self.agent, 'jsonl', batch_size=2, dry_run=True)
+        self.assertEqual((report['valid'], report['created'], report['failed']), (5, 0, 2))
+        self.assertEqual([error['line'] for error in report['errors']], [3, 4])
+        self.assertFalse(Listing.objects.exists())
+
+        stream.seek(0)
+        # Amenity ids, then per batch of two rows a savepoint pair around four
+        # INSERTs (listings, amenities, saved search queue, cards) and the
+        # facet UPDATE
+        with self.assertNumQueries(1 + 3 * 7):
+            report = import_listings(stream, self.agent, 'jsonl', batch_size=2)
+        self.assertEqual(report['created'], 5)
+        self.assertEqual(ListingAmenity.objects.count(), 5)
+        self.assertEqual(UnmatchedListing.objects.count(), 5)
+        self.assertEqual(global_facet_counts(), facet_counts(Listing.objects.live()))
+        self.assertEqual(global_facet_counts()['bedrooms']['1'], 5)
+
+    def test_export_streams_a_file_that_imports_again(self):
+        self.upload(IMPORT_CSV)
+        self.client.force_login(self.agent)
+        self.assertEqual(self.client.get(reverse('listings:export_listings')).status_code, 302)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('listings:export_listings'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="listings.csv"')
+        exported = b''.join(response.streaming_content).decode()
+        self.assertIn('"parking,wifi"', exported)
+
+        response = self.client.get(reverse('listings:export_listings'), {'format': 'jsonl'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(sorted(row['title'] for row in rows), ['Bedsitter', 'Garden flat', 'Maisonette'])
+        self.assertEqual(rows[0]['posted_by'], 'agent')
+        self.assertEqual(self.client.get(reverse('listings:export_listings'), {'format': 'xml'}).status_code, 400)
+
+        report = import_listings(StringIO(exported), self.admin)
+        self.assertEqual((report['created'], report['failed']), (3, 0))
+        self.assertEqual(Listing.objects.filter(posted_by=self.admin, amenity_tags__slug='wifi').count(), 1)
+
+
+class SeedAndBenchmarkTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_seed_command_fills_every_table_consistently(self):
+        call_command('seed_listings', '--users', '20', '--listings', '60', '--favorites', '80',
+                     '--batch-size', '25', '--seed', '1', stdout=StringIO())
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(UserProfile.objects.count(), 20)
+        self.assertEqual(Listing.objects.count(), 60)
+        self.assertFalse(Listing.objects.filter(posted_by__profile__is_landlord=False).exists())
+        self.assertFalse(Listing.objects.filter(geo_cell__isnull=True).exists())
+        self.assertTrue(ListingAmenity.objects.exists())
+        self.assertEqual(Favorite.objects.count(), 80)
+        for listing in Listing.objects.all():
+            self.assertEqual(listing.favorite_count, listing.favorited_by.count())
+            self.assertEqual(listing.geo_cell, grid_cell(listing.latitude, listing.longitude))
+
+    def test_percentile_interpolates(self):
+        self.assertEqual(percentile([10, 20, 30, 40], 50), 25)
+        self.assertEqual(percentile([10, 20, 30, 40], 100), 40)
+        self.assertIsNone(percentile([], 95))
+
+    def test_client_benchmark_reports_json(self):
+        call_command('seed_listings', '--users', '5', '--listings', '20', '--favorites', '10',
+                     '--seed', '2', stdout=StringIO())
+        out = StringIO()
+        call_command('run_benchmarks', '--requests', '4', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report['scenarios']), set(SCENARIOS))
+        for stats in report['scenarios'].values():
+            self.assertEqual((stats['requests'], stats['errors']), (4, 0))
+            self.assertGreater(stats['queries_per_request'], 0)
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+        self.assertEqual(report['total']['requests'], 4 * len(SCENARIOS))
+
+    def test_load_benchmark_stops_on_a_rate_limited_target(self):
+        class Throttled(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(429)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Throttled)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        call_command('seed_listings', '--users', '2', '--listings', '4', '--favorites', '0', '--seed', '2', stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, 'RATELIMIT_ENABLED=False'):
+            call_command(
+                'run_benchmarks', '--mode', 'load', '--url', f'http://127.0.0.1:{server.server_port}',
+                '--scenarios', 'home', '--users', '1', '--duration', '5', '--think-time', '0', stdout=StringIO(),
+            )
+
+
+class StaticPipelineTests(TestCase):
+    def setUp(self):
+        source, root = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.addCleanup(root.cleanup)
+        self.css = b'.listing-card { display: flex; }\n' * 100
+        with open(os.path.join(source.name, 'site.css'), 'wb') as css:
+            css.write(self.css)
+        Image.new('RGB', (1500, 1000), 'teal').save(os.path.join(source.name, 'hero.jpg'))
+        override = override_settings(
+            STATICFILES_DIRS=[source.name], STATIC_ROOT=root.name,
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.report = StringIO()
+        call_command('build_static', stdout=self.report)
+
+    def test_build_hashes_compresses_and_encodes(self):
+        hashed_css = staticfiles_storage.hashed_files['site.css']
+        self.assertNotEqual(hashed_css, 'site.css')
+        self.assertTrue(staticfiles_storage.exists(hashed_css + '.gz'))
+        # Never upscaled: the 1920 copy is the 1500px original re-encoded
+        self.assertEqual(
+            [name for name in staticfiles_storage.hashed_files if name.endswith('.webp')],
+            ['hero.640.webp', 'hero.1280.webp', 'hero.1500.webp'],
+        )
+        self.assertIn('hero.jpg', self.report.getvalue())
+        self.assertIn('total', self.report.getvalue())
+
+    def test_middleware_negotiates_encoding_and_caches_hashed_names(self):
+        url = static('site.css')
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.css)
+
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(b''.join(response.streaming_content), self.css)
+
+        response = self.client.get(static('hero.1280.webp'))
+        self.assertEqual(response['Content-Type'], 'image/webp')
+
+        # Unhashed names must be revalidated
+        response = self.client.get('/static/site.css')
+        self.assertIn('must-revalidate', response['Cache-Control'])
+        response = self.client.get('/static/site.css', headers={'If-Modified-Since': response['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/static/missing.css').status_code, 404)
+
+    def test_bundled_photos_render_with_their_webp_copies(self):
+        template = Template("{% load listing_images %}{% static_picture 'hero.jpg' alt='Hero' %}")
+        html = template.render(Context())
+        self.assertInHTML(
+            f'<picture><source type="image/webp" sizes="100vw" srcset="{static("hero.640.webp")} 640w, '
+            f'{static("hero.1280.webp")} 1280w, {static("hero.1500.webp")} 1500w">'
+            f'<img src="{static("hero.jpg")}" alt="Hero" class="" loading="lazy" decoding="async"></picture>',
+            html,
+        )
+        self.assertNotIn('/static/hero.jpg', html)
+        with self.settings(DEBUG=True):
+            self.assertNotIn('<picture>', template.render(Context()))
+
+
+@override_settings(SERVER_TIMING_HEADER=True)
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tenant', password='tenant-pass')
+        cls.staff = User.objects.create_user(username='ops', password='ops-pass', is_staff=True)
+        make_listings(cls.user, 3)
+
+    def setUp(self):
+        registry.reset()
+        cache.clear()
+
+    def server_timing(self, response):
+        return dict(
+            (entry.split(';')[0].strip(), entry) for entry in response['Server-Timing'].split(',')
+        )
+
+    @override_settings(SERVER_TIMING_HEADER=False)
+    def test_server_timing_header_can_be_turned_off(self):
+        self.assertFalse(self.client.get(reverse('listings:home')).has_header('Server-Timing'))
+
+    def test_server_timing_reports_queries_render_and_cache(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('listings:home'))
+        timing = self.server_timing(response)
+        self.assertIn(f'desc="{len(context)} queries"', timing['db'])
+        self.assertIn('render;dur=', timing['render'])
+        self.assertIn('hits', timing['cache'])
+
+        timing = self.server_timing(self.client.get(reverse('listings:home')))
+        self.assertRegex(timing['cache'], r'desc="[1-9]\d* hits')
+
+    def test_request_log_line(self):
+        with self.assertLogs('listings.requests', 'INFO') as logs:
+            self.client.get(reverse('listings:search'), {'bedrooms': 2})
+        entry = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((entry['view'], entry['status']), ('listings:search', 200))
+        self.assertGreater(entry['db_queries'], 0)
+        self.assertGreaterEqual(entry['duration_ms'], entry['db_ms'])
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_queries_are_logged_without_parameters(self):
+        with self.assertLogs('listings.slow_queries', 'WARNING') as logs:
+            self.client.get(reverse('listings:search'), {'location': 'secret-term'})
+        entries = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertTrue(all(entry['path'] == reverse('listings:search') for entry in entries))
+        self.assertNotIn('secret-term', logs.output[0] + ''.join(entry['sql'] for entry in entries))
+
+    def test_metrics_endpoint_is_staff_only(self):
+        self.client.get(reverse('listings:home'))
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('listings:metrics')).status_code, 302)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('listings:metrics'))
+        self.assertEqual(response['Content-Type'], PROMETHEUS_CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn('roomlink_requests_total{view="listings:home",method="GET",status="200"} 1', body)
+        self.assertIn('roomlink_request_duration_seconds_bucket{view="listings:home",le="+Inf"} 1', body)
+        self.assertIn('roomlink_request_db_queries_count{view="listings:home"} 1', body)
+
+
+@override_settings(DATABASE_READ_REPLICA='replica')
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+        @read_from_replica
+        def view(request):
+            return HttpResponse(str(ReplicaRouter().db_for_read(Listing)))
+        self.view = view
+
+    def test_safe_requests_read_from_the_replica(self):
+        self.assertEqual(self.view(self.factory.get('/')).content, b'replica')
+        self.assertIsNone(ReplicaRouter().db_for_read(Listing))
+        self.assertEqual(ReplicaRouter().db_for_write(Listing), 'default')
+
+    def test_writes_and_pinned_browsers_stay_on_default(self):
+        self.assertEqual(self.view(self.factory.post('/')).content, b'None')
+        pinned = self.factory.get('/')
+        pinned.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(self.view(pinned).content, b'None')
+
+    def test_writes_set_the_pin_cookie(self):
+        user = User.objects.create_user(username='tenant', password='tenant-pass')
+        listing = make_listings(user, 1)[0]
+        self.client.force_login(user)
+        response = self.client.post(reverse('listings:toggle_favorite', args=[listing.pk]))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertNotIn(PIN_COOKIE, self.client.get(reverse('listings:home')).cookies)
+
+    @override_settings(DATABASE_READ_REPLICA='')
+    def test_no_replica_configured(self):
+        self.assertEqual(self.view(self.factory.get('/')).content, b'None')
+
+
+class RateLimitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tenant', password='tenant-pass')
+        cls.other = User.objects.create_user(username='other', password='other-pass')
+        cls.listing = make_listings(cls.user, 1)[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_sliding_window(self):
+        # 10 a minute: the first 10 fit, the 11th waits for the window to slide
+        self.assertEqual([hit('key', '10/m', now=600 + n) for n in range(10)], [0] * 10)
+        self.assertEqual(hit('key', '10/m', now=615), 45)
+        # Half way into the next window half of the previous one still counts
+        self.assertEqual([hit('key', '10/m', now=690) for _ in range(5)], [0] * 5)
+        self.assertEqual(hit('key', '10/m', now=690), 1)
+        self.assertEqual(hit('other', '10/m', now=690), 0)
+        self.assertEqual(evaluate(current=0, previous=10, limit=10, period=60, elapsed=30), 0)
+        self.assertEqual(evaluate(current=5, previous=10, limit=10, period=60, elapsed=30), 1)
+
+    def test_constant_cache_work_per_check(self):
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many, \
+                mock.patch.object(cache, 'incr', wraps=cache.incr) as incr:
+            for n in range(50):
+                hit('key', '1000/m', now=600 + n)
+        self.assertEqual(get_many.call_count, 50)
+        self.assertEqual(incr.call_count, 49)
+
+    @override_settings(RATELIMITS={'search': {'user': '3/m', 'ip': '2/m'}})
+    def test_search_gets_429_with_retry_after(self):
+        url = reverse('listings:search')
+        self.assertEqual([self.client.get(url).status_code for _ in range(3)], [200, 200, 429])
+        response = self.client.get(url, headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 60)
+        self.assertEqual(response.json()['retry_after'], int(response['Retry-After']))
+
+        # Another address, and a signed-in user, have budgets of their own
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.9').status_code, 200)
+        self.client.force_login(self.user)
+        self.assertEqual([self.client.get(url).status_code for _ in range(4)], [200, 200, 200, 429])
+
+    @override_settings(RATELIMITS={'favorite': {'user': '1/m'}})
+    def test_favorite_budget_is_per_user(self):
+        url = reverse('listings:toggle_favorite', args=[self.listing.pk])
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.assertEqual(self.client.post(url).status_code, 429)
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.post(url).status_code, 302)
+
+    @override_settings(RATELIMITS={'register': {'ip': '1/h'}})
+    def test_only_form_submissions_count(self):
+        url = reverse('listings:register')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.post(url, {'username': ''}).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.post(url, {'username': ''})
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 3600)
+
+    @override_settings(RATELIMITS={'global': {'ip': '2/m'}}, RATELIMIT_TRUSTED_PROXIES=1)
+    def test_middleware_limits_each_address(self):
+        url = reverse('listings:about')
+        statuses = [self.client.get(url, HTTP_X_FORWARDED_FOR='10.0.0.1').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        # Only the entry the trusted proxy appended counts, not what the client sent
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='10.0.0.2, 10.0.0.1').status_code, 429)
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='10.0.0.1, 10.0.0.2').status_code, 200)
+
+    @override_settings(RATELIMITS={'global': {'ip': '1/m'}})
+    def test_middleware_skips_static_and_media_and_warns_about_proxies(self):
+        for path in ('/static/css/site.css', '/media/photo.jpg'):
+            self.assertNotEqual([self.client.get(path).status_code for _ in range(2)][-1], 429)
+        url = reverse('listings:about')
+        with self.assertLogs('listings.ratelimit', 'ERROR'):
+            self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='10.0.0.1').status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 429)
+
+    def test_no_global_limit_unless_configured(self):
+        self.assertIsNone(budget(RequestFactory().get('/'), 'global'))
+
+    @override_settings(RATELIMITS={'search': {'ip': '1/m'}}, RATELIMIT_ENABLED=False)
+    def test_disabled(self):
+        url = reverse('listings:search')
+        self.assertEqual([self.client.get(url).status_code for _ in range(3)], [200, 200, 200])
+
+    @override_settings(ROOT_URLCONF='roomlink.asgi_urls', RATELIMITS={'search': {'ip': '1/m'}, 'favorite': {'user': '1/m'}})
+    async def test_async_views(self):
+        url = reverse('listings:search')
+        self.assertEqual((await self.async_client.get(url)).status_code, 200)
+        self.assertEqual((await self.async_client.get(url)).status_code, 429)
+
+        await self.async_client.aforce_login(self.user)
+        url = reverse('listings:toggle_favorite', args=[self.listing.pk])
+        self.assertEqual((await self.async_client.post(url)).status_code, 302)
+        self.assertEqual((await self.async_client.post(url)).status_code, 429)
+
+
+@override_settings(ROOT_URLCONF='roomlink.asgi_urls', SERVER_TIMING_HEADER=True)
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tenant', password='tenant-pass')
+        cls.listings = make_listings(cls.user, 15)
+        wifi = Amenity.objects.get(slug='wifi')
+        ListingAmenity.objects.create(listing=cls.listings[0], amenity=wifi)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_async_views_are_routed(self):
+        self.assertTrue(iscoroutinefunction(resolve(reverse('listings:home')).func))
+        self.assertTrue(iscoroutinefunction(resolve(reverse('listings:listing_detail', args=[1])).func))
+
+    async def test_home_pages_and_totals(self):
+        response = await self.async_client.get(reverse('listings:home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 12)
+        self.assertEqual(response.context['total_listings'], 15)
+
+        response = await self.async_client.get(reverse('listings:home') + response.context['next_page_url'], headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertIsNone(response.json()['next_page_url'])
+        self.assertEqual(response.json()['html'].count('listing-card '), 3)
+
+        # Served from the search cache the second time
+        response = await self.async_client.get(reverse('listings:home'))
+        self.assertEqual(response.context['total_listings'], 15)
+
+    async def test_search_with_amenities(self):
+        response = await self.async_client.get(reverse('listings:search'), {'amenities': 'wifi'})
+        self.assertEqual([card['id'] for card in response.context['page_obj']], [self.listings[0].pk])
+
+    async def test_detail_and_favorite_toggle(self):
+        listing = self.listings[0]
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('listings:listing_detail', args=[listing.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('gallery_form', response.context)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+
+        url = reverse('listings:toggle_favorite', args=[listing.pk])
+        response = await self.async_client.post(url, headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(response.json()['is_favorited'], True)
+        self.assertEqual(response.json()['favorite_count'], 1)
+        response = await self.async_client.post(url)
+        self.assertRedirects(response, reverse('listings:listing_detail', args=[listing.pk]),
+                             fetch_redirect_response=False)
+        self.assertFalse(await Favorite.objects.filter(listing=listing).aexists())
+
+    async def test_missing_listing_and_anonymous_toggle(self):
+        response = await self.async_client.get(reverse('listings:listing_detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.post(reverse('listings:toggle_favorite', args=[self.listings[0].pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('login', response['Location'])
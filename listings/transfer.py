@@ -0,0 +1,161 @@
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Prefetch
+
+from .cache import bump_listing_generation
+from .cards import sync_cards
+from .facets import add_facet_counts, instance_facet_counts
+from .forms import ListingImportForm
+from .geo import assign_coordinates
+from .models import Amenity, Listing, ListingAmenity, UnmatchedListing
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson'}
+IMPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+# Errors beyond this many are counted but not kept, so a bad file cannot use up memory
+MAX_REPORTED_ERRORS = 100
+
+# Columns of an export; an import reads the ListingForm fields among them and
+# ignores the rest, so an export can be imported again as it is
+EXPORT_FIELDS = [
+    'id', 'title', 'description', 'property_type', 'furnished', 'location', 'address', 'price',
+    'bedrooms', 'bathrooms', 'square_feet', 'availability', 'contact_phone', 'contact_email',
+    'amenities', 'amenity_tags', 'latitude', 'longitude', 'is_active', 'posted_by', 'created_at', 'updated_at',
+]
+
+
+def detect_format(filename, default='csv'):
+    if filename.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    if filename.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_rows(stream, format):
+    """(line number, row dict, error) for each record of a text stream, read lazily"""
+    if format == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_number, None, f'Invalid JSON: {exc}'
+                continue
+            if isinstance(row, dict):
+                yield line_number, row, None
+            else:
+                yield line_number, None, 'Each line must be a JSON object.'
+        return
+
+    reader = csv.DictReader(stream)
+    for row in reader:
+        if None in row:
+            yield reader.line_num, None, 'Row has more values than the header.'
+        else:
+            yield reader.line_num, row, None
+
+
+def form_data(row):
+    """A row as ListingImportForm data; amenity tags may be a list or comma separated"""
+    data = {name: '' if value is None else value for name, value in row.items()}
+    tags = data.get('amenity_tags') or []
+    if not isinstance(tags, list):
+        tags = [slug.strip() for slug in str(tags).split(',') if slug.strip()]
+    data['amenity_tags'] = tags
+    return data
+
+
+def import_listings(stream, owner, format='csv', batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+    """Validate rows with ListingForm's rules and bulk-insert the valid ones for `owner`
+
+    The stream is read, validated and inserted one batch at a time, so memory
+    stays flat whatever the file size. Invalid rows are skipped and reported
+    by line number. Signals do not run for bulk_create, so coordinates, amenity
+    tags, cards and the facet summary are brought up to date and the new
+    listings queued for saved search matching here, batch by batch.
+    """
+    report = {'rows': 0, 'valid': 0, 'created': 0, 'failed': 0, 'errors': []}
+    amenity_ids = dict(Amenity.objects.values_list('slug', 'pk'))
+    rows = read_rows(stream, format)
+    while batch := list(islice(rows, batch_size)):
+        valid = []
+        for line_number, row, error in batch:
+            report['rows'] += 1
+            if row is not None:
+                form = ListingImportForm(form_data(row))
+                if form.is_valid():
+                    listing = form.instance
+                    listing.posted_by = owner
+                    assign_coordinates(listing)
+                    valid.append((listing, form.cleaned_data['amenity_tags']))
+                    continue
+                error = {field: list(messages) for field, messages in form.errors.items()}
+            report['failed'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'line': line_number, 'errors': error if isinstance(error, dict) else {'__all__': [error]}})
+
+        report['valid'] += len(valid)
+        if valid and not dry_run:
+            with transaction.atomic():
+                created = Listing.objects.bulk_create([listing for listing, _ in valid])
+                ListingAmenity.objects.bulk_create([
+                    ListingAmenity(listing_id=listing.pk, amenity_id=amenity_ids[slug])
+                    for listing, (_, slugs) in zip(created, valid) for slug in slugs if slug in amenity_ids
+                ])
+                UnmatchedListing.objects.bulk_create([
+                    UnmatchedListing(listing_id=listing.pk) for listing in created if listing.availability == 'available'
+                ])
+                sync_cards(created)
+                add_facet_counts(instance_facet_counts(created))
+                transaction.on_commit(bump_listing_generation)
+            report['created'] += len(created)
+    return report
+
+
+def export_rows(queryset):
+    """A dict of EXPORT_FIELDS per listing, read from the database in chunks"""
+    # Only the exported columns: search_vector and image manifests are large
+    columns = [field for field in EXPORT_FIELDS if field not in ('amenity_tags', 'posted_by')]
+    listings = (
+        queryset.select_related('posted_by').only(*columns, 'posted_by__username')
+        .prefetch_related(Prefetch('amenity_tags', queryset=Amenity.objects.only('slug')))
+        .order_by('pk')
+    )
+    for listing in listings.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        row = {field: getattr(listing, field) for field in columns}
+        row.update(
+            price=str(listing.price),
+            amenity_tags=[amenity.slug for amenity in listing.amenity_tags.all()],
+            posted_by=listing.posted_by.username,
+            created_at=listing.created_at.isoformat(),
+            updated_at=listing.updated_at.isoformat(),
+        )
+        yield row
+
+
+class Echo:
+    """File-like object handing back what csv.writer writes, one row at a time"""
+
+    def write(self, value):
+        return value
+
+
+def export_lines(queryset, format='csv'):
+    """The export as an iterator of text chunks: CSV with a header row, or JSON lines"""
+    rows = export_rows(queryset)
+    if format == 'jsonl':
+        for row in rows:
+            yield json.dumps(row) + '\n'
+        return
+
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        row['amenity_tags'] = ','.join(row['amenity_tags'])
+        yield writer.writerow(['' if row[field] is None else row[field] for field in EXPORT_FIELDS])
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'listings'
 
@@ -9,12 +9,18 @@ urlpatterns = [
     path('contact/', views.contact, name='contact'),
     path('register/', views.register, name='register'),
     path('search/', views.search_listings, name='search'),
+    path('search/save/', views.save_search, name='save_search'),
+    path('searches/', views.saved_searches, name='saved_searches'),
+    path('searches/<int:pk>/delete/', views.delete_saved_search, name='delete_saved_search'),
     
     # Listing views
     path('listing/create/', views.create_listing, name='create_listing'),
+    path('listing/import/', views.import_listings, name='import_listings'),
+    path('listing/export/', views.export_listings, name='export_listings'),
     path('listing/<int:pk>/', views.listing_detail, name='listing_detail'),
     path('listing/<int:pk>/edit/', views.edit_listing, name='edit_listing'),
     path('listing/<int:pk>/delete/', views.delete_listing, name='delete_listing'),
+    path('listing/<int:pk>/gallery/', views.upload_gallery, name='upload_gallery'),
     
     # User profile
     path('profile/', views.profile, name='profile'),
@@ -22,5 +28,12 @@ urlpatterns = [
     # Favorites
     path('listing/<int:pk>/favorite/', views.toggle_favorite, name='toggle_favorite'),
     
+    # Read-only JSON API
+    path('api/listings/', api.listing_list, name='api_listing_list'),
+    path('api/listings/<int:pk>/', api.listing_detail, name='api_listing_detail'),
+    
+    # Prometheus scrape target (staff only)
+    path('metrics/', views.metrics, name='metrics'),
+    
     path('debug-urls/', views.debug_urls, name='debug_urls'),
 ] 
@@ -1,66 +1,114 @@
+import io
+from urllib.parse import urlencode
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login, authenticate
 from django.contrib import messages
+from django.db import IntegrityError, transaction
 from django.db.models import Q
-from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.views.decorators.http import require_POST
 from django.contrib.auth.models import User
-from .models import Listing, UserProfile, Favorite, ListingImage
-from .forms import UserRegistrationForm, UserProfileForm, ListingForm, ListingImageForm, SearchForm
+from .models import Listing, UserProfile, Favorite, ListingImage, SavedSearch
+from .forms import UserRegistrationForm, UserProfileForm, ListingForm, ListingImageForm, GalleryUploadForm, SearchForm, ListingImportUploadForm
+from .cache import normalize_params, search_cache
+from .cards import load_cards, page_rows
+from .facets import facet_links, search_facets
+from .instrumentation import PROMETHEUS_CONTENT_TYPE, registry
+from .media import add_gallery_images, save_with_deferred_uploads
+from .pagination import CursorPage, CursorPaginator, approximate_count
+from .popularity import view_buffer
+from .ratelimit import ratelimit
+from .routers import read_from_replica
+from .saved_searches import describe
+from . import transfer
 from django.http import HttpResponse
 
-def home(request):
-    """Home page with featured listings and search form"""
-    search_form = SearchForm(request.GET)
-    listings = Listing.objects.filter(is_active=True, availability='available')
-    
-    # Apply search filters
-    if search_form.is_valid():
-        location = search_form.cleaned_data.get('location')
-        property_type = search_form.cleaned_data.get('property_type')
-        min_price = search_form.cleaned_data.get('min_price')
-        max_price = search_form.cleaned_data.get('max_price')
-        bedrooms = search_form.cleaned_data.get('bedrooms')
-        
-        if location:
-            listings = listings.filter(location__icontains=location)
-        if property_type:
-            listings = listings.filter(property_type=property_type)
-        if min_price:
-            listings = listings.filter(price__gte=min_price)
-        if max_price:
-            listings = listings.filter(price__lte=max_price)
-        if bedrooms:
-            listings = listings.filter(bedrooms__gte=bedrooms)
-    
-    # Pagination
-    paginator = Paginator(listings, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
+LISTINGS_PER_PAGE = 12
+# Listing columns the profile page's grids show
+PROFILE_LISTING_FIELDS = ('title', 'property_type', 'location', 'price', 'availability', 'bedrooms', 'bathrooms')
+
+def listing_feed(request, listings, search_form, template_name):
+    """Render one cursor page of a listing feed, or just its cards for 'load more' requests"""
+    cursor = request.GET.get('after')
+    params = search_form.cleaned_data if search_form.is_valid() else {}
+
+    # The page is paginated on narrow .values() rows and its cards read from
+    # ListingCard. Only the rows are cached, so a hit is one card lookup.
+    page_key = search_cache.make_key('cards', {**params, 'after': cursor})
+    cached_page = search_cache.get(page_key)
+    if cached_page is None:
+        page = CursorPaginator(page_rows(listings), LISTINGS_PER_PAGE).get_page(cursor)
+        cached_page = {'rows': page.object_list, 'next_cursor': page.next_cursor}
+        search_cache.set(page_key, cached_page)
+    page_obj = CursorPage(load_cards(cached_page['rows'], request.user), cached_page['next_cursor'])
+
+    next_page_url = feed_next_page_url(request, page_obj)
+
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        html = render_to_string('listings/includes/listing_cards.html', {'page_obj': page_obj}, request=request)
+        return JsonResponse({'html': html, 'next_page_url': next_page_url})
+
+    total_listings, total_is_estimate = search_cache.get_or_set('total', params, lambda: approximate_count(listings))
+    facets = search_cache.get_or_set('facets', params, lambda: search_facets(listings, params))
     context = {
         'page_obj': page_obj,
+        'next_page_url': next_page_url,
         'search_form': search_form,
-        'total_listings': listings.count(),
+        'total_listings': total_listings,
+        'total_is_estimate': total_is_estimate,
+        'facets': facet_links(facets, request.GET, reverse('listings:search')),
     }
-    return render(request, 'listings/home.html', context)
+    return render(request, template_name, context)
+
+def feed_next_page_url(request, page_obj):
+    if not page_obj.has_next:
+        return None
+    query = request.GET.copy()
+    query['after'] = page_obj.next_cursor
+    return f'?{query.urlencode()}'
+
+def filtered_listings(search_form):
+    """Live listings narrowed by a bound SearchForm, when it is valid"""
+    listings = Listing.objects.live()
+    if search_form.is_valid():
+        listings = listings.search(search_form.cleaned_data)
+    return listings
+
+def home(request):
+    """Home page with featured listings and search form"""
+    search_form = SearchForm(request.GET)
+    return listing_feed(request, filtered_listings(search_form), search_form, 'listings/home.html')
 
+@read_from_replica
 def listing_detail(request, pk):
     """Detail view for a single listing"""
-    listing = get_object_or_404(Listing, pk=pk, is_active=True)
-    is_favorited = False
-    
-    if request.user.is_authenticated:
-        is_favorited = Favorite.objects.filter(user=request.user, listing=listing).exists()
+    # Owner and favorite state come back with the listing in a single query;
+    # the gallery and amenity tags are one prefetch each
+    listings = (
+        Listing.objects.select_related('posted_by')
+        .with_favorite_state(request.user)
+        .prefetch_related('images', 'amenity_tags')
+    )
+    listing = get_object_or_404(listings, pk=pk, is_active=True)
+    is_owner = request.user == listing.posted_by
+    # Buffered in memory; every few seconds one request writes the batch
+    if not is_owner and view_buffer.record(listing.pk):
+        view_buffer.flush()
     
     context = {
         'listing': listing,
-        'is_favorited': is_favorited,
+        'is_favorited': listing.is_favorited,
     }
+    if is_owner:
+        context['gallery_form'] = GalleryUploadForm()
     return render(request, 'listings/listing_detail.html', context)
 
+@ratelimit('register', methods=['POST'])
 def register(request):
     """User registration view"""
     if request.method == 'POST':
@@ -89,15 +137,28 @@ def profile(request):
     if request.method == 'POST':
         form = UserProfileForm(request.POST, request.FILES, instance=profile)
         if form.is_valid():
-            form.save()
+            save_with_deferred_uploads(form.save(commit=False))
             messages.success(request, 'Profile updated successfully!')
-            return redirect('profile')
+            return redirect('listings:profile')
     else:
         form = UserProfileForm(instance=profile)
     
-    # Get user's listings and favorites
-    user_listings = Listing.objects.filter(posted_by=request.user).order_by('-created_at')
-    user_favorites = Favorite.objects.filter(user=request.user).select_related('listing').order_by('-created_at')
+    # Get user's listings and favorites. The grids read only these listing
+    # columns and no relations, so there is nothing to prefetch: one query
+    # each covers both grids whatever their size (5 queries in total, see
+    # QueryBudgetTests.test_profile). The large search and image columns stay
+    # behind.
+    user_listings = (
+        Listing.objects.filter(posted_by=request.user)
+        .only(*PROFILE_LISTING_FIELDS)
+        .order_by('-created_at')
+    )
+    user_favorites = (
+        Favorite.objects.filter(user=request.user)
+        .select_related('listing')
+        .only('listing_id', *(f'listing__{field}' for field in PROFILE_LISTING_FIELDS))
+        .order_by('-created_at')
+    )
     
     context = {
         'form': form,
@@ -108,33 +169,19 @@ def profile(request):
     return render(request, 'listings/profile.html', context)
 
 @login_required
-@login_required
+@ratelimit('create_listing', methods=['POST'])
 def create_listing(request):
     """Create a new listing"""
     if request.method == 'POST':
-        print("POST request received")  # Debug
         form = ListingForm(request.POST, request.FILES)
-        print(f"Form is valid: {form.is_valid()}")  # Debug
-        
         if form.is_valid():
             listing = form.save(commit=False)
             listing.posted_by = request.user
-            listing.save()
-            print(f"Listing saved with pk: {listing.pk}")  # Debug
-            
-            # Test the reverse before redirecting
-            from django.urls import reverse
-            try:
-                test_url = reverse('listing_detail', kwargs={'pk': listing.pk})
-                print(f"Reverse URL works: {test_url}")  # Debug
-                messages.success(request, 'Listing created successfully!')
-                return redirect('listings:listing_detail', pk=listing.pk)
-            except Exception as e:
-                print(f"Reverse failed: {e}")  # Debug
-                messages.error(request, f'Listing created but redirect failed: {e}')
-                return redirect('home')
-        else:
-            print(f"Form errors: {form.errors}")  # Debug
+            # The image itself is uploaded by the media worker
+            save_with_deferred_uploads(listing)
+            form.save_m2m()
+            messages.success(request, 'Listing created successfully!')
+            return redirect('listings:listing_detail', pk=listing.pk)
     else:
         form = ListingForm()
     
@@ -148,14 +195,77 @@ def edit_listing(request, pk):
     if request.method == 'POST':
         form = ListingForm(request.POST, request.FILES, instance=listing)
         if form.is_valid():
-            form.save()
+            save_with_deferred_uploads(form.save(commit=False))
+            form.save_m2m()
             messages.success(request, 'Listing updated successfully!')
-            return redirect('listing_detail', pk=listing.pk)
+            return redirect('listings:listing_detail', pk=listing.pk)
     else:
         form = ListingForm(instance=listing)
     
     return render(request, 'listings/listing_form.html', {'form': form, 'title': 'Edit Listing'})
 
+@login_required
+def import_listings(request):
+    """Create many listings at once from an uploaded CSV or JSON lines file"""
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    report = None
+    if request.method == 'POST':
+        form = ListingImportUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            # Large uploads are spooled to disk by Django and read back a batch at a time
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            report = transfer.import_listings(
+                stream, request.user, form.cleaned_data['format'] or transfer.detect_format(upload.name),
+                dry_run=form.cleaned_data['dry_run'],
+            )
+            if is_ajax:
+                return JsonResponse(report)
+            if report['created']:
+                messages.success(request, f'{report["created"]} listing(s) imported.')
+        elif is_ajax:
+            return JsonResponse({'errors': form.errors}, status=400)
+    else:
+        form = ListingImportUploadForm()
+
+    return render(request, 'listings/listing_import.html', {'form': form, 'report': report})
+
+@staff_member_required
+def export_listings(request):
+    """Stream the whole Listing table as CSV (default) or JSON lines"""
+    format = request.GET.get('format', 'csv')
+    if format not in transfer.FORMATS:
+        return HttpResponseBadRequest(f'Unknown export format: {format}')
+    response = StreamingHttpResponse(
+        transfer.export_lines(Listing.objects.all(), format), content_type=transfer.CONTENT_TYPES[format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="listings.{format}"'
+    return response
+
+@login_required
+@require_POST
+def upload_gallery(request, pk):
+    """Add several photos to a listing's gallery in one request"""
+    listing = get_object_or_404(Listing, pk=pk, posted_by=request.user)
+    form = GalleryUploadForm(request.POST, request.FILES)
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    
+    if not form.is_valid():
+        errors = form.errors.get('images', [])
+        if is_ajax:
+            return JsonResponse({'errors': list(errors)}, status=400)
+        for error in errors:
+            messages.error(request, error)
+        return redirect('listings:listing_detail', pk=listing.pk)
+    
+    images = add_gallery_images(listing, form.cleaned_data['images'])
+    message = f'{len(images)} photo(s) uploaded. They will appear once processed.'
+    if is_ajax:
+        return JsonResponse({'uploaded': [image.pk for image in images], 'message': message}, status=201)
+    
+    messages.success(request, message)
+    return redirect('listings:listing_detail', pk=listing.pk)
+
 @login_required
 def delete_listing(request, pk):
     """Delete a listing"""
@@ -164,66 +274,90 @@ def delete_listing(request, pk):
     if request.method == 'POST':
         listing.delete()
         messages.success(request, 'Listing deleted successfully!')
-        return redirect('profile')
+        return redirect('listings:profile')
     
     return render(request, 'listings/listing_confirm_delete.html', {'listing': listing})
 
+def flip_favorite(user, listing):
+    """Favorite or unfavorite `listing` for `user`; returns the new state"""
+    # Delete-or-insert in one transaction; the Favorite signals move
+    # favorite_count in the same transaction. Toggles of one listing take
+    # turns on its row lock: post_delete fires even when a concurrent click
+    # already deleted the row, which would count the removal twice.
+    with transaction.atomic():
+        list(Listing.objects.select_for_update().filter(pk=listing.pk).values_list('pk'))
+        deleted, _ = Favorite.objects.filter(user=user, listing=listing).delete()
+        is_favorited = not deleted
+        if is_favorited:
+            try:
+                with transaction.atomic():
+                    Favorite.objects.create(user=user, listing=listing)
+            except IntegrityError:
+                # Inserted outside a toggle (e.g. the admin); favorited either way
+                pass
+    return is_favorited
+
 @login_required
 @require_POST
+@ratelimit('favorite')
 def toggle_favorite(request, pk):
     """Toggle favorite status for a listing"""
     listing = get_object_or_404(Listing, pk=pk, is_active=True)
-    favorite, created = Favorite.objects.get_or_create(user=request.user, listing=listing)
-    
-    if not created:
-        favorite.delete()
-        is_favorited = False
-    else:
-        is_favorited = True
+    is_favorited = flip_favorite(request.user, listing)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        listing.refresh_from_db(fields=['favorite_count'])
         return JsonResponse({
             'is_favorited': is_favorited,
+            'favorite_count': listing.favorite_count,
             'message': 'Added to favorites!' if is_favorited else 'Removed from favorites!'
         })
     
     messages.success(request, 'Added to favorites!' if is_favorited else 'Removed from favorites!')
-    return redirect('listing_detail', pk=listing.pk)
+    return redirect('listings:listing_detail', pk=listing.pk)
 
+@read_from_replica
+@ratelimit('search')
 def search_listings(request):
     """Advanced search view"""
     search_form = SearchForm(request.GET)
-    listings = Listing.objects.filter(is_active=True, availability='available')
-    
-    if search_form.is_valid():
-        location = search_form.cleaned_data.get('location')
-        property_type = search_form.cleaned_data.get('property_type')
-        min_price = search_form.cleaned_data.get('min_price')
-        max_price = search_form.cleaned_data.get('max_price')
-        bedrooms = search_form.cleaned_data.get('bedrooms')
-        
-        if location:
-            listings = listings.filter(location__icontains=location)
-        if property_type:
-            listings = listings.filter(property_type=property_type)
-        if min_price:
-            listings = listings.filter(price__gte=min_price)
-        if max_price:
-            listings = listings.filter(price__lte=max_price)
-        if bedrooms:
-            listings = listings.filter(bedrooms__gte=bedrooms)
-    
-    # Pagination
-    paginator = Paginator(listings, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    context = {
-        'page_obj': page_obj,
-        'search_form': search_form,
-        'total_listings': listings.count(),
-    }
-    return render(request, 'listings/search.html', context)
+    return listing_feed(request, filtered_listings(search_form), search_form, 'listings/search.html')
+
+@login_required
+@require_POST
+def save_search(request):
+    """Save the search in the query string; new matches arrive in a digest email"""
+    search_form = SearchForm(request.GET)
+    params = normalize_params(search_form.cleaned_data) if search_form.is_valid() else {}
+    # The order of the results is not part of what the search matches
+    params.pop('sort', None)
+    if not params:
+        messages.error(request, 'Choose at least one filter before saving a search.')
+        return redirect('listings:search')
+
+    _, created = SavedSearch.objects.get_or_create(user=request.user, params=params, defaults={'name': describe(params)})
+    if created:
+        messages.success(request, 'Search saved. New matching listings will be emailed to you.')
+    else:
+        messages.info(request, 'You have already saved this search.')
+    return redirect(f'{reverse("listings:search")}?{request.GET.urlencode()}')
+
+@login_required
+def saved_searches(request):
+    """The user's saved searches, with links to run them"""
+    searches = [
+        (saved_search, f'{reverse("listings:search")}?{urlencode(saved_search.params, doseq=True)}')
+        for saved_search in request.user.saved_searches.all()
+    ]
+    return render(request, 'listings/saved_searches.html', {'searches': searches})
+
+@login_required
+@require_POST
+def delete_saved_search(request, pk):
+    """Stop matching and emailing a saved search"""
+    get_object_or_404(SavedSearch, pk=pk, user=request.user).delete()
+    messages.success(request, 'Saved search deleted.')
+    return redirect('listings:saved_searches')
 
 def about(request):
     """About page"""
@@ -233,6 +367,11 @@ def contact(request):
     """Contact page"""
     return render(request, 'listings/contact.html')
 
+@staff_member_required
+def metrics(request):
+    """This process's request metrics in the Prometheus text format"""
+    return HttpResponse(registry.exposition(), content_type=PROMETHEUS_CONTENT_TYPE)
+
 # Add this to your listings/views.py temporarily
 def debug_urls(request):
     from django.urls import get_resolver
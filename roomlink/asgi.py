@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'roomlink.settings')
+# Serve the read-heavy listing views natively async (see roomlink/asgi_urls.py)
+os.environ.setdefault('LISTINGS_ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
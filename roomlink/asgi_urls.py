@@ -0,0 +1,19 @@
+"""
+URL configuration for the ASGI entry point.
+
+Same routes as roomlink.urls, with the read-heavy listing views running as
+native async views (see listings.async_urls).
+"""
+from django.contrib import admin
+from django.urls import path, include
+from django.conf import settings
+from django.conf.urls.static import static
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('', include('listings.async_urls')),
+]
+
+# Serve media files during development
+if settings.DEBUG:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)